@@ -1,11 +1,23 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from src.api.v1.api import api_router
 from src.core.config import settings
+from src.db.indexes import index_manager
+from src.services.analytics_buffer import click_buffer
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.ENSURE_INDEXES_ON_STARTUP:
+        await index_manager.ensure()
+    click_buffer.start()
+    yield
+    await click_buffer.stop()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan
 )
 
 if settings.FRONTEND_URLS:
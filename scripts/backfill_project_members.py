@@ -0,0 +1,57 @@
+"""
+Preenche a coleção `project_members` (user_id, project_id, role) a partir do
+dono e do array `members` de cada projeto, removendo linhas que não
+correspondem mais ao projeto. Idempotente; pode ser executado com a API no ar:
+se o projeto mudar (acl_version) enquanto é sincronizado, a sincronização é
+refeita a partir do estado atual, então membros adicionados ou removidos pela
+API durante a execução não são apagados nem recriados por engano.
+
+Depois da primeira execução, ative PROJECT_MEMBERSHIP_LOOKUP=collection.
+
+Uso:
+    python -m scripts.backfill_project_members
+"""
+import asyncio
+from pymongo import DeleteMany, UpdateOne
+from src.db.indexes import index_manager
+from src.db.session import projects, project_members
+
+PROJECTION = {"user_id": 1, "members": 1, "acl_version": 1}
+
+async def sync_project(project: dict) -> int:
+    project_id = str(project["_id"])
+    while True:
+        rows = {project["user_id"]: {"role": "owner"}}
+        for member in project.get("members", []):
+            rows.setdefault(member["user_id"], {"email": member.get("email"), "role": member.get("role", "member")})
+
+        operations = [
+            UpdateOne({"project_id": project_id, "user_id": user_id}, {"$set": fields}, upsert=True)
+            for user_id, fields in rows.items()
+        ]
+        operations.append(DeleteMany({"project_id": project_id, "user_id": {"$nin": list(rows)}}))
+        await project_members.bulk_write(operations, ordered=False)
+
+        # Toda mudança de membros incrementa acl_version antes de mexer em project_members;
+        # se ela não mudou, o que foi escrito corresponde ao projeto atual
+        current = await projects.find_one({"_id": project["_id"]}, PROJECTION)
+        if current is None:
+            await project_members.delete_many({"project_id": project_id})
+            return 0
+        if current.get("acl_version") == project.get("acl_version"):
+            return len(rows)
+        project = current
+
+async def main():
+    await index_manager.ensure()
+
+    synced_projects = 0
+    synced_rows = 0
+    async for project in projects.find({}, PROJECTION):
+        synced_rows += await sync_project(project)
+        synced_projects += 1
+
+    print(f"[BACKFILL] {synced_projects} projetos sincronizados ({synced_rows} vínculos)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
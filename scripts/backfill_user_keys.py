@@ -0,0 +1,30 @@
+"""
+Preenche `email_lower` e `username_lower` nos usuários criados antes do
+cadastro baseado em índices únicos. Usuários cujo email ou username colide
+(sem diferenciar maiúsculas) com outro já normalizado são listados e ficam
+sem o campo, para resolução manual.
+
+Rode uma vez, antes do deploy do cadastro por índices únicos: até ele
+terminar, o cadastro não enxerga os emails dos usuários antigos (que ainda
+entram pelo email exato).
+
+Idempotente; pode ser executado com a API no ar.
+
+Uso:
+    python -m scripts.backfill_user_keys
+"""
+import asyncio
+from src.db.indexes import index_manager
+from src.repositories.user_repository import user_repository
+
+async def main():
+    await index_manager.ensure()
+
+    visited, conflicts = await user_repository.backfill_normalized_keys()
+
+    print(f"[BACKFILL] {visited} usuários normalizados, {len(conflicts)} conflito(s)")
+    for user_id, field, value in conflicts:
+        print(f"[CONFLITO] {user_id}: {field}={value}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
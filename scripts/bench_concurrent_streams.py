@@ -0,0 +1,92 @@
+"""
+Mede o impacto do acesso ao MongoDB no streaming de tokens.
+
+Simula STREAMS respostas em streaming (um token a cada TOKEN_INTERVAL) dentro
+de um único event loop enquanto WORKERS corrotinas leem um chat de exemplo,
+primeiro com o cliente síncrono (como os repositórios faziam antes) e depois
+com o cliente assíncrono usado hoje pelos repositórios. Para cada modo,
+reporta tokens entregues por segundo, atraso do event loop e consultas por
+segundo.
+
+Requer um MongoDB acessível em DATABASE_URL. Usa uma coleção temporária
+(benchmark_streams) que é removida ao final.
+
+Uso:
+    python -m scripts.bench_concurrent_streams [--streams 50] [--workers 20] [--seconds 10]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from src.db.session import db, get_sync_database
+
+COLLECTION = "benchmark_streams"
+TOKEN_INTERVAL = 0.02
+
+async def token_stream(deadline: float, lags: list) -> int:
+    tokens = 0
+    while time.perf_counter() < deadline:
+        expected = time.perf_counter() + TOKEN_INTERVAL
+        await asyncio.sleep(TOKEN_INTERVAL)
+        lags.append(max(0.0, time.perf_counter() - expected))
+        tokens += 1
+    return tokens
+
+async def sync_reader(deadline: float, doc_id) -> int:
+    collection = get_sync_database()[COLLECTION]
+    queries = 0
+    while time.perf_counter() < deadline:
+        collection.find_one({"_id": doc_id})
+        queries += 1
+        await asyncio.sleep(0)
+    return queries
+
+async def async_reader(deadline: float, doc_id) -> int:
+    collection = db[COLLECTION]
+    queries = 0
+    while time.perf_counter() < deadline:
+        await collection.find_one({"_id": doc_id})
+        queries += 1
+    return queries
+
+async def run(mode: str, streams: int, workers: int, seconds: float, doc_id) -> dict:
+    reader = sync_reader if mode == "sync" else async_reader
+    lags = []
+    deadline = time.perf_counter() + seconds
+    stream_tasks = [token_stream(deadline, lags) for _ in range(streams)]
+    reader_tasks = [reader(deadline, doc_id) for _ in range(workers)]
+    results = await asyncio.gather(*stream_tasks, *reader_tasks)
+
+    lags.sort()
+    return {
+        "tokens_per_s": sum(results[:streams]) / seconds,
+        "queries_per_s": sum(results[streams:]) / seconds,
+        "lag_p50_ms": statistics.median(lags) * 1000 if lags else 0.0,
+        "lag_p99_ms": lags[int(len(lags) * 0.99) - 1] * 1000 if lags else 0.0,
+        "lag_max_ms": lags[-1] * 1000 if lags else 0.0,
+    }
+
+async def main(streams: int, workers: int, seconds: float):
+    sync_collection = get_sync_database()[COLLECTION]
+    messages = [{"role": "user", "content": "x" * 500} for _ in range(200)]
+    doc_id = sync_collection.insert_one({"title": "benchmark", "messages": messages}).inserted_id
+
+    ideal = streams / TOKEN_INTERVAL
+    print(f"{streams} streams, {workers} leitores, {seconds:.0f}s (ideal: {ideal:.0f} tokens/s)")
+    try:
+        for mode in ("sync", "async"):
+            r = await run(mode, streams, workers, seconds, doc_id)
+            print(
+                f"{mode:>5}: {r['tokens_per_s']:8.0f} tokens/s | {r['queries_per_s']:8.0f} consultas/s | "
+                f"atraso p50 {r['lag_p50_ms']:.1f} ms, p99 {r['lag_p99_ms']:.1f} ms, máx {r['lag_max_ms']:.1f} ms"
+            )
+    finally:
+        sync_collection.drop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--streams", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.streams, args.workers, args.seconds))
@@ -0,0 +1,105 @@
+"""
+Mede o throughput de cadastro no MongoDB com o fluxo antigo (busca por email,
+busca por username e inserção) e com o atual (uma inserção, duplicados
+barrados pelos índices únicos).
+
+O hash Argon2 fica de fora (a senha já vai com um hash fixo) para isolar o
+custo das idas ao banco. Uma fração --duplicates das tentativas repete um
+email já cadastrado. Para cada modo, reporta cadastros por segundo e latência
+p50/p99.
+
+Requer um MongoDB acessível em DATABASE_URL. Usa uma coleção temporária
+(benchmark_users) que é removida ao final.
+
+Uso:
+    python -m scripts.bench_registration [--users 2000] [--workers 50] [--duplicates 0.1]
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+from src.db.session import db
+from src.repositories.user_repository import normalized_keys
+
+COLLECTION = "benchmark_users"
+PASSWORD_HASH = "$argon2id$v=19$m=65536,t=3,p=4$benchmark"
+
+async def register_precheck(collection, email: str, username: str) -> bool:
+    if await collection.find_one({"email_lower": email.lower()}):
+        return False
+    if await collection.find_one({"username_lower": username.lower()}):
+        return False
+    try:
+        await collection.insert_one({"email": email, "username": username, "senha": PASSWORD_HASH,
+                                     **normalized_keys({"email": email, "username": username})})
+    except DuplicateKeyError:
+        # Corrida entre as buscas e a inserção
+        return False
+    return True
+
+async def register_insert(collection, email: str, username: str) -> bool:
+    try:
+        await collection.insert_one({"email": email, "username": username, "senha": PASSWORD_HASH,
+                                     **normalized_keys({"email": email, "username": username})})
+    except DuplicateKeyError:
+        return False
+    return True
+
+async def run(mode: str, total: int, workers: int, duplicates: float) -> dict:
+    collection = db[COLLECTION]
+    await collection.drop()
+    await collection.create_index([("email_lower", ASCENDING)], unique=True)
+    await collection.create_index([("username_lower", ASCENDING)], unique=True)
+
+    register = register_precheck if mode == "precheck" else register_insert
+    queue = asyncio.Queue()
+    for i in range(total):
+        # Duplicados repetem um email anterior com outra caixa
+        n = random.randrange(i) if i and random.random() < duplicates else i
+        queue.put_nowait((f"User{n}@Example.com", f"user{i}"))
+
+    latencies = []
+    created = 0
+
+    async def worker():
+        nonlocal created
+        while not queue.empty():
+            email, username = queue.get_nowait()
+            started = time.perf_counter()
+            created += await register(collection, email, username)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "per_s": total / elapsed,
+        "created": created,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+async def main(total: int, workers: int, duplicates: float):
+    print(f"{total} cadastros, {workers} concorrentes, {duplicates:.0%} duplicados")
+    try:
+        for mode in ("precheck", "insert"):
+            r = await run(mode, total, workers, duplicates)
+            print(
+                f"{mode:>8}: {r['per_s']:8.0f} cadastros/s | {r['created']} criados | "
+                f"latência p50 {r['p50_ms']:.1f} ms, p99 {r['p99_ms']:.1f} ms"
+            )
+    finally:
+        await db[COLLECTION].drop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=50)
+    parser.add_argument("--duplicates", type=float, default=0.1)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.workers, args.duplicates))
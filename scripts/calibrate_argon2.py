@@ -0,0 +1,86 @@
+"""
+Calibra os parâmetros do Argon2 para a máquina atual.
+
+Segue a recomendação da RFC 9106: usa a maior memória permitida que caiba no
+tempo alvo e então aumenta o time_cost até atingir a latência desejada de
+verificação. Imprime as variáveis para o .env (ou as grava com --env-file).
+Após a troca, os hashes antigos são refeitos no próximo login de cada usuário.
+
+Uso:
+    python -m scripts.calibrate_argon2 [--target-ms 250] [--max-memory-mib 256] [--env-file .env]
+"""
+import argparse
+import statistics
+import time
+from argon2 import PasswordHasher
+from src.core.config import settings
+
+SAMPLE_PASSWORD = "calibration-password"
+
+def measure_ms(time_cost: int, memory_cost: int, parallelism: int, rounds: int) -> float:
+    hasher = PasswordHasher(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+    hashed = hasher.hash(SAMPLE_PASSWORD)
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        hasher.verify(hashed, SAMPLE_PASSWORD)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+def calibrate(target_ms: float, max_memory_kib: int, parallelism: int, rounds: int) -> dict:
+    # Menor memória aceitável: 19 MiB (mínimo recomendado pela OWASP para Argon2id)
+    memory_cost = max_memory_kib
+    while memory_cost > 19 * 1024 and measure_ms(1, memory_cost, parallelism, rounds) > target_ms:
+        memory_cost //= 2
+    memory_cost = max(memory_cost, 19 * 1024)
+
+    time_cost = 1
+    elapsed = measure_ms(time_cost, memory_cost, parallelism, rounds)
+    while elapsed < target_ms:
+        candidate = measure_ms(time_cost + 1, memory_cost, parallelism, rounds)
+        if candidate > target_ms * 1.25:
+            break
+        time_cost += 1
+        elapsed = candidate
+
+    return {
+        "ARGON2_TIME_COST": time_cost,
+        "ARGON2_MEMORY_COST": memory_cost,
+        "ARGON2_PARALLELISM": parallelism,
+        "elapsed_ms": elapsed,
+    }
+
+def write_env(path: str, values: dict):
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        lines = []
+
+    lines = [l for l in lines if l.split("=", 1)[0].strip() not in values]
+    lines += [f"{key}={value}" for key, value in values.items()]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target-ms", type=float, default=250)
+    parser.add_argument("--max-memory-mib", type=int, default=256)
+    parser.add_argument("--parallelism", type=int, default=settings.ARGON2_PARALLELISM)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--env-file")
+    args = parser.parse_args()
+
+    result = calibrate(args.target_ms, args.max_memory_mib * 1024, args.parallelism, args.rounds)
+    elapsed = result.pop("elapsed_ms")
+
+    print(f"# Verificação em ~{elapsed:.0f} ms (alvo: {args.target_ms:.0f} ms)")
+    for key, value in result.items():
+        print(f"{key}={value}")
+
+    if args.env_file:
+        write_env(args.env_file, result)
+        print(f"# Gravado em {args.env_file}")
+
+if __name__ == "__main__":
+    main()
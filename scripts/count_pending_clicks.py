@@ -0,0 +1,34 @@
+"""
+Conta nos contadores e nos buckets do /analytics os cliques gravados que
+ficaram com etapas em `pending`: lotes cujo worker caiu entre a gravação e a
+contagem, ou que chegaram com a contagem pausada pelo rebuild_analytics.
+
+Só pega cliques com mais de --older-than segundos (padrão
+ANALYTICS_PENDING_SWEEP_AFTER_SECONDS), para não disputar com o buffer os
+lotes que ele ainda está contando. Rode periodicamente (cron) com uma única
+instância por vez.
+
+Uso:
+    python -m scripts.count_pending_clicks [--older-than 300]
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta, timezone
+from src.core.config import settings
+from src.repositories.analytics_repository import analytics_repository
+
+async def count_pending(before: datetime) -> int:
+    counted = 0
+    async for click_ids in analytics_repository.iter_pending_ids(before):
+        counted += await analytics_repository.count_clicks(click_ids)
+    return counted
+
+async def main(older_than: int):
+    counted = await count_pending(datetime.now(timezone.utc) - timedelta(seconds=older_than))
+    print(f"[ANALYTICS] {counted} cliques pendentes contados")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--older-than", type=int, default=settings.ANALYTICS_PENDING_SWEEP_AFTER_SECONDS)
+    args = parser.parse_args()
+    asyncio.run(main(args.older_than))
@@ -0,0 +1,36 @@
+"""
+Cria os índices declarados pelos repositórios e, com --explain, roda explain()
+nas consultas representativas de cada um, apontando as que fazem COLLSCAN.
+
+Uso:
+    python -m scripts.manage_indexes
+    python -m scripts.manage_indexes --explain
+"""
+import argparse
+import asyncio
+import sys
+from src.db.indexes import index_manager
+
+async def main(explain: bool) -> int:
+    created = await index_manager.ensure()
+    for collection, names in created.items():
+        print(f"[INDEXES] {collection}: {', '.join(names)}")
+
+    if not explain:
+        return 0
+
+    collscans = 0
+    for entry in await index_manager.explain():
+        status = "COLLSCAN" if entry["collscan"] else "ok"
+        collscans += entry["collscan"]
+        print(f"[EXPLAIN] {status:8} {entry['repository']}.{entry['collection']} "
+              f"{entry['query']} sort={entry['sort']} -> {' > '.join(entry['stages'])}")
+
+    print(f"[EXPLAIN] {collscans} consulta(s) sem índice")
+    return 1 if collscans else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cria os índices e audita os planos das consultas")
+    parser.add_argument("--explain", action="store_true", help="Relata consultas que fazem COLLSCAN")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.explain)))
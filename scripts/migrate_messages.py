@@ -0,0 +1,31 @@
+"""
+Move as mensagens embutidas no array `messages` de cada chat para a coleção
+`messages`, um documento por mensagem indexado por (chat_id, seq).
+
+Pode ser executado com a API no ar e reexecutado quantas vezes for preciso:
+chats que recebem mensagens durante a cópia são pulados e migrados na
+próxima execução (ou no próximo envio, com CHAT_MESSAGE_STORAGE=collection).
+
+Uso:
+    python -m scripts.migrate_messages
+"""
+import asyncio
+from src.db.indexes import index_manager
+from src.repositories.chat_repository import chat_repository
+
+async def main():
+    await index_manager.ensure()
+
+    chat_ids = await chat_repository.list_chats_with_embedded_messages()
+    migrated_chats = 0
+    migrated_messages = 0
+    for chat_id in chat_ids:
+        count = await chat_repository.migrate_embedded_messages(chat_id)
+        if count is not None:
+            migrated_chats += 1
+            migrated_messages += count
+
+    print(f"[MIGRATION] {migrated_chats}/{len(chat_ids)} chats migrados ({migrated_messages} mensagens)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,55 @@
+"""
+Move os refresh tokens do array `refreshToken` de cada usuário para a coleção
+`sessions` (um documento por token, indexado pelo hash e com TTL em
+expires_at) e remove o array. Tokens inválidos ou vencidos são descartados.
+
+A API já migra cada token legado no primeiro refresh ou logout que o usa;
+o script só adianta a migração dos demais e remove os arrays. Idempotente;
+pode ser executado com a API no ar.
+
+Uso:
+    python -m scripts.migrate_sessions
+"""
+import asyncio
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+from src.core.security import decode_token
+from src.db.indexes import index_manager
+from src.db.session import sessions, users
+from src.repositories.session_repository import hash_token
+
+async def main():
+    await index_manager.ensure()
+
+    migrated_users = 0
+    migrated_tokens = 0
+    async for user in users.find({"refreshToken": {"$exists": True}}, {"refreshToken": 1}):
+        user_id = str(user["_id"])
+        operations = []
+        for token in set(user.get("refreshToken") or []):
+            payload = decode_token(token)
+            if not payload or payload.get("user_id") != user_id:
+                continue
+            operations.append(UpdateOne(
+                {"token_hash": hash_token(token)},
+                {"$setOnInsert": {
+                    "user_id": user_id,
+                    "device": {"migrated": True},
+                    "created_at": datetime.now(timezone.utc),
+                    "last_used_at": None,
+                    "expires_at": datetime.fromtimestamp(payload["exp"], timezone.utc)
+                }},
+                upsert=True
+            ))
+
+        if operations:
+            await sessions.bulk_write(operations, ordered=False)
+        await users.update_one({"_id": user["_id"]}, {"$unset": {"refreshToken": ""}})
+
+        migrated_users += 1
+        migrated_tokens += len(operations)
+
+    print(f"[MIGRATION] {migrated_users} usuários migrados ({migrated_tokens} sessões válidas)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,143 @@
+"""
+Recalcula os contadores de analytics (analytics_counters), a lista de emails
+por elemento (analytics_emails) e os buckets de minuto/hora/dia do
+/analytics/timeseries (analytics_rollups), com seus sketches de emails
+distintos, a partir dos cliques brutos da coleção analytics. Use no primeiro
+deploy dos contadores ou para corrigi-los depois de uma falha na gravação.
+
+Os contadores são substituídos pelo total calculado, então o script pausa a
+contagem do buffer enquanto roda (a pausa fica no banco e vale para todas as
+instâncias da API): os cliques continuam sendo gravados, mas ficam em
+`pending` e não entram no recálculo. No fim, os pendentes são contados e a
+contagem volta; os que chegarem nesse meio-tempo ficam para
+scripts.count_pending_clicks.
+
+Uso:
+    python -m scripts.rebuild_analytics
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from src.core.config import settings
+from src.db.indexes import index_manager
+from src.db.session import analytics
+from src.repositories.analytics_repository import GRANULARITIES, analytics_repository
+from scripts.count_pending_clicks import count_pending
+
+SKETCH_BATCH_SIZE = 1000
+# Tempo para os lotes que leram a contagem ainda ativa terminarem seus $inc
+PAUSE_GRACE_SECONDS = 30
+
+# Cliques ainda pendentes são contados pelo count_pending depois do recálculo
+COUNTED = {"$match": {"pending": {"$exists": False}}}
+
+EMAILS_PIPELINE = [
+    COUNTED,
+    {"$match": {"email": {"$gt": ""}}},
+    {"$group": {
+        "_id": {"variant": "$variant", "elementId": "$elementId", "email": "$email"},
+        "first_seen": {"$min": "$timestamp"}
+    }},
+    {"$project": {"_id": 0, "variant": "$_id.variant", "elementId": "$_id.elementId", "email": "$_id.email", "first_seen": 1}},
+    {"$merge": {
+        "into": "analytics_emails",
+        "on": ["variant", "elementId", "email"],
+        "whenMatched": "keepExisting",
+        "whenNotMatched": "insert"
+    }}
+]
+
+# Agrupa primeiro por email para contar os distintos sem acumular listas em memória
+COUNTERS_PIPELINE = [
+    COUNTED,
+    {"$group": {
+        "_id": {"variant": "$variant", "elementId": "$elementId", "email": "$email"},
+        "count": {"$sum": 1},
+        "last_click_at": {"$max": "$timestamp"}
+    }},
+    {"$group": {
+        "_id": {"variant": "$_id.variant", "elementId": "$_id.elementId"},
+        "count": {"$sum": "$count"},
+        "unique_emails": {"$sum": {"$cond": [{"$gt": ["$_id.email", ""]}, 1, 0]}},
+        "last_click_at": {"$max": "$last_click_at"}
+    }},
+    {"$project": {"_id": 0, "variant": "$_id.variant", "elementId": "$_id.elementId", "count": 1, "unique_emails": 1, "last_click_at": 1}},
+    {"$merge": {
+        "into": "analytics_counters",
+        "on": ["variant", "elementId"],
+        "whenMatched": [{"$set": {
+            "count": "$$new.count",
+            "unique_emails": "$$new.unique_emails",
+            "last_click_at": "$$new.last_click_at"
+        }}],
+        "whenNotMatched": "insert"
+    }}
+]
+
+def rollups_pipeline(granularity: str) -> list:
+    # $dateTrunc requer MongoDB 5.0+
+    match = {"timestamp": {"$type": "date"}}
+    fields = {"count": "$$new.count"}
+    project = {"_id": 0, "granularity": granularity, "variant": "$_id.variant", "elementId": "$_id.elementId", "bucket": "$_id.bucket", "count": 1}
+
+    ttl_days = settings.ANALYTICS_MINUTE_ROLLUP_TTL_DAYS
+    if granularity == "minute" and ttl_days > 0:
+        # Buckets que o TTL já apagaria não são recriados
+        match["timestamp"]["$gte"] = datetime.now(timezone.utc) - timedelta(days=ttl_days)
+        project["expires_at"] = {"$dateAdd": {"startDate": "$_id.bucket", "unit": "day", "amount": ttl_days}}
+        fields["expires_at"] = "$$new.expires_at"
+
+    return [
+        COUNTED,
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "variant": "$variant",
+                "elementId": "$elementId",
+                "bucket": {"$dateTrunc": {"date": "$timestamp", "unit": granularity}}
+            },
+            "count": {"$sum": 1}
+        }},
+        {"$project": project},
+        {"$merge": {
+            "into": "analytics_rollups",
+            "on": ["granularity", "variant", "elementId", "bucket"],
+            "whenMatched": [{"$set": fields}],
+            "whenNotMatched": "insert"
+        }}
+    ]
+
+async def rebuild():
+    await (await analytics.aggregate(EMAILS_PIPELINE, allowDiskUse=True)).to_list()
+    await (await analytics.aggregate(COUNTERS_PIPELINE, allowDiskUse=True)).to_list()
+    for granularity in GRANULARITIES:
+        await (await analytics.aggregate(rollups_pipeline(granularity), allowDiskUse=True)).to_list()
+
+    # Os HyperLogLog dos buckets usam blake2b, então são refeitos aqui e não no pipeline.
+    # O $max dos registradores torna a repetição inofensiva.
+    batch = []
+    query = {"email": {"$gt": ""}, "timestamp": {"$type": "date"}}
+    async for click in analytics.find(query, {"_id": 0, "variant": 1, "elementId": 1, "email": 1, "timestamp": 1}, batch_size=SKETCH_BATCH_SIZE):
+        batch.append(click)
+        if len(batch) == SKETCH_BATCH_SIZE:
+            await analytics_repository.increment_rollups(batch, counts=False)
+            batch = []
+    if batch:
+        await analytics_repository.increment_rollups(batch, counts=False)
+
+async def main():
+    # O $merge exige os índices únicos nos campos de "on"
+    await index_manager.ensure()
+
+    await analytics_repository.set_counting_paused(True)
+    try:
+        await asyncio.sleep(PAUSE_GRACE_SECONDS)
+        await rebuild()
+        # Ainda com a contagem pausada, ninguém mais conta estes cliques
+        pending = await count_pending(datetime.now(timezone.utc))
+    finally:
+        await analytics_repository.set_counting_paused(False)
+
+    print(f"[REBUILD] analytics_counters, analytics_emails e analytics_rollups recalculados a partir de analytics ({pending} cliques pendentes contados)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -3,6 +3,8 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from src.services.auth_service import auth_service
 from src.repositories.user_repository import user_repository
+from src.repositories.loaders import UserLoader
+from src.repositories.identity_map import identity_map_scope
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/auth/login")
 
@@ -17,7 +19,7 @@ def get_current_user_id(token: str = Depends(oauth2_scheme)) -> str:
     return user_id
 
 async def get_current_user(user_id: str = Depends(get_current_user_id)) -> dict:
-    user = user_repository.get_by_id(user_id)
+    user = await user_repository.get_profile(user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -25,3 +27,11 @@ async def get_current_user(user_id: str = Depends(get_current_user_id)) -> dict:
         )
     user["id"] = str(user.pop("_id"))
     return user
+
+def get_user_loader() -> UserLoader:
+    return UserLoader()
+
+async def use_identity_map():
+    # Dependência assíncrona: o ContextVar precisa ser definido no mesmo contexto do endpoint
+    with identity_map_scope():
+        yield
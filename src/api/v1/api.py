@@ -1,9 +1,12 @@
-from fastapi import APIRouter
-from src.api.v1.endpoints import auth, conversation, analytics, project
+from fastapi import APIRouter, Depends
+from src.api.deps import use_identity_map
+from src.api.v1.endpoints import auth, conversation, analytics, project, metrics
 
-api_router = APIRouter()
+# Cada requisição recebe o seu próprio mapa de identidade (leituras repetidas por id saem da memória)
+api_router = APIRouter(dependencies=[Depends(use_identity_map)])
 
 api_router.include_router(auth.router, prefix="/auth", tags=["auth"])
 api_router.include_router(conversation.router, prefix="/conversation", tags=["conversation"])
 api_router.include_router(analytics.router, prefix="/analytics", tags=["analytics"])
 api_router.include_router(project.router, prefix="/project", tags=["projects"])
+api_router.include_router(metrics.router, prefix="/metrics", tags=["metrics"])
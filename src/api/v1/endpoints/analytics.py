@@ -1,36 +1,147 @@
-from fastapi import APIRouter, status, Depends
+import csv
+import io
+import json
+from typing import AsyncIterator, List, Literal, Optional
+from fastapi import APIRouter, HTTPException, Query, status, Depends
+from fastapi.responses import StreamingResponse
 from src.schemas.analytics import ClickTrack
-from src.repositories.analytics_repository import analytics_repository
+from src.repositories.analytics_repository import GRANULARITIES, analytics_repository, as_naive
+from src.core.config import settings
 from src.api.deps import get_current_user_id
-from datetime import datetime
+from src.services.analytics_buffer import click_buffer
+from datetime import datetime, timezone
 
 router = APIRouter()
 
+EMAIL_PAGE_DEFAULT = 100
+EMAIL_PAGE_MAX = 1000
+EXPORT_BATCH_SIZE = 1000
+CSV_FIELDS = ["timestamp", "variant", "elementId", "email"]
+
+def serialize_click(click: dict) -> dict:
+    return {key: value.isoformat() if isinstance(value, datetime) else value for key, value in click.items()}
+
+async def export_json(batches: AsyncIterator[List[dict]]) -> AsyncIterator[str]:
+    yield '{"data": ['
+    first = True
+    async for batch in batches:
+        chunk = ",".join(json.dumps(serialize_click(click)) for click in batch)
+        yield chunk if first else "," + chunk
+        first = False
+    yield "]}"
+
+async def export_ndjson(batches: AsyncIterator[List[dict]]) -> AsyncIterator[str]:
+    async for batch in batches:
+        yield "".join(json.dumps(serialize_click(click)) + "\n" for click in batch)
+
+async def export_csv(batches: AsyncIterator[List[dict]]) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    yield buffer.getvalue()
+    async for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(serialize_click(click) for click in batch)
+        yield buffer.getvalue()
+
 @router.post("/track-click", status_code=status.HTTP_201_CREATED)
 async def track_click(payload: ClickTrack):
     """
     Endpoint público para rastrear cliques e interesses.
     Não requer autenticação para permitir o rastreio de visitantes.
+    O clique é enfileirado e gravado em lote logo em seguida.
     """
-    payload.timestamp = datetime.now()
-    data = payload.model_dump()
-    analytics_repository.save_click(data)
-    
-    email_info = f" (Email: {payload.email})" if payload.email else ""
-    print(f"[ANALYTICS] Salvo no banco: {payload.elementId} (Variante: {payload.variant}){email_info}")
-    
+    # Em UTC, como os buckets e filtros de /timeseries e /raw; a hora local do servidor não entra
+    payload.timestamp = datetime.now(timezone.utc)
+    if not click_buffer.offer(payload.model_dump()):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Muitos cliques pendentes, tente novamente em instantes.",
+            headers={"Retry-After": "1"}
+        )
+
     return {"status": "tracked"}
 
 @router.get("/stats")
 async def get_stats(current_user_id: str = Depends(get_current_user_id)):
     """
-    Retorna as estatísticas agregadas. Requer autenticação.
+    Retorna cliques e emails distintos por variante e elemento. A lista de
+    emails fica em /analytics/emails. Requer autenticação.
+    """
+    return await analytics_repository.get_stats()
+
+@router.get("/emails")
+async def list_emails(
+    variant: str,
+    elementId: str,
+    limit: int = Query(EMAIL_PAGE_DEFAULT, ge=1, le=EMAIL_PAGE_MAX),
+    cursor: Optional[str] = None,
+    current_user_id: str = Depends(get_current_user_id)
+):
+    """
+    Emails distintos de um elemento, em ordem alfabética. Envie `next_cursor`
+    como `cursor` para a próxima página (None na última). Requer autenticação.
     """
-    return analytics_repository.get_stats()
+    emails, next_cursor = await analytics_repository.list_emails(variant, elementId, limit, cursor)
+    return {"emails": emails, "next_cursor": next_cursor}
+
+@router.get("/timeseries")
+async def get_timeseries(
+    start: datetime = Query(..., alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    granularity: Literal["minute", "hour", "day"] = "hour",
+    variant: Optional[str] = None,
+    elementId: Optional[str] = None,
+    current_user_id: str = Depends(get_current_user_id)
+):
+    """
+    Cliques por variante e elemento em buckets de minuto, hora ou dia, lidos
+    dos rollups mantidos na gravação. `to` padrão é agora. Datas sem fuso são
+    tratadas como UTC. Requer autenticação.
+    """
+    start, end = as_naive(start), as_naive(end or datetime.now(timezone.utc))
+    if end <= start:
+        raise HTTPException(status_code=400, detail="O fim do intervalo deve ser posterior ao início")
+    if (end - start) / GRANULARITIES[granularity] > settings.ANALYTICS_TIMESERIES_MAX_BUCKETS:
+        raise HTTPException(status_code=400, detail="Intervalo grande demais para essa granularidade")
+
+    series = await analytics_repository.get_timeseries(granularity, start, end, variant, elementId)
+    return {"granularity": granularity, "from": start, "to": end, "series": series}
 
 @router.get("/raw")
-async def get_raw_data(current_user_id: str = Depends(get_current_user_id)):
+async def get_raw_data(
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    variant: Optional[str] = None,
+    elementId: Optional[str] = None,
+    format: Literal["json", "ndjson", "csv"] = "json",
+    current_user_id: str = Depends(get_current_user_id)
+):
     """
-    Retorna todos os registros brutos. Requer autenticação.
+    Exporta os cliques brutos, opcionalmente filtrados por intervalo
+    [from, to), variante e elemento. A resposta é enviada em streaming:
+    `json` mantém o formato `{"data": [...]}`, `ndjson` envia um clique por
+    linha e `csv` usa as colunas de CSV_FIELDS. Requer autenticação.
     """
-    return {"data": analytics_repository.get_all_clicks()}
+    batches = analytics_repository.iter_clicks(
+        as_naive(start) if start else None,
+        as_naive(end) if end else None,
+        variant,
+        elementId,
+        batch_size=EXPORT_BATCH_SIZE
+    )
+
+    if format == "ndjson":
+        return StreamingResponse(
+            export_ndjson(batches),
+            media_type="application/x-ndjson",
+            headers={"Content-Disposition": 'attachment; filename="analytics.ndjson"'}
+        )
+    if format == "csv":
+        return StreamingResponse(
+            export_csv(batches),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="analytics.csv"'}
+        )
+    return StreamingResponse(export_json(batches), media_type="application/json")
@@ -1,6 +1,6 @@
 from datetime import timedelta
 from typing import Annotated, Optional
-from fastapi import APIRouter, Depends, HTTPException, Response, Cookie, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Cookie, status
 from src.schemas.auth import AuthRequest, RegisterRequest, Token
 from src.services.auth_service import auth_service
 from src.api.deps import get_current_user_id
@@ -9,8 +9,12 @@ from src.core.config import settings
 router = APIRouter()
 
 @router.post("/login", response_model=Token)
-async def login(payload: AuthRequest, response: Response):
-    result = auth_service.login(payload.email, payload.password)
+async def login(payload: AuthRequest, request: Request, response: Response):
+    device = {
+        "user_agent": request.headers.get("user-agent"),
+        "ip": request.client.host if request.client else None
+    }
+    result = await auth_service.login(payload.email, payload.password, device)
     
     if result["token"] is None:
         raise HTTPException(
@@ -37,7 +41,7 @@ async def refresh_token(refresh_token: Annotated[Optional[str], Cookie()] = None
             detail="Refresh token ausente."
         )
     
-    new_token = auth_service.refresh_access_token(refresh_token)
+    new_token = await auth_service.refresh_access_token(refresh_token)
     if new_token is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, 
@@ -53,11 +57,23 @@ async def logout(
     refresh_token: Annotated[Optional[str], Cookie()] = None
 ):
     if refresh_token:
-        auth_service.logout(user_id, refresh_token)
+        await auth_service.logout(user_id, refresh_token)
     
     response.delete_cookie(key="refresh_token", samesite="none", secure=True)
     return {"detail": "Logout bem-sucedido"}
 
+@router.get("/sessions")
+async def list_sessions(user_id: str = Depends(get_current_user_id)):
+    """Sessões ativas do usuário (dispositivo, criação e último uso)."""
+    return await auth_service.list_sessions(user_id)
+
+@router.delete("/sessions/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_session(session_id: str, user_id: str = Depends(get_current_user_id)):
+    """Encerra uma sessão; o refresh token dela deixa de valer imediatamente."""
+    if not await auth_service.revoke_session(user_id, session_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Sessão não encontrada.")
+    return None
+
 @router.post("/register", status_code=status.HTTP_201_CREATED)
 async def register(payload: RegisterRequest):
     if not settings.ALLOW_REGISTRATION:
@@ -65,7 +81,7 @@ async def register(payload: RegisterRequest):
             status_code=status.HTTP_403_FORBIDDEN, 
             detail="O cadastro de novos usuários está temporariamente desativado."
         )
-    result = auth_service.register_user(payload.email, payload.password, payload.username)
+    result = await auth_service.register_user(payload.email, payload.password, payload.username)
     if result["success"]:
         return {"detail": result["message"]}
     else:
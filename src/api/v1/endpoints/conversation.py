@@ -1,7 +1,8 @@
 import json
+import asyncio
 import logging
-from typing import Optional
-from fastapi import APIRouter, HTTPException, Depends, status
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Depends, Query, status
 from fastapi.responses import StreamingResponse
 from src.schemas.chat import (
     ConversationUpdate, 
@@ -10,26 +11,82 @@ from src.schemas.chat import (
 )
 from src.repositories.chat_repository import chat_repository
 from src.services.ai_service import ai_service
+from src.services.context_service import context_service, truncate_tokens
+from src.services.authorization_service import authorization_service
+from src.core.config import settings
 from src.api.deps import get_current_user_id
 from src.models.ai import AIModel, AIPersona
+from src.models.permissions import ProjectPermission
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+HISTORY_PAGE_MAX = 500
+CONVERSATION_PAGE_DEFAULT = 20
+CONVERSATION_PAGE_MAX = 100
+
+# Referências às compactações em andamento, para que não sejam coletadas antes do fim
+_background_tasks = set()
+# Chats com compactação em andamento neste processo
+_compacting = set()
+
+async def compact_conversation(
+    chat_id: str, 
+    summary: Optional[str], 
+    summary_seq: int, 
+    messages: List[dict]
+):
+    to_fold = messages[:-settings.SUMMARY_KEEP_RECENT] if settings.SUMMARY_KEEP_RECENT else messages
+    budget = context_service.budget(AIModel.GEMMA_4)
+
+    # Em partes que cabem no orçamento: summary_seq só avança pelas mensagens que o modelo leu
+    while to_fold:
+        chunk = context_service.transcript_chunk(to_fold, budget)
+        # Só corta algo quando uma única mensagem passa do orçamento sozinha
+        transcript = truncate_tokens(context_service.format_transcript(chunk), budget)
+        new_summary = await ai_service.generate_summary(summary, transcript)
+        if not new_summary:
+            return
+        if not await chat_repository.update_summary(chat_id, new_summary, summary_seq + len(chunk)):
+            return
+        summary, summary_seq = new_summary, summary_seq + len(chunk)
+        to_fold = to_fold[len(chunk):]
+
+async def _run_compaction(chat_id: str, *args):
+    try:
+        await compact_conversation(chat_id, *args)
+    finally:
+        _compacting.discard(chat_id)
+
+def schedule_compaction(chat_id: str, *args):
+    # Uma compactação por chat; os turnos que chegarem durante ela ficam para a próxima
+    if chat_id in _compacting:
+        return
+    _compacting.add(chat_id)
+    task = asyncio.create_task(_run_compaction(chat_id, *args))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
 async def generate_response_and_store(
     chat_id: str, 
     prompt: str, 
     user_id: str,
     model: AIModel, 
-    persona: AIPersona
+    persona: AIPersona,
+    state: Optional[dict] = None
 ):
     try:
         user_message = {"role": "user", "content": prompt}
-        history = chat_repository.get_history(chat_id) or []
+        # Resumo e só as mensagens ainda fora dele; o endpoint já passa o que leu para a permissão
+        if state is None:
+            state = await chat_repository.get_context(chat_id) or {"summary": None, "summary_seq": 0, "messages": []}
+        summary, summary_seq, history = state["summary"], state["summary_seq"], state["messages"]
 
-        chat_repository.add_message(chat_id, user_message)
+        if not await chat_repository.add_message(chat_id, user_message):
+            raise RuntimeError("Conversa não encontrada; a mensagem não foi salva")
 
         full_history = history + [user_message]
+        context = context_service.build(full_history, model, persona.value, summary)
 
         assistant_response = {
             "role": "assistant",
@@ -37,19 +94,24 @@ async def generate_response_and_store(
             "reasoning": "",
         }
 
-        async for chunk in ai_service.generate_response_stream(full_history, model, persona):
+        async for chunk in ai_service.generate_response_stream(context, model, persona):
             assistant_response["content"] += chunk.get("content", "")
             assistant_response["reasoning"] += chunk.get("reasoning", "")
             yield json.dumps(chunk) + "\n"
 
         if assistant_response["content"] or assistant_response["reasoning"]:
-            chat_repository.add_message(chat_id, assistant_response)
+            if not await chat_repository.add_message(chat_id, assistant_response):
+                raise RuntimeError("Conversa não encontrada; a resposta não foi salva")
+
+            unsummarized = full_history + [assistant_response]
+            if settings.SUMMARY_TRIGGER_MESSAGES and len(unsummarized) > settings.SUMMARY_TRIGGER_MESSAGES:
+                schedule_compaction(chat_id, summary, summary_seq, unsummarized)
             
-            if len(history) == 0:
+            if len(history) == 0 and not summary_seq:
                 new_description = await ai_service.generate_description(
                     prompt, assistant_response["content"]
                 )
-                chat_repository.update_description(chat_id, new_description)
+                await chat_repository.update_description(chat_id, new_description)
                 yield json.dumps({"description": new_description}) + "\n"
             
     except Exception as e:
@@ -58,26 +120,21 @@ async def generate_response_and_store(
         yield json.dumps(error_msg) + "\n"
 
 async def check_chat_permission(chat_id: str, user_id: str, permission: str):
-    chat = chat_repository.get_by_id(chat_id)
+    chat = await chat_repository.get_metadata(chat_id)
     if not chat:
         raise HTTPException(status_code=404, detail="Conversa não encontrada")
-    
+    return await authorize_chat(chat, user_id, permission)
+
+async def authorize_chat(chat: dict, user_id: str, permission: str):
     if chat.get("project_id"):
-        from src.repositories.project_repository import project_repository
-        project = project_repository.get_by_id(chat["project_id"])
-        if not project:
+        granted = await authorization_service.permissions(chat["project_id"], user_id)
+        if granted is None:
              raise HTTPException(status_code=404, detail="Projeto não encontrado")
         
-        is_owner = project["user_id"] == user_id
-        member = next((m for m in project.get("members", []) if m["user_id"] == user_id), None)
-        
-        if not is_owner and not member:
+        if not granted:
             raise HTTPException(status_code=403, detail="Sem acesso a este projeto")
-        
-        if is_owner or member["role"] == "admin":
-            return chat
             
-        if not member.get("permissions", {}).get(permission, False):
+        if ProjectPermission[permission.upper()] not in granted:
             raise HTTPException(status_code=403, detail=f"Você não tem permissão para: {permission}")
     else:
         if chat["user_id"] != user_id:
@@ -88,11 +145,40 @@ async def check_chat_permission(chat_id: str, user_id: str, permission: str):
 @router.get("/history/{conversation_id}")
 async def get_conversation_history(
     conversation_id: str, 
+    before: Optional[int] = Query(None, ge=0),
+    after: Optional[int] = Query(None, ge=-1),
+    limit: Optional[int] = Query(None, ge=1, le=HISTORY_PAGE_MAX),
     user_id: str = Depends(get_current_user_id)
 ):
+    """
+    Sem parâmetros, retorna o histórico completo (lista de mensagens).
+
+    Com `before`, `after` ou `limit`, retorna uma página `{"messages", "has_more"}`
+    em que cada mensagem traz o seu `seq`:
+    - `limit`: as últimas mensagens da conversa;
+    - `before=<seq>`: página anterior, mensagens mais antigas que o seq informado;
+    - `after=<seq>`: sincronização incremental, apenas mensagens novas após o seq
+      que o cliente já possui (`after=-1` desde o início).
+
+    `has_more` indica se existem mais mensagens na direção da paginação.
+    """
     await check_chat_permission(conversation_id, user_id, "read")
-    history = chat_repository.get_history(conversation_id)
-    return history
+
+    if before is None and after is None and limit is None:
+        return await chat_repository.get_history(conversation_id)
+
+    page = await chat_repository.get_history(
+        conversation_id, 
+        after=after, 
+        before=before, 
+        limit=limit + 1 if limit else None
+    ) or []
+
+    has_more = bool(limit) and len(page) > limit
+    if has_more:
+        page = page[1:] if after is None else page[:-1]
+
+    return {"messages": page, "has_more": has_more}
 
 @router.get("/models")
 async def list_models():
@@ -103,6 +189,7 @@ async def get_conversation(
     conversation_id: str, 
     user_id: str = Depends(get_current_user_id)
 ):
+    """Metadados da conversa; as mensagens ficam em /history/{conversation_id}."""
     return await check_chat_permission(conversation_id, user_id, "read")
 
 @router.delete("/{conversation_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -110,21 +197,18 @@ async def delete_conversation(
     conversation_id: str, 
     user_id: str = Depends(get_current_user_id)
 ):
-    chat = chat_repository.get_by_id(conversation_id)
+    chat = await chat_repository.get_metadata(conversation_id)
     if not chat:
         raise HTTPException(status_code=404, detail="Conversa não encontrada")
     
     can_delete = chat["user_id"] == user_id
-    if chat.get("project_id"):
-        from src.repositories.project_repository import project_repository
-        project = project_repository.get_by_id(chat["project_id"])
-        if project and (project["user_id"] == user_id or any(m["user_id"] == user_id and m["role"] == "admin" for m in project.get("members", []))):
-            can_delete = True
+    if not can_delete and chat.get("project_id"):
+        can_delete = await authorization_service.authorize(chat["project_id"], user_id, ProjectPermission.DELETE_CHATS)
             
     if not can_delete:
         raise HTTPException(status_code=403, detail="Sem permissão para deletar")
         
-    chat_repository.delete(conversation_id)
+    await chat_repository.delete(conversation_id)
     return None
 
 @router.patch("/{conversation_id}")
@@ -134,7 +218,7 @@ async def update_conversation_title(
     user_id: str = Depends(get_current_user_id)
 ):
     await check_chat_permission(conversation_id, user_id, "read")
-    success = chat_repository.update_title(conversation_id, payload.title)
+    success = await chat_repository.update_title(conversation_id, payload.title)
     return {"detail": "Título atualizado com sucesso"}
 
 @router.post("/{conversation_id}/message")
@@ -143,7 +227,11 @@ async def send_message(
     payload: MessageRequest, 
     user_id: str = Depends(get_current_user_id)
 ):
-    await check_chat_permission(conversation_id, user_id, "send_messages")
+    # Uma leitura do chat serve a permissão, o resumo e o histórico
+    state = await chat_repository.get_context(conversation_id)
+    if not state:
+        raise HTTPException(status_code=404, detail="Conversa não encontrada")
+    await authorize_chat(state["chat"], user_id, "send_messages")
 
     return StreamingResponse(
         generate_response_and_store(
@@ -151,7 +239,8 @@ async def send_message(
             payload.user_input, 
             user_id,
             model=payload.model or AIModel.GEMINI_3_FLASH, 
-            persona=payload.persona or AIPersona.ROTEIRISTA
+            persona=payload.persona or AIPersona.ROTEIRISTA,
+            state=state
         ), 
         media_type="text/event-stream",
         headers={
@@ -167,18 +256,14 @@ async def create_conversation(
     user_id: str = Depends(get_current_user_id)
 ):
     if payload.project_id:
-        from src.repositories.project_repository import project_repository
-        project = project_repository.get_by_id(payload.project_id)
-        if not project:
+        granted = await authorization_service.permissions(payload.project_id, user_id)
+        if granted is None:
             raise HTTPException(status_code=404, detail="Projeto não encontrado")
             
-        is_owner = project["user_id"] == user_id
-        member = next((m for m in project.get("members", []) if m["user_id"] == user_id), None)
-        
-        if not is_owner and (not member or (member["role"] == "member" and not member["permissions"].get("create_chats"))):
+        if ProjectPermission.CREATE_CHATS not in granted:
             raise HTTPException(status_code=403, detail="Sem permissão para criar chats neste projeto")
 
-    return chat_repository.create(
+    return await chat_repository.create(
         title=payload.title, 
         description=payload.description, 
         user_id=user_id,
@@ -188,18 +273,37 @@ async def create_conversation(
 @router.get("/")
 async def list_conversations(
     project_id: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=CONVERSATION_PAGE_MAX),
+    cursor: Optional[str] = None,
+    include_count: bool = False,
     user_id: str = Depends(get_current_user_id)
 ):
+    """
+    Conversas do usuário (ou do projeto), da atividade mais recente para a mais antiga.
+
+    Sem `limit`/`cursor`, retorna a lista completa. Com eles, retorna uma página
+    `{"conversations", "next_cursor"}`; envie `next_cursor` como `cursor` para a
+    próxima página (None na última). `include_count=true` adiciona `total`.
+    """
     if project_id:
-        from src.repositories.project_repository import project_repository
-        project = project_repository.get_by_id(project_id)
-        if not project:
+        granted = await authorization_service.permissions(project_id, user_id)
+        if granted is None:
             raise HTTPException(status_code=404, detail="Projeto não encontrado")
         
-        is_owner = project["user_id"] == user_id
-        is_member = any(m["user_id"] == user_id for m in project.get("members", []))
-        
-        if not is_owner and not is_member:
+        if not granted:
              raise HTTPException(status_code=403, detail="Sem acesso ao projeto")
 
-    return chat_repository.list_by_user(user_id, project_id)
+    if limit is None and cursor is None:
+        return await chat_repository.list_by_user(user_id, project_id)
+
+    try:
+        conversations, next_cursor = await chat_repository.list_page(
+            user_id, project_id, limit=limit or CONVERSATION_PAGE_DEFAULT, cursor=cursor
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+    page = {"conversations": conversations, "next_cursor": next_cursor}
+    if include_count:
+        page["total"] = await chat_repository.count_by_user(user_id, project_id)
+    return page
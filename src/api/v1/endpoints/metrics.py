@@ -0,0 +1,21 @@
+from fastapi import APIRouter, Depends
+from src.api.deps import get_current_user_id
+from src.core.security import hash_pool, token_cache
+from src.repositories.user_repository import user_cache
+from src.services.analytics_buffer import click_buffer
+from src.services.authorization_service import acl_cache
+
+router = APIRouter()
+
+@router.get("/")
+async def get_metrics(current_user_id: str = Depends(get_current_user_id)):
+    """
+    Retorna métricas internas do processo (filas, caches e buffers). Requer autenticação.
+    """
+    return {
+        "password_hashing": hash_pool.stats(),
+        "token_cache": token_cache.stats(),
+        "user_cache": user_cache.stats(),
+        "acl_cache": acl_cache.stats(),
+        "analytics_buffer": click_buffer.stats()
+    }
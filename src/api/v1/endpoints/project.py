@@ -1,22 +1,42 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Query, status
+from typing import List, Optional
 from src.schemas.project import (
     ProjectCreate, ProjectResponse, ProjectUpdate, 
     MemberAddRequest, MemberUpdateRequest, TransferOwnershipRequest,
-    ProjectPermissions
+    ProjectPermissions, BootstrapResponse
 )
 from src.repositories.project_repository import project_repository
 from src.repositories.user_repository import user_repository
-from src.api.deps import get_current_user_id, get_current_user
+from src.repositories.chat_repository import chat_repository
+from src.repositories.loaders import UserLoader
+from src.models.permissions import ProjectPermission
+from src.services.authorization_service import authorization_service
+from src.api.deps import get_current_user_id, get_current_user, get_user_loader
 
 router = APIRouter()
 
+async def enrich_with_users(projects: List[dict], loader: UserLoader):
+    # Donos e membros de todos os projetos são resolvidos em uma única consulta
+    user_ids = {p["user_id"] for p in projects}
+    user_ids.update(m["user_id"] for p in projects for m in p.get("members", []))
+    user_ids = list(user_ids)
+    users = dict(zip(user_ids, await loader.load_many(user_ids)))
+
+    for p in projects:
+        owner = users.get(p["user_id"])
+        p["owner_email"] = owner.get("email") if owner else None
+        p["owner_username"] = owner.get("username") if owner else None
+
+        for m in p.get("members", []):
+            member_user = users.get(m["user_id"])
+            m["username"] = member_user.get("username") if member_user else None
+
 @router.post("/", response_model=ProjectResponse, status_code=status.HTTP_201_CREATED)
 async def create_project(
     payload: ProjectCreate, 
     user: dict = Depends(get_current_user)
 ):
-    project = project_repository.create(
+    project = await project_repository.create(
         name=payload.name, 
         user_id=user["id"], 
         description=payload.description
@@ -26,67 +46,58 @@ async def create_project(
     return project
 
 @router.get("/", response_model=List[ProjectResponse])
-async def list_projects(user_id: str = Depends(get_current_user_id)):
-    projects = project_repository.list_by_user(user_id)
-    
-    # Cache para evitar buscas repetidas do mesmo usuário
-    user_details = {}
-    
-    for p in projects:
-        # Dono
-        owner_id = p["user_id"]
-        if owner_id not in user_details:
-            owner = user_repository.get_by_id(owner_id)
-            user_details[owner_id] = {
-                "email": owner["email"] if owner else None,
-                "username": owner["username"] if owner else None
-            }
-        p["owner_email"] = user_details[owner_id]["email"]
-        p["owner_username"] = user_details[owner_id]["username"]
-
-        # Membros
-        for m in p.get("members", []):
-            m_id = m["user_id"]
-            if m_id not in user_details:
-                member_user = user_repository.get_by_id(m_id)
-                user_details[m_id] = {
-                    "email": member_user["email"] if member_user else None,
-                    "username": member_user["username"] if member_user else None
-                }
-            m["username"] = user_details[m_id]["username"]
-        
+async def list_projects(
+    user_id: str = Depends(get_current_user_id),
+    loader: UserLoader = Depends(get_user_loader)
+):
+    projects = await project_repository.list_by_user(user_id)
+    await enrich_with_users(projects, loader)
     return projects
 
+@router.get("/bootstrap", response_model=BootstrapResponse)
+async def bootstrap(
+    limit: int = Query(20, ge=1, le=100),
+    user_id: str = Depends(get_current_user_id),
+    loader: UserLoader = Depends(get_user_loader)
+):
+    """
+    Carga inicial da barra lateral: projetos do usuário (com donos e membros)
+    e a primeira página de conversas de cada projeto e das conversas pessoais.
+    As próximas páginas seguem em GET /conversation/ com o `next_cursor`.
+    """
+    projects = await project_repository.list_by_user(user_id)
+    await enrich_with_users(projects, loader)
+    pages = await chat_repository.list_recent_by_projects(user_id, [p["id"] for p in projects], limit)
+
+    def page(key):
+        conversations, next_cursor = pages.get(key, ([], None))
+        return {"conversations": conversations, "next_cursor": next_cursor}
+
+    for p in projects:
+        p["conversations"] = page(p["id"])
+    return {"projects": projects, "personal": page(None)}
+
 @router.get("/{project_id}", response_model=ProjectResponse)
 async def get_project(
     project_id: str, 
-    user: dict = Depends(get_current_user)
+    user: dict = Depends(get_current_user),
+    loader: UserLoader = Depends(get_user_loader)
 ):
-    project = project_repository.get_by_id(project_id)
+    project = await project_repository.get_by_id(project_id)
     if not project:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, 
             detail="Projeto não encontrado."
         )
     
-    is_owner = project["user_id"] == user["id"]
-    is_member = any(m["user_id"] == user["id"] for m in project.get("members", []))
-    
-    if not is_owner and not is_member:
+    if not await authorization_service.authorize(project_id, user["id"], ProjectPermission.VIEW, project):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, 
             detail="Projeto não encontrado."
         )
-        
-    owner = user_repository.get_by_id(project["user_id"])
-    project["owner_email"] = owner["email"] if owner else None
-    project["owner_username"] = owner["username"] if owner else None
 
-    # Preencher usernames dos membros
-    for m in project.get("members", []):
-        m_user = user_repository.get_by_id(m["user_id"])
-        m["username"] = m_user["username"] if m_user else None
-    
+    loader.prime(user["id"], user)
+    await enrich_with_users([project], loader)
     return project
 
 @router.delete("/{project_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -94,13 +105,13 @@ async def delete_project(
     project_id: str, 
     user_id: str = Depends(get_current_user_id)
 ):
-    project = project_repository.get_by_id(project_id)
-    if not project or project["user_id"] != user_id:
+    project = await project_repository.get_by_id(project_id)
+    if not project or not await authorization_service.authorize(project_id, user_id, ProjectPermission.DELETE_PROJECT, project):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, 
             detail="Projeto não encontrado ou você não tem permissão para excluí-lo."
         )
-    success = project_repository.delete(project_id)
+    success = await project_repository.delete(project_id)
     if not success:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, 
@@ -114,14 +125,11 @@ async def update_project(
     payload: ProjectUpdate,
     user_id: str = Depends(get_current_user_id)
 ):
-    project = project_repository.get_by_id(project_id)
+    project = await project_repository.get_by_id(project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Projeto não encontrado")
     
-    is_owner = project["user_id"] == user_id
-    is_admin = any(m["user_id"] == user_id and m["role"] == "admin" for m in project.get("members", []))
-    
-    if not is_owner and not is_admin:
+    if not await authorization_service.authorize(project_id, user_id, ProjectPermission.UPDATE_PROJECT, project):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, 
             detail="Você não tem permissão para atualizar este projeto."
@@ -129,10 +137,10 @@ async def update_project(
     
     update_data = payload.model_dump(exclude_unset=True)
     if not update_data:
-        return project_repository.get_by_id(project_id)
+        return await project_repository.get_by_id(project_id)
         
     try:
-        success = project_repository.update(project_id, update_data)
+        success = await project_repository.update(project_id, update_data)
         if not success:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -144,40 +152,72 @@ async def update_project(
             detail=f"Erro interno ao atualizar projeto: {str(e)}"
         )
     
-    return project_repository.get_by_id(project_id)
+    return await project_repository.get_by_id(project_id)
 
 
-@router.post("/{project_id}/members", status_code=status.HTTP_201_CREATED)
-async def add_member(
-    project_id: str,
-    payload: MemberAddRequest,
-    user_id: str = Depends(get_current_user_id)
-):
-    project = project_repository.get_by_id(project_id)
+# As mutações de membros são escritas condicionais: as regras de permissão vão
+# no filtro da atualização. O projeto só é lido quando a escrita não se aplica,
+# para descobrir o motivo e responder com o erro adequado.
+CONCURRENT_CHANGE = HTTPException(
+    status_code=status.HTTP_409_CONFLICT,
+    detail="O projeto foi alterado por outra operação. Tente novamente."
+)
+
+async def explain_add_member_failure(project_id: str, user_id: str, role: str, new_user_id: Optional[str] = None):
+    project = await project_repository.get_by_id(project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Projeto não encontrado")
-    
-    is_owner = project["user_id"] == user_id
-    is_admin = any(m["user_id"] == user_id and m["role"] == "admin" for m in project.get("members", []))
-    
-    if not is_owner and not is_admin:
+
+    granted = await authorization_service.permissions(project_id, user_id, project)
+    if ProjectPermission.MANAGE_MEMBERS not in granted:
         raise HTTPException(status_code=403, detail="Sem permissão para adicionar membros")
     
-    if payload.role == "admin" and not is_owner:
+    if role == "admin" and ProjectPermission.MANAGE_ADMINS not in granted:
         raise HTTPException(status_code=403, detail="Apenas o dono pode adicionar administradores")
 
-    new_user = user_repository.get_by_email(payload.email)
-    if not new_user:
-        raise HTTPException(status_code=404, detail="Usuário não encontrado. Ele deve se registrar primeiro.")
-    
-    new_user_id = str(new_user["_id"])
-    
     if project["user_id"] == new_user_id:
         raise HTTPException(status_code=400, detail="O usuário já é o dono do projeto")
     
     if any(m["user_id"] == new_user_id for m in project.get("members", [])):
         raise HTTPException(status_code=400, detail="O usuário já é um membro do projeto")
 
+async def explain_member_change_failure(project_id: str, user_id: str, email: str, action: str, role: Optional[str] = None):
+    project = await project_repository.get_by_id(project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Projeto não encontrado")
+    
+    granted = await authorization_service.permissions(project_id, user_id, project)
+    if ProjectPermission.MANAGE_MEMBERS not in granted:
+        raise HTTPException(status_code=403, detail="Sem permissão")
+
+    target_member = next((m for m in project.get("members", []) if m["email"] == email), None)
+    if not target_member:
+        raise HTTPException(status_code=404, detail="Membro não encontrado")
+
+    if ProjectPermission.MANAGE_ADMINS not in granted:
+        if target_member["role"] == "admin":
+            raise HTTPException(status_code=403, detail=f"Admins não podem {action} outros admins")
+        if role == "admin":
+            raise HTTPException(status_code=403, detail="Admins não podem promover outros a admin")
+
+async def explain_transfer_failure(project_id: str, user_id: str):
+    project = await project_repository.get_by_id(project_id)
+    if not project or not await authorization_service.authorize(project_id, user_id, ProjectPermission.TRANSFER_OWNERSHIP, project):
+        raise HTTPException(status_code=403, detail="Apenas o dono pode transferir a propriedade")
+
+@router.post("/{project_id}/members", status_code=status.HTTP_201_CREATED)
+async def add_member(
+    project_id: str,
+    payload: MemberAddRequest,
+    user_id: str = Depends(get_current_user_id)
+):
+    new_user = await user_repository.get_by_email(payload.email)
+    if not new_user:
+        # Sem permissão no projeto, não revela se o email está cadastrado
+        await explain_add_member_failure(project_id, user_id, payload.role)
+        raise HTTPException(status_code=404, detail="Usuário não encontrado. Ele deve se registrar primeiro.")
+    
+    new_user_id = str(new_user["_id"])
     member_data = {
         "user_id": new_user_id,
         "email": payload.email,
@@ -185,7 +225,9 @@ async def add_member(
         "permissions": payload.permissions.model_dump() if payload.permissions else ProjectPermissions().model_dump()
     }
     
-    project_repository.add_member(project_id, member_data)
+    if not await project_repository.add_member(project_id, member_data, actor_id=user_id):
+        await explain_add_member_failure(project_id, user_id, payload.role, new_user_id)
+        raise CONCURRENT_CHANGE
     return {"message": "Membro adicionado com sucesso"}
 
 @router.put("/{project_id}/members/{email}")
@@ -195,28 +237,10 @@ async def update_member(
     payload: MemberUpdateRequest,
     user_id: str = Depends(get_current_user_id)
 ):
-    project = project_repository.get_by_id(project_id)
-    if not project:
-        raise HTTPException(status_code=404, detail="Projeto não encontrado")
-    
-    is_owner = project["user_id"] == user_id
-    is_admin = any(m["user_id"] == user_id and m["role"] == "admin" for m in project.get("members", []))
-    
-    if not is_owner and not is_admin:
-        raise HTTPException(status_code=403, detail="Sem permissão")
-
-    target_member = next((m for m in project.get("members", []) if m["email"] == email), None)
-    if not target_member:
-        raise HTTPException(status_code=404, detail="Membro não encontrado")
-
-    if is_admin and not is_owner:
-        if target_member["role"] == "admin":
-            raise HTTPException(status_code=403, detail="Admins não podem editar outros admins")
-        if payload.role == "admin":
-            raise HTTPException(status_code=403, detail="Admins não podem promover outros a admin")
-
     update_data = payload.model_dump(exclude_unset=True)
-    project_repository.update_member(project_id, email, update_data)
+    if not await project_repository.update_member(project_id, email, update_data, actor_id=user_id):
+        await explain_member_change_failure(project_id, user_id, email, "editar", payload.role)
+        raise CONCURRENT_CHANGE
     return {"message": "Permissões atualizadas"}
 
 @router.delete("/{project_id}/members/{email}", status_code=status.HTTP_204_NO_CONTENT)
@@ -225,24 +249,9 @@ async def remove_member(
     email: str,
     user_id: str = Depends(get_current_user_id)
 ):
-    project = project_repository.get_by_id(project_id)
-    if not project:
-        raise HTTPException(status_code=404, detail="Projeto não encontrado")
-    
-    is_owner = project["user_id"] == user_id
-    is_admin = any(m["user_id"] == user_id and m["role"] == "admin" for m in project.get("members", []))
-    
-    if not is_owner and not is_admin:
-        raise HTTPException(status_code=403, detail="Sem permissão")
-
-    target_member = next((m for m in project.get("members", []) if m["email"] == email), None)
-    if not target_member:
-        raise HTTPException(status_code=404, detail="Membro não encontrado")
-
-    if is_admin and not is_owner and target_member["role"] == "admin":
-        raise HTTPException(status_code=403, detail="Admins não podem remover outros admins")
-
-    project_repository.remove_member(project_id, email)
+    if not await project_repository.remove_member(project_id, email, actor_id=user_id):
+        await explain_member_change_failure(project_id, user_id, email, "remover")
+        raise CONCURRENT_CHANGE
     return None
 
 @router.post("/{project_id}/transfer-ownership")
@@ -251,21 +260,12 @@ async def transfer_ownership(
     payload: TransferOwnershipRequest,
     user: dict = Depends(get_current_user)
 ):
-    project = project_repository.get_by_id(project_id)
-    if not project or project["user_id"] != user["id"]:
-        raise HTTPException(status_code=403, detail="Apenas o dono pode transferir a propriedade")
-
-    new_owner = user_repository.get_by_email(payload.new_owner_email)
-    if not new_owner:
-        raise HTTPException(status_code=404, detail="Novo dono não encontrado")
-    
-    new_owner_id = str(new_owner["_id"])
-    if new_owner_id == user["id"]:
+    new_owner = await user_repository.get_by_email(payload.new_owner_email)
+    if not new_owner or str(new_owner["_id"]) == user["id"]:
+        await explain_transfer_failure(project_id, user["id"])
+        if not new_owner:
+            raise HTTPException(status_code=404, detail="Novo dono não encontrado")
         raise HTTPException(status_code=400, detail="Você já é o dono")
-
-    project_repository.update(project_id, {"user_id": new_owner_id})
-    
-    project_repository.remove_member(project_id, payload.new_owner_email)
     
     old_owner_member = {
         "user_id": user["id"],
@@ -273,6 +273,11 @@ async def transfer_ownership(
         "role": "admin",
         "permissions": ProjectPermissions().model_dump()
     }
-    project_repository.add_member(project_id, old_owner_member)
+    transferred = await project_repository.transfer_ownership(
+        project_id, user["id"], str(new_owner["_id"]), payload.new_owner_email, old_owner_member
+    )
+    if not transferred:
+        await explain_transfer_failure(project_id, user["id"])
+        raise CONCURRENT_CHANGE
     
     return {"message": f"Propriedade transferida para {payload.new_owner_email}"}
@@ -0,0 +1,147 @@
+import copy
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+from bson import json_util
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class TTLCache:
+    """
+    Cache LRU em memória com limite de itens e expiração por entrada.
+    Seguro para uso a partir do event loop e do threadpool do FastAPI.
+    """
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+class CacheBackend(ABC):
+    """
+    Interface dos caches compartilháveis. As implementações devolvem cópias,
+    então o chamador pode alterar o valor retornado livremente.
+    """
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Any]: ...
+
+    @abstractmethod
+    async def set(self, key: str, value: Any) -> None: ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None: ...
+
+    @abstractmethod
+    def stats(self) -> dict: ...
+
+class MemoryCacheBackend(CacheBackend):
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, key: str) -> Optional[Any]:
+        return copy.deepcopy(self._cache.get(key))
+
+    async def set(self, key: str, value: Any) -> None:
+        self._cache.set(key, copy.deepcopy(value))
+
+    async def delete(self, key: str) -> None:
+        self._cache.delete(key)
+
+    def stats(self) -> dict:
+        return {"backend": "memory", **self._cache.stats()}
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Cache em um servidor compatível com Redis (Redis, Valkey, KeyDB...),
+    compartilhado entre os workers. Falhas de conexão contam como miss.
+    """
+    def __init__(self, url: str, ttl: float, prefix: str):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_BACKEND=redis requer o pacote opcional 'redis' (pip install redis)") from e
+
+        self._client = redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    async def get(self, key: str) -> Optional[Any]:
+        try:
+            raw = await self._client.get(self.prefix + key)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Cache get failed for {key}: {e}")
+            raw = None
+
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json_util.loads(raw)
+
+    async def set(self, key: str, value: Any) -> None:
+        try:
+            await self._client.set(self.prefix + key, json_util.dumps(value), ex=max(1, int(self.ttl)))
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Cache set failed for {key}: {e}")
+
+    async def delete(self, key: str) -> None:
+        try:
+            await self._client.delete(self.prefix + key)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Cache delete failed for {key}: {e}")
+
+    def stats(self) -> dict:
+        return {"backend": "redis", "hits": self.hits, "misses": self.misses, "errors": self.errors}
+
+def create_cache_backend(namespace: str, maxsize: int, ttl: float) -> CacheBackend:
+    if settings.CACHE_BACKEND == "redis":
+        return RedisCacheBackend(settings.CACHE_URL, ttl, prefix=f"cineai:{namespace}:")
+    return MemoryCacheBackend(maxsize, ttl)
@@ -11,6 +11,22 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 15
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
+    TOKEN_CACHE_SIZE: int = 10000
+    TOKEN_CACHE_TTL_SECONDS: int = 300
+
+    # "memory" (por processo) ou "redis" (compartilhado entre workers via CACHE_URL)
+    CACHE_BACKEND: str = "memory"
+    CACHE_URL: str = "redis://localhost:6379/0"
+    USER_CACHE_SIZE: int = 5000
+    USER_CACHE_TTL_SECONDS: int = 60
+    # ACLs compiladas por (projeto, acl_version); a versão muda a cada alteração de membros
+    ACL_CACHE_SIZE: int = 5000
+    ACL_CACHE_TTL_SECONDS: int = 600
+    PASSWORD_HASH_WORKERS: int = 2
+    # Parâmetros do Argon2; ajuste para a máquina com `python -m scripts.calibrate_argon2`
+    ARGON2_TIME_COST: int = 3
+    ARGON2_MEMORY_COST: int = 65536  # KiB
+    ARGON2_PARALLELISM: int = 4
     
     DATABASE_URL: str = "mongodb://mongodb:27017"
     DEVELOPMENT: bool = False
@@ -20,6 +36,41 @@ class Settings(BaseSettings):
     OPENROUTER_API_KEY: str = ""
     OPENROUTER_BASE_URL: str = "https://openrouter.ai/api/v1"
 
+    # "embedded" mantém as mensagens no array do chat; "collection" grava cada
+    # mensagem como um documento próprio na coleção messages.
+    CHAT_MESSAGE_STORAGE: str = "embedded"
+
+    # "embedded" lista os projetos do usuário pelo array members; "collection" usa a
+    # coleção project_members (rode scripts.backfill_project_members antes de ativar)
+    PROJECT_MEMBERSHIP_LOOKUP: str = "embedded"
+
+    # Cria os índices declarados pelos repositórios ao subir a API
+    ENSURE_INDEXES_ON_STARTUP: bool = True
+    # Buffer do /analytics/track-click: cliques são gravados em lotes de até
+    # ANALYTICS_BATCH_SIZE ou a cada ANALYTICS_FLUSH_INTERVAL_SECONDS; com
+    # ANALYTICS_BUFFER_SIZE cliques pendentes, o endpoint responde 503
+    ANALYTICS_BUFFER_SIZE: int = 10000
+    ANALYTICS_BATCH_SIZE: int = 500
+    ANALYTICS_FLUSH_INTERVAL_SECONDS: float = 1.0
+    # Idade mínima de um clique ainda não contado para scripts.count_pending_clicks contá-lo
+    ANALYTICS_PENDING_SWEEP_AFTER_SECONDS: int = 300
+    # Buckets de minuto do /analytics/timeseries são apagados depois deste prazo (0 mantém para sempre)
+    ANALYTICS_MINUTE_ROLLUP_TTL_DAYS: int = 7
+    ANALYTICS_TIMESERIES_MAX_BUCKETS: int = 2000
+
+    # Montagem do contexto enviado ao modelo a cada mensagem
+    CONTEXT_MAX_TOKENS: int = 32000
+    CONTEXT_RESPONSE_RESERVE_TOKENS: int = 8192
+    CONTEXT_STRATEGY: str = "sliding_window"  # "sliding_window" ou "keep_first_last"
+    CONTEXT_KEEP_FIRST: int = 2
+    CONTEXT_REASONING_TOKENS: int = 0  # 0 remove o raciocínio do histórico
+
+    # Resumo contínuo: acima de SUMMARY_TRIGGER_MESSAGES mensagens fora do resumo,
+    # as mais antigas são incorporadas a ele, mantendo SUMMARY_KEEP_RECENT na íntegra
+    SUMMARY_TRIGGER_MESSAGES: int = 40  # 0 desativa
+    SUMMARY_KEEP_RECENT: int = 10
+    SUMMARY_MAX_TOKENS: int = 800
+
     model_config = SettingsConfigDict(
         env_file=".env", 
         env_file_encoding="utf-8",
@@ -0,0 +1,69 @@
+"""
+HyperLogLog para estimar quantos valores distintos (emails) um conjunto de
+cliques tem sem guardar os valores.
+
+O sketch tem 2**PRECISION registradores; cada valor atualiza um registrador
+com o máximo entre o valor atual e o "rank" do seu hash. Como a atualização e
+a junção de dois sketches são só máximos por registrador, os sketches podem
+ser mantidos no MongoDB com `$max` e somados entre buckets de tempo. Com
+PRECISION = 12 o erro padrão é de cerca de 1,6%.
+
+Os registradores zerados não são guardados: em documentos, o sketch é um
+dict {"<índice>": rank} que cresce até no máximo 2**PRECISION chaves.
+"""
+import math
+from hashlib import blake2b
+from typing import Dict, Iterable, Optional, Tuple
+
+PRECISION = 12
+REGISTERS = 1 << PRECISION
+HASH_BITS = 64
+
+def register_for(value: str) -> Tuple[int, int]:
+    """
+    Registrador e rank de um valor: os primeiros PRECISION bits do hash
+    escolhem o registrador e a posição do primeiro bit 1 no restante é o rank.
+    """
+    digest = int.from_bytes(blake2b(value.encode(), digest_size=HASH_BITS // 8).digest(), "big")
+    index = digest >> (HASH_BITS - PRECISION)
+    rest = digest & ((1 << (HASH_BITS - PRECISION)) - 1)
+    return index, HASH_BITS - PRECISION - rest.bit_length() + 1
+
+class HyperLogLog:
+    def __init__(self, registers: Optional[Dict[int, int]] = None):
+        self.registers: Dict[int, int] = dict(registers or {})
+
+    @classmethod
+    def from_document(cls, document: Optional[dict]) -> "HyperLogLog":
+        return cls({int(index): rank for index, rank in (document or {}).items()})
+
+    def to_document(self) -> Dict[str, int]:
+        return {str(index): rank for index, rank in self.registers.items()}
+
+    def add(self, value: str) -> None:
+        index, rank = register_for(value)
+        if rank > self.registers.get(index, 0):
+            self.registers[index] = rank
+
+    def update(self, values: Iterable[str]) -> None:
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: "HyperLogLog") -> None:
+        for index, rank in other.registers.items():
+            if rank > self.registers.get(index, 0):
+                self.registers[index] = rank
+
+    def count(self) -> int:
+        if not self.registers:
+            return 0
+
+        alpha = 0.7213 / (1 + 1.079 / REGISTERS)
+        zeros = REGISTERS - len(self.registers)
+        harmonic = zeros + sum(2.0 ** -rank for rank in self.registers.values())
+        estimate = alpha * REGISTERS * REGISTERS / harmonic
+
+        # Para poucos valores, a contagem linear dos registradores zerados é mais precisa
+        if estimate <= 2.5 * REGISTERS and zeros:
+            estimate = REGISTERS * math.log(REGISTERS / zeros)
+        return round(estimate)
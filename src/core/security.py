@@ -1,10 +1,58 @@
+import asyncio
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Any, Union
+from typing import Any, Callable, Union
 import jwt
 from argon2 import PasswordHasher
 from src.core.config import settings
+from src.core.cache import TTLCache
 
-ph = PasswordHasher()
+ph = PasswordHasher(
+    time_cost=settings.ARGON2_TIME_COST,
+    memory_cost=settings.ARGON2_MEMORY_COST,
+    parallelism=settings.ARGON2_PARALLELISM
+)
+
+class PasswordHashPool:
+    """
+    Executa o Argon2 fora do event loop, em um pool com no máximo
+    `max_workers` hashes simultâneos. O argon2-cffi libera o GIL durante o
+    cálculo, então threads bastam para isolar o custo de CPU.
+    """
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="argon2")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+
+    def _run(self, fn: Callable, *args):
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    async def submit(self, fn: Callable, *args):
+        with self._lock:
+            self._queued += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._run, fn, *args)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"max_workers": self.max_workers, "queued": self._queued, "running": self._running}
+
+hash_pool = PasswordHashPool(settings.PASSWORD_HASH_WORKERS)
+
+# Tokens já verificados -> claims, válidos no máximo até o "exp" de cada token
+token_cache = TTLCache(maxsize=settings.TOKEN_CACHE_SIZE, ttl=settings.TOKEN_CACHE_TTL_SECONDS)
 
 def create_access_token(subject: Union[str, Any], username: str, email: str) -> str:
     expire = datetime.now(timezone.utc) + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -21,7 +69,9 @@ def create_refresh_token(subject: Union[str, Any]) -> str:
     expire = datetime.now(timezone.utc) + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
     to_encode = {
         "exp": expire, 
-        "user_id": str(subject)
+        "user_id": str(subject),
+        # Torna cada refresh token único, mesmo em logins no mesmo segundo
+        "jti": uuid.uuid4().hex
     }
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
@@ -36,9 +86,31 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return ph.hash(password)
 
+def password_needs_rehash(hashed_password: str) -> bool:
+    try:
+        return ph.check_needs_rehash(hashed_password)
+    except Exception:
+        return False
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await hash_pool.submit(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await hash_pool.submit(get_password_hash, password)
+
 def decode_token(token: str) -> Union[dict, None]:
     try:
         decoded_token = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         return decoded_token
     except Exception:
         return None
+
+def decode_token_cached(token: str) -> Union[dict, None]:
+    claims = token_cache.get(token)
+    if claims is not None:
+        return claims
+
+    claims = decode_token(token)
+    if claims and "exp" in claims:
+        token_cache.set(token, claims, ttl=claims["exp"] - time.time())
+    return claims
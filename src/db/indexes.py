@@ -0,0 +1,70 @@
+"""
+Gerenciamento dos índices do banco cineai.
+
+Cada repositório declara os índices que suas consultas precisam em `INDEXES`
+(coleção -> lista de IndexModel) e algumas consultas representativas em
+`EXPLAIN_QUERIES` (coleção, filtro, ordenação). O IndexManager cria os índices
+de forma idempotente e usa explain() para apontar consultas que ainda caem em
+COLLSCAN.
+"""
+from typing import Dict, Iterable, List
+
+from src.db.session import db
+from src.repositories.analytics_repository import AnalyticsRepository
+from src.repositories.chat_repository import ChatRepository
+from src.repositories.project_repository import ProjectRepository
+from src.repositories.session_repository import SessionRepository
+from src.repositories.user_repository import UserRepository
+
+REPOSITORIES = [ChatRepository, ProjectRepository, UserRepository, SessionRepository, AnalyticsRepository]
+
+def plan_stages(plan) -> List[str]:
+    # Percorre o plano vencedor (clássico ou SBE) coletando os estágios
+    if isinstance(plan, dict):
+        stages = [plan["stage"]] if "stage" in plan else []
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+        return stages
+    if isinstance(plan, list):
+        return [stage for item in plan for stage in plan_stages(item)]
+    return []
+
+class IndexManager:
+    def __init__(self, database=db, repositories: Iterable = REPOSITORIES):
+        self.database = database
+        self.repositories = list(repositories)
+
+    def declared_indexes(self) -> Dict[str, list]:
+        declared: Dict[str, list] = {}
+        for repository in self.repositories:
+            for collection, models in repository.INDEXES.items():
+                declared.setdefault(collection, []).extend(models)
+        return declared
+
+    async def ensure(self) -> Dict[str, List[str]]:
+        # create_indexes não faz nada quando o índice já existe com a mesma definição
+        created = {}
+        for collection, models in self.declared_indexes().items():
+            created[collection] = await self.database[collection].create_indexes(models)
+        return created
+
+    async def explain(self) -> List[dict]:
+        report = []
+        for repository in self.repositories:
+            for collection, query, sort in repository.EXPLAIN_QUERIES:
+                cursor = self.database[collection].find(query)
+                if sort:
+                    cursor = cursor.sort(sort)
+                plan = await cursor.explain()
+                stages = plan_stages(plan.get("queryPlanner", {}).get("winningPlan", {}))
+                report.append({
+                    "repository": repository.__name__,
+                    "collection": collection,
+                    "query": query,
+                    "sort": sort,
+                    "stages": stages,
+                    "collscan": "COLLSCAN" in stages
+                })
+        return report
+
+index_manager = IndexManager()
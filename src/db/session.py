@@ -1,4 +1,5 @@
 import pymongo
+from functools import lru_cache
 from src.core.config import settings
 
 is_cloud = "mongodb+srv" in settings.DATABASE_URL or "ssl=true" in settings.DATABASE_URL.lower()
@@ -20,11 +21,23 @@ else:
     mongo_args["tls"] = True
     mongo_args["tlsAllowInvalidCertificates"] = settings.DEVELOPMENT
 
-client = pymongo.MongoClient(**mongo_args)
+client = pymongo.AsyncMongoClient(**mongo_args)
 
 db = client.get_database("cineai")
 
 chats = db["chats"]
+messages = db["messages"]
 projects = db["projects"]
+project_members = db["project_members"]
 users = db["users"]
 analytics = db["analytics"]
+analytics_counters = db["analytics_counters"]
+analytics_emails = db["analytics_emails"]
+analytics_rollups = db["analytics_rollups"]
+analytics_state = db["analytics_state"]
+sessions = db["sessions"]
+
+@lru_cache
+def get_sync_database():
+    # Acesso síncrono para scripts e ferramentas que rodam fora do event loop
+    return pymongo.MongoClient(**mongo_args).get_database("cineai")
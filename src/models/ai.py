@@ -11,17 +11,20 @@ class AIModel(Enum):
             "GEMINI_3_FLASH": {
                 "name": "gemini-3-flash",
                 "model": "google/gemini-3-flash-preview",
-                "provider": "gemini"
+                "provider": "gemini",
+                "context_window": 1048576
             },
             "GEMMA_4": {
                 "name": "gemma-4",
                 "model": "google/gemma-4-31b-it:free",
-                "provider": "gemini"
+                "provider": "gemini",
+                "context_window": 131072
             },
             "MINIMAX_M2_5": {
                 "name": "minimax-m2.5",
                 "model": "minimax/minimax-m2.5:free",
-                "provider": "minimax"
+                "provider": "minimax",
+                "context_window": 196608
             }
         }
         return models[self.name]
@@ -0,0 +1,36 @@
+from enum import IntFlag
+
+class ProjectPermission(IntFlag):
+    VIEW = 1
+    READ = 2
+    SEND_MESSAGES = 4
+    CREATE_CHATS = 8
+    IMAGE = 16
+    VIDEO = 32
+    UPDATE_PROJECT = 64
+    MANAGE_MEMBERS = 128
+    DELETE_CHATS = 256
+    MANAGE_ADMINS = 512
+    DELETE_PROJECT = 1024
+    TRANSFER_OWNERSHIP = 2048
+
+    @classmethod
+    def for_member(cls, member: dict) -> "ProjectPermission":
+        if member.get("role") == "admin":
+            return ADMIN_PERMISSIONS
+        granted = cls.VIEW
+        for name, allowed in (member.get("permissions") or {}).items():
+            if allowed and name.upper() in cls.__members__:
+                granted |= cls[name.upper()]
+        return granted
+
+ADMIN_PERMISSIONS = (
+    ProjectPermission.VIEW | ProjectPermission.READ | ProjectPermission.SEND_MESSAGES
+    | ProjectPermission.CREATE_CHATS | ProjectPermission.IMAGE | ProjectPermission.VIDEO
+    | ProjectPermission.UPDATE_PROJECT | ProjectPermission.MANAGE_MEMBERS | ProjectPermission.DELETE_CHATS
+)
+
+OWNER_PERMISSIONS = (
+    ADMIN_PERMISSIONS | ProjectPermission.MANAGE_ADMINS
+    | ProjectPermission.DELETE_PROJECT | ProjectPermission.TRANSFER_OWNERSHIP
+)
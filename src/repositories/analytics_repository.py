@@ -1,37 +1,336 @@
-from src.db.session import analytics
-from typing import List, Dict
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel, UpdateOne
+from pymongo.errors import BulkWriteError
+from src.core.config import settings
+from src.core.hyperloglog import HyperLogLog, register_for
+from src.db.session import analytics, analytics_counters, analytics_emails, analytics_rollups, analytics_state
+from typing import AsyncIterator, List, Dict, Optional, Tuple
+
+# Etapas de contagem de um clique gravado; cada uma sai de `pending` quando é aplicada
+PENDING_STEPS = ("counters", "rollups")
+
+GRANULARITIES = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+}
+
+def element_key(click: dict) -> tuple:
+    return (click.get("variant"), click.get("elementId"))
+
+def as_naive(timestamp: datetime) -> datetime:
+    # Os cliques são gravados em UTC e o MongoDB os devolve sem fuso; datas com fuso são levadas para UTC
+    if timestamp.tzinfo is not None:
+        return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    timestamp = as_naive(timestamp)
+    if granularity == "minute":
+        return timestamp.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
 
 class AnalyticsRepository:
+    INDEXES = {
+        # Filtros da exportação do /analytics/raw
+        "analytics": [
+            IndexModel([("timestamp", ASCENDING)]),
+            IndexModel([("variant", ASCENDING), ("elementId", ASCENDING), ("timestamp", ASCENDING)]),
+            # Só os cliques ainda não contados, para a varredura de count_pending_clicks
+            IndexModel([("pending", ASCENDING)], partialFilterExpression={"pending": {"$exists": True}}),
+        ],
+        "analytics_counters": [
+            IndexModel([("variant", ASCENDING), ("elementId", ASCENDING)], unique=True),
+        ],
+        # Também cobre a paginação de list_emails
+        "analytics_emails": [
+            IndexModel([("variant", ASCENDING), ("elementId", ASCENDING), ("email", ASCENDING)], unique=True),
+        ],
+        "analytics_rollups": [
+            IndexModel([("granularity", ASCENDING), ("variant", ASCENDING), ("elementId", ASCENDING), ("bucket", ASCENDING)], unique=True),
+            IndexModel([("granularity", ASCENDING), ("bucket", ASCENDING)]),
+            # Só os buckets de minuto recebem expires_at (ANALYTICS_MINUTE_ROLLUP_TTL_DAYS)
+            IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+        ],
+    }
+
+    EXPLAIN_QUERIES = [
+        ("analytics", {"timestamp": {"$gte": datetime(2024, 1, 1), "$lt": datetime(2024, 2, 1)}}, None),
+        ("analytics", {"variant": "A", "elementId": "cta", "timestamp": {"$gte": datetime(2024, 1, 1)}}, None),
+        ("analytics", {"pending": {"$exists": True}, "_id": {"$lt": ObjectId.from_datetime(datetime(2024, 1, 1))}}, None),
+        ("analytics_counters", {"variant": "A", "elementId": "cta"}, None),
+        ("analytics_emails", {"variant": "A", "elementId": "cta", "email": {"$gt": "a@example.com"}}, [("email", ASCENDING)]),
+        ("analytics_rollups", {"granularity": "hour", "bucket": {"$gte": datetime(2024, 1, 1), "$lt": datetime(2024, 1, 8)}}, [("bucket", ASCENDING)]),
+        ("analytics_rollups", {"granularity": "day", "variant": "A", "elementId": "cta", "bucket": {"$gte": datetime(2024, 1, 1)}}, [("bucket", ASCENDING)]),
+    ]
+
     @staticmethod
-    def save_click(click_data: dict) -> bool:
-        result = analytics.insert_one(click_data)
+    async def save_click(click_data: dict) -> bool:
+        result = await analytics.insert_one(click_data)
         return result.acknowledged
 
     @staticmethod
-    def get_all_clicks() -> List[dict]:
-        cursor = analytics.find({}, {"_id": 0})
-        return list(cursor)
+    async def save_clicks(clicks: List[dict]) -> List[dict]:
+        """
+        Grava um lote de cliques com _id já definido e devolve os que foram
+        inseridos agora. Reenviar um lote que foi gravado em parte só insere
+        (e só devolve) os que faltam. Cada clique entra com `pending` (as
+        etapas de PENDING_STEPS), que count_clicks remove ao contá-lo.
+        """
+        for click in clicks:
+            click.setdefault("pending", list(PENDING_STEPS))
+        try:
+            await analytics.insert_many(clicks, ordered=False)
+            return clicks
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != 11000 for error in errors):
+                raise
+            duplicated = {error["index"] for error in errors}
+            return [click for index, click in enumerate(clicks) if index not in duplicated]
+
+    @staticmethod
+    async def count_clicks(click_ids: List[ObjectId]) -> int:
+        """
+        Aplica aos cliques informados as etapas de contagem que ainda estão em
+        `pending` e as remove de cada clique logo depois de aplicadas. Se uma
+        etapa falhar, chamar de novo só refaz o que faltou; cliques já
+        contados são ignorados. Devolve quantos cliques ainda estavam pendentes.
+        """
+        clicks = await analytics.find({"_id": {"$in": click_ids}, "pending": {"$exists": True}}).to_list()
+        steps = {
+            "counters": AnalyticsRepository.increment_counters,
+            "rollups": AnalyticsRepository.increment_rollups,
+        }
+        for step in PENDING_STEPS:
+            todo = [click for click in clicks if step in click["pending"]]
+            if todo:
+                await steps[step](todo)
+                await analytics.update_many({"_id": {"$in": [click["_id"] for click in todo]}}, {"$pull": {"pending": step}})
+
+        if clicks:
+            await analytics.update_many({"_id": {"$in": [click["_id"] for click in clicks]}, "pending": []}, {"$unset": {"pending": ""}})
+        return len(clicks)
+
+    @staticmethod
+    async def iter_pending_ids(before: datetime, batch_size: int = 1000) -> AsyncIterator[List[ObjectId]]:
+        # O _id é gerado no offer do buffer, então também marca quando o clique chegou
+        query = {"pending": {"$exists": True}, "_id": {"$lt": ObjectId.from_datetime(before)}}
+        batch = []
+        async for click in analytics.find(query, {"_id": 1}, batch_size=batch_size):
+            batch.append(click["_id"])
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    @staticmethod
+    async def counting_paused() -> bool:
+        state = await analytics_state.find_one({"_id": "counting"})
+        return bool(state and state.get("paused"))
+
+    @staticmethod
+    async def set_counting_paused(paused: bool) -> None:
+        # Com a contagem pausada os cliques continuam sendo gravados, mas ficam em `pending`
+        await analytics_state.update_one(
+            {"_id": "counting"},
+            {"$set": {"paused": paused, "updated_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+
+    @staticmethod
+    async def increment_counters(clicks: List[dict]) -> None:
+        """
+        Soma os cliques nos contadores por (variant, elementId). Emails ainda não
+        vistos para o elemento entram em analytics_emails e incrementam
+        unique_emails.
+        """
+        counters: Dict[tuple, dict] = {}
+        emails: Dict[tuple, object] = {}
+        for click in clicks:
+            key = element_key(click)
+            counter = counters.setdefault(key, {"count": 0, "unique_emails": 0, "last_click_at": None})
+            counter["count"] += 1
+            if click.get("timestamp") and (counter["last_click_at"] is None or click["timestamp"] > counter["last_click_at"]):
+                counter["last_click_at"] = click["timestamp"]
+            if click.get("email"):
+                emails.setdefault(key + (click["email"],), click.get("timestamp"))
+
+        if emails:
+            keys = list(emails)
+            operations = [
+                UpdateOne(
+                    {"variant": variant, "elementId": element_id, "email": email},
+                    {"$setOnInsert": {"first_seen": emails[(variant, element_id, email)]}},
+                    upsert=True
+                )
+                for variant, element_id, email in keys
+            ]
+            try:
+                result = await analytics_emails.bulk_write(operations, ordered=False)
+                upserted = result.upserted_ids
+            except BulkWriteError as e:
+                # Outro worker inseriu o mesmo email ao mesmo tempo e já o contou
+                if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                    raise
+                upserted = {item["index"]: item["_id"] for item in e.details.get("upserted", [])}
+            for index in upserted:
+                counters[keys[index][:2]]["unique_emails"] += 1
+
+        operations = []
+        for (variant, element_id), counter in counters.items():
+            update = {"$inc": {"count": counter["count"], "unique_emails": counter["unique_emails"]}}
+            if counter["last_click_at"] is not None:
+                update["$max"] = {"last_click_at": counter["last_click_at"]}
+            operations.append(UpdateOne({"variant": variant, "elementId": element_id}, update, upsert=True))
+        await analytics_counters.bulk_write(operations, ordered=False)
+
+    @staticmethod
+    async def increment_rollups(clicks: List[dict], counts: bool = True) -> None:
+        """
+        Soma os cliques nos buckets de minuto, hora e dia de cada
+        (variant, elementId) e atualiza o HyperLogLog de emails do bucket
+        (`hll`, um registrador por chave, via $max). Cliques sem timestamp
+        ficam de fora. Com counts=False só os sketches são atualizados, o que
+        pode ser repetido sem alterar o resultado.
+        """
+        buckets: Dict[tuple, dict] = {}
+        for click in clicks:
+            if not click.get("timestamp"):
+                continue
+            register = register_for(click["email"]) if click.get("email") else None
+            for granularity in GRANULARITIES:
+                key = (granularity, bucket_start(click["timestamp"], granularity)) + element_key(click)
+                bucket = buckets.setdefault(key, {"count": 0, "registers": {}})
+                bucket["count"] += 1
+                if register is not None:
+                    index, rank = register
+                    bucket["registers"][index] = max(rank, bucket["registers"].get(index, 0))
+
+        ttl_days = settings.ANALYTICS_MINUTE_ROLLUP_TTL_DAYS
+        operations = []
+        for (granularity, start, variant, element_id), bucket in buckets.items():
+            update = {}
+            if counts:
+                update["$inc"] = {"count": bucket["count"]}
+            if bucket["registers"]:
+                update["$max"] = {f"hll.{index}": rank for index, rank in bucket["registers"].items()}
+            if not update:
+                continue
+            if granularity == "minute" and ttl_days > 0:
+                update["$setOnInsert"] = {"expires_at": start + timedelta(days=ttl_days)}
+            operations.append(UpdateOne(
+                {"granularity": granularity, "variant": variant, "elementId": element_id, "bucket": start},
+                update,
+                upsert=True
+            ))
+
+        if operations:
+            await analytics_rollups.bulk_write(operations, ordered=False)
+
+    @staticmethod
+    async def get_timeseries(
+        granularity: str,
+        start: datetime,
+        end: datetime,
+        variant: Optional[str] = None,
+        element_id: Optional[str] = None
+    ) -> List[dict]:
+        """
+        Cliques e emails distintos (estimados) por bucket, do bucket que contém
+        start ao que contém end, agrupados por (variant, elementId). O
+        `unique_emails` de cada série junta os sketches de todo o intervalo.
+        Buckets sem cliques não aparecem.
+        """
+        query = {
+            "granularity": granularity,
+            "bucket": {"$gte": bucket_start(start, granularity), "$lt": bucket_start(end, granularity) + GRANULARITIES[granularity]}
+        }
+        if variant is not None:
+            query["variant"] = variant
+        if element_id is not None:
+            query["elementId"] = element_id
+
+        series: Dict[tuple, dict] = {}
+        sketches: Dict[tuple, HyperLogLog] = {}
+        projection = {"_id": 0, "variant": 1, "elementId": 1, "bucket": 1, "count": 1, "hll": 1}
+        async for row in analytics_rollups.find(query, projection).sort("bucket", ASCENDING):
+            key = element_key(row)
+            if key not in series:
+                series[key] = {"variant": key[0], "elementId": key[1], "points": []}
+                sketches[key] = HyperLogLog()
+            sketch = HyperLogLog.from_document(row.get("hll"))
+            sketches[key].merge(sketch)
+            series[key]["points"].append({"bucket": row["bucket"], "count": row.get("count", 0), "unique_emails": sketch.count()})
+
+        for key, item in series.items():
+            item["unique_emails"] = sketches[key].count()
+        return list(series.values())
+
+    @staticmethod
+    async def list_emails(variant: str, element_id: str, limit: int, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        """
+        Página dos emails distintos de um elemento, em ordem alfabética. O
+        cursor é o último email da página anterior.
+        """
+        query = {"variant": variant, "elementId": element_id}
+        if cursor is not None:
+            query["email"] = {"$gt": cursor}
+
+        docs = await analytics_emails.find(query, {"_id": 0, "email": 1, "first_seen": 1}).sort("email", ASCENDING).limit(limit + 1).to_list()
+        next_cursor = docs[limit - 1]["email"] if len(docs) > limit else None
+        return docs[:limit], next_cursor
+
+    @staticmethod
+    async def iter_clicks(
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        variant: Optional[str] = None,
+        element_id: Optional[str] = None,
+        batch_size: int = 1000
+    ) -> AsyncIterator[List[dict]]:
+        """
+        Cliques brutos em lotes de até batch_size, lidos do cursor conforme são
+        consumidos; a memória usada não depende do tamanho da coleção. O
+        controle interno `pending` não é exportado.
+        """
+        query = {}
+        if start is not None or end is not None:
+            query["timestamp"] = {}
+            if start is not None:
+                query["timestamp"]["$gte"] = start
+            if end is not None:
+                query["timestamp"]["$lt"] = end
+        if variant is not None:
+            query["variant"] = variant
+        if element_id is not None:
+            query["elementId"] = element_id
+
+        batch = []
+        async for click in analytics.find(query, {"_id": 0, "pending": 0}, batch_size=batch_size):
+            batch.append(click)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
 
     @staticmethod
-    def get_stats() -> Dict:
-        pipeline = [
+    async def get_stats() -> Dict:
+        # Lê os contadores mantidos na gravação; os emails em si ficam em list_emails
+        cursor = analytics_counters.find({}, {"_id": 0, "variant": 1, "elementId": 1, "count": 1, "unique_emails": 1})
+        results = [
             {
-                "$group": {
-                    "_id": {
-                        "variant": "$variant",
-                        "elementId": "$elementId"
-                    },
-                    "count": {"$sum": 1},
-                    "emails": {"$push": "$email"}
-                }
+                "_id": {"variant": counter.get("variant"), "elementId": counter.get("elementId")},
+                "count": counter.get("count", 0),
+                "unique_emails": counter.get("unique_emails", 0)
             }
+            for counter in await cursor.to_list()
         ]
-        
-        results = list(analytics.aggregate(pipeline))
-        
-        for res in results:
-            res["emails"] = list(set([e for e in res["emails"] if e]))
-            
         return {"stats": results}
 
 analytics_repository = AnalyticsRepository()
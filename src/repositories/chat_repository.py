@@ -1,92 +1,397 @@
+import base64
+import json
+from datetime import datetime, timezone
 from bson import ObjectId
-from src.db.session import chats
-from typing import List, Optional, Any
+from bson.errors import InvalidId
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument
+from pymongo.errors import BulkWriteError
+from src.db.session import chats, messages
+from src.repositories import identity_map
+from src.core.config import settings
+from typing import Dict, List, Optional, Any, Tuple, Union
+
+METADATA_PROJECTION = {"messages": 0, "summary": 0}
+# Os mesmos campos de METADATA_PROJECTION, em forma de inclusão para combinar com messages_slice
+METADATA_FIELDS = ["title", "description", "user_id", "project_id", "last_message_at", "message_count", "summary_seq"]
+LIST_PROJECTION = {"title": 1, "description": 1, "project_id": 1, "last_message_at": 1}
+# Mais recentes primeiro; _id desempata e torna a ordem estável para o cursor
+LIST_SORT = [("last_message_at", DESCENDING), ("_id", DESCENDING)]
+
+def encode_cursor(doc: dict) -> str:
+    last = doc.get("last_message_at")
+    payload = {"t": last.isoformat() if last else None, "id": str(doc.get("_id") or doc["id"])}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], ObjectId]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        last = datetime.fromisoformat(payload["t"]) if payload["t"] else None
+        return last, ObjectId(payload["id"])
+    except (ValueError, KeyError, TypeError, InvalidId) as e:
+        raise ValueError("Cursor inválido") from e
+
+def messages_slice(start: Union[int, dict], before: Optional[int] = None, limit: Optional[int] = None, from_end: bool = False) -> dict:
+    """
+    Projeção que recorta o array embutido no próprio MongoDB: mensagens de seq
+    start (inteiro ou expressão) até antes de `before`, no máximo `limit`, as
+    últimas se `from_end`. `messages_start` traz o seq da primeira mensagem
+    devolvida. Chats sem o array continuam sem o campo.
+    """
+    size = {"$size": {"$ifNull": ["$messages", []]}}
+    end = size if before is None else {"$min": [before, size]}
+    if limit is not None:
+        if from_end:
+            start = {"$max": [start, {"$subtract": [end, limit]}]}
+        else:
+            end = {"$min": [end, {"$add": [start, limit]}]}
+    count = {"$subtract": [end, start]}
+    return {
+        "messages": {"$cond": [
+            {"$isArray": "$messages"},
+            {"$cond": [{"$gt": [count, 0]}, {"$slice": ["$messages", start, count]}, []]},
+            "$$REMOVE"
+        ]},
+        # Um inteiro solto na projeção seria lido como inclusão do campo
+        "messages_start": {"$literal": start} if isinstance(start, int) else start
+    }
 
 class ChatRepository:
+    INDEXES = {
+        "chats": [
+            IndexModel([("project_id", ASCENDING), ("last_message_at", DESCENDING), ("_id", DESCENDING)]),
+            IndexModel([("user_id", ASCENDING), ("project_id", ASCENDING), ("last_message_at", DESCENDING), ("_id", DESCENDING)]),
+        ],
+        "messages": [
+            IndexModel([("chat_id", ASCENDING), ("seq", ASCENDING)], unique=True),
+        ],
+    }
+
+    # Consultas representativas verificadas pelo explain() do gerenciador de índices
+    EXPLAIN_QUERIES = [
+        ("chats", {"project_id": "000000000000000000000000"}, LIST_SORT),
+        ("chats", {"user_id": "000000000000000000000000", "project_id": None}, LIST_SORT),
+        ("messages", {"chat_id": "000000000000000000000000", "seq": {"$gt": 0}}, [("seq", ASCENDING)]),
+    ]
+
     @staticmethod
-    def create(title: str, description: str, user_id: str, project_id: Optional[str] = None) -> dict:
+    def _uses_message_collection() -> bool:
+        return settings.CHAT_MESSAGE_STORAGE == "collection"
+
+    @staticmethod
+    async def create(title: str, description: str, user_id: str, project_id: Optional[str] = None) -> dict:
         chat_document = {
             "title": title, 
             "description": description, 
             "user_id": user_id,
             "project_id": project_id,
-            "messages": []
+            "last_message_at": datetime.now(timezone.utc),
         }
-        chats.insert_one(chat_document)
+        if ChatRepository._uses_message_collection():
+            chat_document["message_count"] = 0
+        else:
+            chat_document["messages"] = []
+        await chats.insert_one(chat_document)
         chat_document["id"] = str(chat_document.pop("_id"))
         return chat_document
 
     @staticmethod
-    def delete(chat_id: str, user_id: Optional[str] = None) -> bool:
+    async def delete(chat_id: str, user_id: Optional[str] = None) -> bool:
         query = {"_id": ObjectId(chat_id)}
         if user_id:
             query["user_id"] = user_id
-        result = chats.delete_one(query)
+        result = await chats.delete_one(query)
+        identity_map.evict("chats", chat_id)
+        if result.deleted_count > 0 and ChatRepository._uses_message_collection():
+            await messages.delete_many({"chat_id": chat_id})
         return result.deleted_count > 0
 
     @staticmethod
-    def get_history(chat_id: str, user_id: Optional[str] = None) -> Optional[List[dict]]:
+    async def get_history(
+        chat_id: str, 
+        user_id: Optional[str] = None,
+        after: Optional[int] = None,
+        before: Optional[int] = None,
+        limit: Optional[int] = None
+    ) -> Optional[List[dict]]:
         query = {"_id": ObjectId(chat_id)}
         if user_id:
             query["user_id"] = user_id
-        doc = chats.find_one(query, {"messages": 1})
-        return doc.get("messages") if doc else None
+
+        # Com cursor ou limite, as mensagens voltam com o seq para a próxima página
+        paginated = after is not None or before is not None or limit is not None
+        # Sem "after", a página é a mais recente (antes de "before", se houver)
+        from_end = after is None and limit is not None
+
+        # Paginando, só a faixa pedida do array embutido sai do banco
+        projection = messages_slice(after + 1 if after is not None else 0, before, limit, from_end) if paginated else {"messages": 1}
+        doc = await chats.find_one(query, projection)
+        if not doc:
+            return None
+        # Chats ainda não migrados continuam sendo lidos do array embutido
+        if "messages" in doc or not ChatRepository._uses_message_collection():
+            embedded = doc.get("messages")
+            if embedded is None or not paginated:
+                return embedded
+            start = doc.get("messages_start", 0)
+            return [{**m, "seq": start + i} for i, m in enumerate(embedded)]
+
+        message_query = {"chat_id": chat_id}
+        seq_range = {}
+        if after is not None:
+            seq_range["$gt"] = after
+        if before is not None:
+            seq_range["$lt"] = before
+        if seq_range:
+            message_query["seq"] = seq_range
+
+        projection = {"_id": 0, "chat_id": 0}
+        if not paginated:
+            projection["seq"] = 0
+
+        cursor = messages.find(message_query, projection).sort(
+            "seq", DESCENDING if from_end else ASCENDING
+        )
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        results = await cursor.to_list()
+        if from_end:
+            results.reverse()
+        return results
 
     @staticmethod
-    def get_by_id(chat_id: str, user_id: Optional[str] = None) -> Optional[dict]:
-        query = {"_id": ObjectId(chat_id)}
-        if user_id:
-            query["user_id"] = user_id
-        doc = chats.find_one(query)
+    async def get_metadata(chat_id: str) -> Optional[dict]:
+        # Só os campos de identificação e permissão; mensagens e resumo ficam de fora
+        cached = identity_map.lookup("chats", chat_id, "metadata")
+        if cached:
+            return cached
+
+        doc = await chats.find_one({"_id": ObjectId(chat_id)}, METADATA_PROJECTION)
         if doc:
             doc["id"] = str(doc.pop("_id"))
-        return doc
+        return identity_map.remember("chats", chat_id, doc, "metadata")
 
     @staticmethod
-    def list_by_user(user_id: str, project_id: Optional[str] = None) -> List[dict]:
+    def _list_query(user_id: str, project_id: Optional[str] = None) -> dict:
         if project_id:
-            query = {"project_id": project_id}
-        else:
-            query = {"user_id": user_id, "project_id": None}
-            
-        cursor = chats.find(query, {"title": 1, "description": 1, "project_id": 1})
+            return {"project_id": project_id}
+        return {"user_id": user_id, "project_id": None}
+
+    @staticmethod
+    async def list_by_user(user_id: str, project_id: Optional[str] = None) -> List[dict]:
+        cursor = chats.find(ChatRepository._list_query(user_id, project_id), LIST_PROJECTION).sort(LIST_SORT)
         results = []
-        for doc in cursor:
+        async for doc in cursor:
             doc["id"] = str(doc.pop("_id"))
             results.append(doc)
         return results
 
     @staticmethod
-    def add_message(chat_id: str, message: dict, user_id: Optional[str] = None) -> bool:
+    async def list_page(
+        user_id: str,
+        project_id: Optional[str] = None,
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[dict], Optional[str]]:
+        """
+        Página de conversas por atividade recente (keyset em last_message_at, _id).
+        Retorna os itens e o cursor da próxima página (None na última).
+        Levanta ValueError para um cursor malformado.
+        """
+        query = ChatRepository._list_query(user_id, project_id)
+        if cursor:
+            last, last_id = decode_cursor(cursor)
+            if last is None:
+                after = {"last_message_at": None, "_id": {"$lt": last_id}}
+            else:
+                # Conversas antigas sem last_message_at vêm depois de todas as datadas
+                after = {"$or": [
+                    {"last_message_at": {"$lt": last}},
+                    {"last_message_at": last, "_id": {"$lt": last_id}},
+                    {"last_message_at": None}
+                ]}
+            query = {"$and": [query, after]}
+
+        docs = await chats.find(query, LIST_PROJECTION).sort(LIST_SORT).limit(limit + 1).to_list()
+        next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+        results = []
+        for doc in docs[:limit]:
+            doc["id"] = str(doc.pop("_id"))
+            results.append(doc)
+        return results, next_cursor
+
+    @staticmethod
+    async def list_recent_by_projects(
+        user_id: str,
+        project_ids: List[str],
+        limit: int = 20
+    ) -> Dict[Optional[str], Tuple[List[dict], Optional[str]]]:
+        """
+        Primeira página de conversas de cada projeto e das conversas pessoais
+        (chave None) em uma única agregação. Os cursores retornados seguem o
+        mesmo formato de `list_page`.
+        """
+        fields = {field: f"${field}" for field in LIST_PROJECTION}
+        pipeline = [
+            {"$match": {"$or": [
+                {"project_id": {"$in": project_ids}},
+                {"user_id": user_id, "project_id": None}
+            ]}},
+            # $topN mantém só limit + 1 conversas por grupo durante o agrupamento
+            {"$group": {
+                "_id": "$project_id",
+                "chats": {"$topN": {
+                    "n": limit + 1,
+                    "sortBy": dict(LIST_SORT),
+                    "output": {"_id": "$_id", **fields}
+                }}
+            }}
+        ]
+
+        pages = {}
+        async for group in await chats.aggregate(pipeline):
+            docs = group["chats"]
+            next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+            for doc in docs:
+                doc["id"] = str(doc.pop("_id"))
+            pages[group["_id"]] = (docs[:limit], next_cursor)
+        return pages
+
+    @staticmethod
+    async def count_by_user(user_id: str, project_id: Optional[str] = None) -> int:
+        return await chats.count_documents(ChatRepository._list_query(user_id, project_id))
+
+    @staticmethod
+    async def add_message(chat_id: str, message: dict, user_id: Optional[str] = None) -> bool:
         query = {"_id": ObjectId(chat_id)}
         if user_id:
             query["user_id"] = user_id
-        result = chats.update_one(
+        identity_map.evict("chats", chat_id)
+
+        if ChatRepository._uses_message_collection():
+            # O contador do chat reserva o próximo seq; a mensagem vira um documento próprio.
+            # Um chat ainda com array embutido é migrado antes de receber a mensagem; se outra
+            # requisição ou o migrate_messages migrou antes, a próxima tentativa já encontra o contador
+            for _ in range(3):
+                doc = await chats.find_one_and_update(
+                    {**query, "messages": {"$exists": False}},
+                    {"$inc": {"message_count": 1}, "$set": {"last_message_at": datetime.now(timezone.utc)}},
+                    projection={"message_count": 1},
+                    return_document=ReturnDocument.AFTER
+                )
+                if doc:
+                    break
+                if not await chats.find_one(query, {"_id": 1}):
+                    return False
+                await ChatRepository.migrate_embedded_messages(chat_id)
+            else:
+                raise RuntimeError(f"Could not reserve a message seq for chat {chat_id}")
+            await messages.insert_one({**message, "chat_id": chat_id, "seq": doc["message_count"] - 1})
+            return True
+
+        result = await chats.update_one(
             query, 
-            {"$push": {"messages": message}}
+            {"$push": {"messages": message}, "$set": {"last_message_at": datetime.now(timezone.utc)}}
+        )
+        return result.modified_count > 0
+
+    @staticmethod
+    async def get_context(chat_id: str) -> Optional[dict]:
+        """
+        Tudo o que o envio de uma mensagem precisa do chat em uma única leitura:
+        {"chat": metadados (como get_metadata), "summary", "summary_seq",
+        "messages": mensagens ainda não incorporadas ao resumo (seq >=
+        summary_seq)}. None se o chat não existe. Os metadados também ficam no
+        mapa de identidade, então um get_metadata seguinte não lê de novo.
+        """
+        doc = identity_map.lookup("chats", chat_id, "context")
+        if doc is None:
+            projection = {
+                **{field: 1 for field in METADATA_FIELDS},
+                "summary": 1,
+                **messages_slice({"$ifNull": ["$summary_seq", 0]})
+            }
+            doc = await chats.find_one({"_id": ObjectId(chat_id)}, projection)
+            if not doc:
+                return None
+            doc["id"] = str(doc.pop("_id"))
+            doc.pop("messages_start", None)
+
+            if "messages" not in doc and ChatRepository._uses_message_collection():
+                doc["messages"] = await messages.find(
+                    {"chat_id": chat_id, "seq": {"$gte": doc.get("summary_seq") or 0}}, {"_id": 0, "chat_id": 0}
+                ).sort("seq", ASCENDING).to_list()
+            identity_map.remember("chats", chat_id, doc, "context")
+
+        history = doc.pop("messages", None) or []
+        summary = doc.pop("summary", None)
+        identity_map.remember("chats", chat_id, doc, "metadata")
+        return {"chat": doc, "summary": summary, "summary_seq": doc.get("summary_seq") or 0, "messages": history}
+
+    @staticmethod
+    async def update_summary(chat_id: str, summary: str, summary_seq: int) -> bool:
+        # Cada resumo cobre todas as mensagens antes de summary_seq; só grava se avança o atual
+        result = await chats.update_one(
+            {"_id": ObjectId(chat_id), "summary_seq": {"$not": {"$gte": summary_seq}}},
+            {"$set": {"summary": summary, "summary_seq": summary_seq}}
         )
+        identity_map.evict("chats", chat_id)
         return result.modified_count > 0
 
     @staticmethod
-    def update_title(chat_id: str, title: str, user_id: Optional[str] = None) -> bool:
+    async def migrate_embedded_messages(chat_id: str) -> Optional[int]:
+        doc = await chats.find_one({"_id": ObjectId(chat_id)}, {"messages": 1})
+        if not doc or "messages" not in doc:
+            return None
+
+        embedded = doc["messages"]
+        if embedded:
+            try:
+                await messages.insert_many(
+                    [{**m, "chat_id": chat_id, "seq": i} for i, m in enumerate(embedded)],
+                    ordered=False
+                )
+            except BulkWriteError as e:
+                # Reexecuções de uma migração interrompida encontram os seqs já copiados
+                if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                    raise
+
+        # Só remove o array se nenhuma mensagem nova foi adicionada durante a cópia
+        result = await chats.update_one(
+            {"_id": ObjectId(chat_id), "messages": {"$size": len(embedded)}},
+            {"$set": {"message_count": len(embedded)}, "$unset": {"messages": ""}}
+        )
+        identity_map.evict("chats", chat_id)
+        return len(embedded) if result.modified_count > 0 else None
+
+    @staticmethod
+    async def list_chats_with_embedded_messages() -> List[str]:
+        cursor = chats.find({"messages": {"$exists": True}}, {"_id": 1})
+        return [str(doc["_id"]) async for doc in cursor]
+
+    @staticmethod
+    async def update_title(chat_id: str, title: str, user_id: Optional[str] = None) -> bool:
         query = {"_id": ObjectId(chat_id)}
         if user_id:
             query["user_id"] = user_id
-        result = chats.update_one(
+        result = await chats.update_one(
             query, 
             {"$set": {"title": title}}
         )
+        if result.modified_count > 0:
+            identity_map.apply_set("chats", chat_id, {"title": title})
         return result.modified_count > 0
 
     @staticmethod
-    def update_description(chat_id: str, description: str, user_id: Optional[str] = None) -> bool:
+    async def update_description(chat_id: str, description: str, user_id: Optional[str] = None) -> bool:
         query = {"_id": ObjectId(chat_id)}
         if user_id:
             query["user_id"] = user_id
-        result = chats.update_one(
+        result = await chats.update_one(
             query, 
             {"$set": {"description": description}}
         )
+        if result.modified_count > 0:
+            identity_map.apply_set("chats", chat_id, {"description": description})
         return result.modified_count > 0
 
 chat_repository = ChatRepository()
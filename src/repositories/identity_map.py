@@ -0,0 +1,52 @@
+import copy
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+_identity_map: ContextVar[Optional[Dict[Tuple[str, str, str], dict]]] = ContextVar("identity_map", default=None)
+
+@contextmanager
+def identity_map_scope():
+    """
+    Abre um mapa de identidade para a requisição atual: documentos lidos por id
+    pelos repositórios são guardados aqui e reaproveitados nas próximas leituras
+    do mesmo documento. Escritas removem (ou atualizam) a entrada correspondente.
+    Fora de um escopo, lookup/remember/evict não fazem nada.
+    """
+    entries: Dict[Tuple[str, str, str], dict] = {}
+    token = _identity_map.set(entries)
+    try:
+        yield entries
+    finally:
+        # Tarefas em segundo plano criadas na requisição herdam o mesmo dict
+        entries.clear()
+        _identity_map.reset(token)
+
+def lookup(collection: str, doc_id: str, view: str = "full") -> Optional[dict]:
+    entries = _identity_map.get()
+    if entries is None:
+        return None
+    doc = entries.get((collection, doc_id, view))
+    return copy.deepcopy(doc) if doc is not None else None
+
+def remember(collection: str, doc_id: str, doc: Optional[dict], view: str = "full") -> Optional[dict]:
+    entries = _identity_map.get()
+    if entries is not None and doc is not None:
+        entries[(collection, doc_id, view)] = copy.deepcopy(doc)
+    return doc
+
+def apply_set(collection: str, doc_id: str, data: dict) -> None:
+    # Reflete um $set de campos de primeiro nível nas cópias já carregadas
+    entries = _identity_map.get()
+    if entries is None:
+        return
+    for (coll, key, _), doc in entries.items():
+        if coll == collection and key == doc_id:
+            doc.update(copy.deepcopy(data))
+
+def evict(collection: str, doc_id: str) -> None:
+    entries = _identity_map.get()
+    if entries is None:
+        return
+    for key in [k for k in entries if k[0] == collection and k[1] == doc_id]:
+        del entries[key]
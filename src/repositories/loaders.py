@@ -0,0 +1,49 @@
+import asyncio
+from typing import Dict, List, Optional, Set
+from src.repositories.user_repository import user_repository
+
+class UserLoader:
+    """
+    Agrupa as buscas de usuário feitas no mesmo ciclo do event loop em uma
+    única consulta `$in` (padrão DataLoader) e memoriza o resultado durante a
+    requisição. Uma instância por requisição, via `get_user_loader`.
+    """
+    def __init__(self):
+        self._results: Dict[str, asyncio.Future] = {}
+        self._queue: List[str] = []
+        # O event loop só guarda referências fracas às tarefas; sem isto um lote pode ser coletado no meio
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def load(self, user_id: str) -> Optional[dict]:
+        if user_id not in self._results:
+            loop = asyncio.get_running_loop()
+            self._results[user_id] = loop.create_future()
+            self._queue.append(user_id)
+            if len(self._queue) == 1:
+                loop.call_soon(self._schedule_dispatch)
+        return await self._results[user_id]
+
+    async def load_many(self, user_ids: List[str]) -> List[Optional[dict]]:
+        return await asyncio.gather(*(self.load(uid) for uid in user_ids))
+
+    def prime(self, user_id: str, user: dict) -> None:
+        if user_id not in self._results:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(user)
+            self._results[user_id] = future
+
+    def _schedule_dispatch(self) -> None:
+        task = asyncio.ensure_future(self._dispatch())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self):
+        batch, self._queue = self._queue, []
+        try:
+            found = await user_repository.get_many(batch)
+        except Exception as e:
+            for uid in batch:
+                self._results.pop(uid).set_exception(e)
+            return
+        for uid in batch:
+            self._results[uid].set_result(found.get(uid))
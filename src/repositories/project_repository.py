@@ -1,39 +1,99 @@
 from bson import ObjectId
-from src.db.session import projects
+from pymongo import ASCENDING, IndexModel
+from src.db.session import projects, project_members
+from src.core.config import settings
+from src.repositories import identity_map
 from typing import List, Optional
 
 class ProjectRepository:
+    INDEXES = {
+        "projects": [
+            IndexModel([("user_id", ASCENDING)]),
+            IndexModel([("members.user_id", ASCENDING)]),
+        ],
+        "project_members": [
+            # Cobre "projetos do usuário" sem tocar nos documentos
+            IndexModel([("user_id", ASCENDING), ("project_id", ASCENDING), ("role", ASCENDING)]),
+            IndexModel([("project_id", ASCENDING), ("user_id", ASCENDING)], unique=True),
+            IndexModel([("project_id", ASCENDING), ("email", ASCENDING)]),
+        ],
+    }
+
+    EXPLAIN_QUERIES = [
+        ("projects", {"$or": [
+            {"user_id": "000000000000000000000000"},
+            {"members.user_id": "000000000000000000000000"}
+        ]}, None),
+        ("project_members", {"user_id": "000000000000000000000000"}, None),
+    ]
+
     @staticmethod
-    def create(name: str, user_id: str, description: Optional[str] = None) -> dict:
+    async def create(name: str, user_id: str, description: Optional[str] = None) -> dict:
         project_document = {
             "name": name, 
             "description": description, 
             "user_id": user_id,
-            "members": []
+            "members": [],
+            "acl_version": 0
         }
-        projects.insert_one(project_document)
+        await projects.insert_one(project_document)
         project_document["id"] = str(project_document.pop("_id"))
+        await project_members.insert_one({
+            "user_id": user_id,
+            "project_id": project_document["id"],
+            "role": "owner"
+        })
         return project_document
 
     @staticmethod
-    def get_by_id(project_id: str) -> Optional[dict]:
-        doc = projects.find_one({"_id": ObjectId(project_id)})
+    async def _set_owner(project_id: str, new_owner_id: str) -> None:
+        await project_members.delete_many({"project_id": project_id, "role": "owner", "user_id": {"$ne": new_owner_id}})
+        await project_members.update_one(
+            {"project_id": project_id, "user_id": new_owner_id},
+            {"$set": {"role": "owner"}},
+            upsert=True
+        )
+
+    @staticmethod
+    async def get_by_id(project_id: str) -> Optional[dict]:
+        cached = identity_map.lookup("projects", project_id)
+        if cached:
+            return cached
+
+        doc = await projects.find_one({"_id": ObjectId(project_id)})
         if doc:
             doc["id"] = str(doc.pop("_id"))
             if "members" not in doc:
                 doc["members"] = []
-        return doc
+        return identity_map.remember("projects", project_id, doc)
 
     @staticmethod
-    def list_by_user(user_id: str) -> List[dict]:
-        cursor = projects.find({
-            "$or": [
-                {"user_id": user_id},
-                {"members.user_id": user_id}
-            ]
-        })
+    async def get_acl_version(project_id: str) -> Optional[int]:
+        # Incrementada a cada mudança de dono ou de membros; valida as ACLs em cache
+        cached = identity_map.lookup("projects", project_id)
+        if cached:
+            return cached.get("acl_version", 0)
+        doc = await projects.find_one({"_id": ObjectId(project_id)}, {"acl_version": 1})
+        return doc.get("acl_version", 0) if doc else None
+
+    @staticmethod
+    async def list_by_user(user_id: str) -> List[dict]:
+        if settings.PROJECT_MEMBERSHIP_LOOKUP == "collection":
+            # Varredura coberta pelo índice (user_id, project_id, role) e um único $in
+            memberships = project_members.find({"user_id": user_id}, {"_id": 0, "project_id": 1})
+            project_ids = [ObjectId(m["project_id"]) async for m in memberships]
+            if not project_ids:
+                return []
+            cursor = projects.find({"_id": {"$in": project_ids}})
+        else:
+            cursor = projects.find({
+                "$or": [
+                    {"user_id": user_id},
+                    {"members.user_id": user_id}
+                ]
+            })
         results = []
-        for doc in cursor:
+        async for doc in cursor:
             doc["id"] = str(doc.pop("_id"))
             if "members" not in doc:
                 doc["members"] = []
@@ -41,63 +101,152 @@ class ProjectRepository:
         return results
 
     @staticmethod
-    def delete(project_id: str) -> bool:
-        result = projects.delete_one({"_id": ObjectId(project_id)})
+    async def delete(project_id: str) -> bool:
+        result = await projects.delete_one({"_id": ObjectId(project_id)})
+        identity_map.evict("projects", project_id)
+        await project_members.delete_many({"project_id": project_id})
         return result.deleted_count > 0
 
     @staticmethod
-    def update(project_id: str, data: dict) -> bool:
-        result = projects.update_one(
+    async def update(project_id: str, data: dict) -> bool:
+        # Só nome/descrição (ProjectUpdate); a troca de dono passa por transfer_ownership
+        result = await projects.update_one(
             {"_id": ObjectId(project_id)}, 
             {"$set": data}
         )
+        if result.matched_count > 0:
+            identity_map.apply_set("projects", project_id, data)
         return result.matched_count > 0
 
     @staticmethod
-    def add_member(project_id: str, member_data: dict) -> bool:
-        result = projects.update_one(
-            {"_id": ObjectId(project_id)},
-            {"$push": {"members": member_data}}
+    def _managed_by(actor_id: str, owner_only: bool = False) -> dict:
+        # Pré-condição de autorização embutida no filtro: dono ou, se permitido, admin
+        if owner_only:
+            return {"user_id": actor_id}
+        return {"$or": [
+            {"user_id": actor_id},
+            {"members": {"$elemMatch": {"user_id": actor_id, "role": "admin"}}}
+        ]}
+
+    @staticmethod
+    async def add_member(project_id: str, member_data: dict, actor_id: Optional[str] = None) -> bool:
+        """
+        Com `actor_id`, só adiciona se o ator ainda pode gerenciar membros (dono
+        para novos admins) e o usuário não é dono nem membro, em uma única escrita.
+        """
+        query = {"_id": ObjectId(project_id)}
+        if actor_id:
+            new_user_id = member_data["user_id"]
+            query["$and"] = [
+                ProjectRepository._managed_by(actor_id, owner_only=member_data.get("role") == "admin"),
+                {"user_id": {"$ne": new_user_id}},
+                {"members.user_id": {"$ne": new_user_id}}
+            ]
+        result = await projects.update_one(
+            query,
+            {"$push": {"members": member_data}, "$inc": {"acl_version": 1}}
         )
+        identity_map.evict("projects", project_id)
+        if result.modified_count > 0:
+            await project_members.update_one(
+                {"project_id": project_id, "user_id": member_data["user_id"]},
+                {"$set": {"email": member_data.get("email"), "role": member_data.get("role", "member")}},
+                upsert=True
+            )
         return result.modified_count > 0
 
     @staticmethod
-    def update_member(project_id: str, email: str, update_data: dict) -> bool:
+    def _target_guard(actor_id: str, email: str, owner_only: bool) -> dict:
+        # Admins só alteram membros comuns; o dono altera qualquer um
+        if owner_only:
+            return {"user_id": actor_id}
+        return {"$or": [
+            {"user_id": actor_id},
+            {"$and": [
+                {"members": {"$elemMatch": {"user_id": actor_id, "role": "admin"}}},
+                {"members": {"$elemMatch": {"email": email, "role": {"$ne": "admin"}}}}
+            ]}
+        ]}
+
+    @staticmethod
+    async def update_member(project_id: str, email: str, update_data: dict, actor_id: Optional[str] = None) -> bool:
         set_op = {}
         for key, value in update_data.items():
             if key == "permissions":
                 for p_key, p_value in value.items():
-                    set_op[f"members.$.permissions.{p_key}"] = p_value
+                    set_op[f"members.$[target].permissions.{p_key}"] = p_value
             else:
-                set_op[f"members.$.{key}"] = value
+                set_op[f"members.$[target].{key}"] = value
 
-        result = projects.update_one(
-            {"_id": ObjectId(project_id), "members.email": email},
-            {"$set": set_op}
-        )
+        query = {"_id": ObjectId(project_id), "members.email": email}
+        if actor_id:
+            query.update(ProjectRepository._target_guard(actor_id, email, owner_only=update_data.get("role") == "admin"))
+
+        update = {"$inc": {"acl_version": 1}}
+        if set_op:
+            update["$set"] = set_op
+        result = await projects.update_one(query, update, array_filters=[{"target.email": email}])
+        identity_map.evict("projects", project_id)
+        if result.modified_count > 0 and "role" in update_data:
+            await project_members.update_one(
+                {"project_id": project_id, "email": email, "role": {"$ne": "owner"}},
+                {"$set": {"role": update_data["role"]}}
+            )
         return result.modified_count > 0
 
     @staticmethod
-    def remove_member(project_id: str, email: str) -> bool:
-        result = projects.update_one(
-            {"_id": ObjectId(project_id)},
-            {"$pull": {"members": {"email": email}}}
+    async def remove_member(project_id: str, email: str, actor_id: Optional[str] = None) -> bool:
+        query = {"_id": ObjectId(project_id), "members.email": email}
+        if actor_id:
+            query.update(ProjectRepository._target_guard(actor_id, email, owner_only=False))
+        result = await projects.update_one(
+            query,
+            {"$pull": {"members": {"email": email}}, "$inc": {"acl_version": 1}}
         )
+        identity_map.evict("projects", project_id)
+        if result.modified_count > 0:
+            # A linha do dono fica: na transferência o novo dono sai de members
+            await project_members.delete_one({"project_id": project_id, "email": email, "role": {"$ne": "owner"}})
         return result.modified_count > 0
 
     @staticmethod
-    def transfer_ownership(project_id: str, old_owner_id: str, new_owner_id: str, new_owner_email: str) -> bool:
-        
-        projects.update_one(
-            {"_id": ObjectId(project_id)},
-            {"$pull": {"members": {"user_id": new_owner_id}}}
-        )
+    async def transfer_ownership(
+        project_id: str,
+        old_owner_id: str,
+        new_owner_id: str,
+        new_owner_email: str,
+        old_owner_member: Optional[dict] = None
+    ) -> bool:
+        """
+        Troca o dono em uma única atualização com pipeline, condicionada a
+        `old_owner_id` ainda ser o dono: o novo dono sai de members e, se
+        informado, `old_owner_member` entra no lugar.
+        """
+        remaining = {"$filter": {
+            "input": {"$ifNull": ["$members", []]},
+            "cond": {"$ne": ["$$this.user_id", new_owner_id]}
+        }}
+        members = {"$concatArrays": [remaining, {"$literal": [old_owner_member]}]} if old_owner_member else remaining
 
-        projects.update_one(
-            {"_id": ObjectId(project_id)},
-            {"$set": {"user_id": new_owner_id}}
+        result = await projects.update_one(
+            {"_id": ObjectId(project_id), "user_id": old_owner_id},
+            [{"$set": {
+                "user_id": new_owner_id,
+                "members": members,
+                "acl_version": {"$add": [{"$ifNull": ["$acl_version", 0]}, 1]}
+            }}]
         )
-        
+        identity_map.evict("projects", project_id)
+        if result.modified_count == 0:
+            return False
+
+        await ProjectRepository._set_owner(project_id, new_owner_id)
+        if old_owner_member:
+            await project_members.update_one(
+                {"project_id": project_id, "user_id": old_owner_id},
+                {"$set": {"email": old_owner_member.get("email"), "role": old_owner_member.get("role", "member")}},
+                upsert=True
+            )
         return True
 
 project_repository = ProjectRepository()
@@ -0,0 +1,73 @@
+import hashlib
+from datetime import datetime, timezone
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel, ReturnDocument
+from src.db.session import sessions
+from typing import List, Optional
+
+def hash_token(refresh_token: str) -> str:
+    # Só o hash do refresh token é gravado; vazamentos do banco não expõem sessões
+    return hashlib.sha256(refresh_token.encode()).hexdigest()
+
+class SessionRepository:
+    INDEXES = {
+        "sessions": [
+            IndexModel([("token_hash", ASCENDING)], unique=True),
+            IndexModel([("user_id", ASCENDING)]),
+            # O MongoDB remove a sessão assim que expires_at passa
+            IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+        ],
+    }
+
+    EXPLAIN_QUERIES = [
+        ("sessions", {"token_hash": "0" * 64}, None),
+        ("sessions", {"user_id": "000000000000000000000000"}, None),
+    ]
+
+    @staticmethod
+    async def create(user_id: str, refresh_token: str, expires_at: datetime, device: Optional[dict] = None) -> str:
+        now = datetime.now(timezone.utc)
+        result = await sessions.insert_one({
+            "token_hash": hash_token(refresh_token),
+            "user_id": user_id,
+            "device": device or {},
+            "created_at": now,
+            "last_used_at": now,
+            "expires_at": expires_at
+        })
+        return str(result.inserted_id)
+
+    @staticmethod
+    async def use(refresh_token: str) -> Optional[dict]:
+        # O monitor de TTL roda a cada minuto; sessões vencidas são filtradas aqui
+        now = datetime.now(timezone.utc)
+        return await sessions.find_one_and_update(
+            {"token_hash": hash_token(refresh_token), "expires_at": {"$gt": now}},
+            {"$set": {"last_used_at": now}},
+            projection={"token_hash": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    @staticmethod
+    async def list_by_user(user_id: str) -> List[dict]:
+        cursor = sessions.find({"user_id": user_id}, {"token_hash": 0}).sort("last_used_at", -1)
+        results = []
+        async for doc in cursor:
+            doc["id"] = str(doc.pop("_id"))
+            results.append(doc)
+        return results
+
+    @staticmethod
+    async def revoke(refresh_token: str, user_id: Optional[str] = None) -> bool:
+        query = {"token_hash": hash_token(refresh_token)}
+        if user_id:
+            query["user_id"] = user_id
+        result = await sessions.delete_one(query)
+        return result.deleted_count > 0
+
+    @staticmethod
+    async def revoke_by_id(session_id: str, user_id: str) -> bool:
+        result = await sessions.delete_one({"_id": ObjectId(session_id), "user_id": user_id})
+        return result.deleted_count > 0
+
+session_repository = SessionRepository()
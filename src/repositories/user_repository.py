@@ -1,32 +1,149 @@
 from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import DuplicateKeyError
 from src.db.session import users
-from typing import Optional, Any
+from src.repositories import identity_map
+from src.core.cache import create_cache_backend
+from src.core.config import settings
+from typing import Dict, Iterable, List, Optional, Any, Tuple
+
+# Dados públicos do usuário; hash de senha e tokens nunca vão para o cache
+PROFILE_PROJECTION = {"senha": 0, "refreshToken": 0}
+# O array legado de refresh tokens fica de fora; seus tokens migram para sessions no primeiro uso
+USER_PROJECTION = {"refreshToken": 0}
+SUMMARY_PROJECTION = {"email": 1, "username": 1}
+
+def normalized_keys(user_data: dict) -> dict:
+    keys = {}
+    if user_data.get("email"):
+        keys["email_lower"] = user_data["email"].strip().lower()
+    if user_data.get("username"):
+        keys["username_lower"] = user_data["username"].strip().lower()
+    return keys
+
+def duplicate_field(error: DuplicateKeyError) -> Optional[str]:
+    # "email" ou "username", conforme o índice único que rejeitou a inserção
+    key_pattern = (error.details or {}).get("keyPattern") or {}
+    for field in ("email", "username"):
+        if f"{field}_lower" in key_pattern or f"{field}_lower" in str(error):
+            return field
+    return None
+
+user_cache = create_cache_backend("users", settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL_SECONDS)
 
 class UserRepository:
+    INDEXES = {
+        "users": [
+            IndexModel([("email", ASCENDING)]),
+            IndexModel([("username", ASCENDING)]),
+            # Unicidade sem diferenciar maiúsculas. Parcial para aceitar os usuários antigos
+            # cujo email/username colide com outro e não pôde ser normalizado; os demais são
+            # preenchidos por scripts.backfill_user_keys antes do deploy
+            IndexModel(
+                [("email_lower", ASCENDING)], unique=True, name="email_lower_unique",
+                partialFilterExpression={"email_lower": {"$exists": True}}
+            ),
+            IndexModel(
+                [("username_lower", ASCENDING)], unique=True, name="username_lower_unique",
+                partialFilterExpression={"username_lower": {"$exists": True}}
+            ),
+        ],
+    }
+
+    EXPLAIN_QUERIES = [
+        ("users", {"email_lower": "explain@example.com"}, None),
+    ]
+
+    @staticmethod
+    async def get_profile(user_id: str) -> Optional[dict]:
+        user = await user_cache.get(user_id)
+        if user is None:
+            user = await users.find_one({"_id": ObjectId(user_id)}, PROFILE_PROJECTION)
+            if user:
+                await user_cache.set(user_id, user)
+        return user
+
     @staticmethod
-    def get_by_id(user_id: str) -> Optional[dict]:
-        return users.find_one({"_id": ObjectId(user_id)})
+    async def get_many(user_ids: Iterable[str], projection: Optional[dict] = None) -> Dict[str, dict]:
+        object_ids = list({ObjectId(uid) for uid in user_ids if ObjectId.is_valid(uid)})
+        if not object_ids:
+            return {}
+        cursor = users.find({"_id": {"$in": object_ids}}, projection or SUMMARY_PROJECTION)
+        return {str(doc["_id"]): doc async for doc in cursor}
 
     @staticmethod
-    def get_by_email(email: str) -> Optional[dict]:
-        return users.find_one({"email": email})
+    async def get_by_id(user_id: str) -> Optional[dict]:
+        cached = identity_map.lookup("users", user_id)
+        if cached:
+            return cached
+        return identity_map.remember("users", user_id, await users.find_one({"_id": ObjectId(user_id)}, USER_PROJECTION))
 
     @staticmethod
-    def get_by_username(username: str) -> Optional[dict]:
-        return users.find_one({"username": username})
+    async def get_by_email(email: str) -> Optional[dict]:
+        # Mesma normalização do índice único: "Ana@X.com" e "ana@x.com" são o mesmo usuário.
+        # Usuários que o backfill deixou sem email_lower (conflitos) ainda são achados pelo email exato
+        user = await users.find_one({"email_lower": email.strip().lower()})
+        if user is None:
+            user = await users.find_one({"email": email})
+        return user
 
     @staticmethod
-    def create(user_data: dict) -> str:
-        result = users.insert_one(user_data)
+    async def create(user_data: dict) -> str:
+        """
+        Insere o usuário com as chaves normalizadas. Email ou username já
+        usados levantam DuplicateKeyError (veja `duplicate_field`).
+        """
+        user_data = {**user_data, **normalized_keys(user_data)}
+        result = await users.insert_one(user_data)
         return str(result.inserted_id)
 
     @staticmethod
-    def update_refresh_tokens(user_id: str, refresh_token: str, push: bool = True) -> bool:
-        op = "$push" if push else "$pull"
-        result = users.update_one(
+    async def take_legacy_refresh_token(user_id: str, refresh_token: str) -> bool:
+        """
+        Remove o token do array legado `refreshToken`, se estiver lá. Só um
+        chamador consegue retirar cada token, então a migração para a coleção
+        sessions acontece uma única vez.
+        """
+        result = await users.update_one(
+            {"_id": ObjectId(user_id), "refreshToken": refresh_token},
+            {"$pull": {"refreshToken": refresh_token}}
+        )
+        return result.modified_count > 0
+
+    @staticmethod
+    async def backfill_normalized_keys() -> Tuple[int, List[tuple]]:
+        """
+        Preenche email_lower/username_lower nos usuários que ainda não os têm e
+        devolve (usuários visitados, conflitos). Um conflito é um valor que,
+        sem diferenciar maiúsculas, já pertence a outro usuário; o campo fica
+        ausente e o valor continua bloqueado para novos cadastros pelo outro.
+        Idempotente; depois da primeira execução não encontra nada para fazer.
+        """
+        visited = 0
+        conflicts = []
+        query = {"$or": [{"email_lower": {"$exists": False}}, {"username_lower": {"$exists": False}}]}
+        async for user in users.find(query, {"email": 1, "username": 1}):
+            # Campo a campo: um conflito no username não impede normalizar o email
+            for field, value in normalized_keys(user).items():
+                try:
+                    await users.update_one({"_id": user["_id"], field: {"$exists": False}}, {"$set": {field: value}})
+                except DuplicateKeyError:
+                    conflicts.append((str(user["_id"]), field, value))
+            visited += 1
+        return visited, conflicts
+
+    @staticmethod
+    async def invalidate(user_id: str) -> None:
+        identity_map.evict("users", user_id)
+        await user_cache.delete(user_id)
+
+    @staticmethod
+    async def update_password_hash(user_id: str, hashed_password: str) -> bool:
+        result = await users.update_one(
             {"_id": ObjectId(user_id)},
-            {op: {"refreshToken": refresh_token}}
+            {"$set": {"senha": hashed_password}}
         )
+        await UserRepository.invalidate(user_id)
         return result.modified_count > 0
 
 user_repository = UserRepository()
@@ -1,3 +1,4 @@
+from datetime import datetime
 from pydantic import BaseModel
 from typing import List, Optional
 from src.models.ai import AIModel, AIPersona
@@ -25,3 +26,14 @@ class ChatResponse(BaseModel):
     title: str
     description: str
     messages: List[Message]
+
+class ConversationSummary(BaseModel):
+    id: str
+    title: str
+    description: Optional[str] = None
+    project_id: Optional[str] = None
+    last_message_at: Optional[datetime] = None
+
+class ConversationPage(BaseModel):
+    conversations: List[ConversationSummary] = []
+    next_cursor: Optional[str] = None
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, EmailStr
 from typing import List, Optional
+from src.schemas.chat import ConversationPage
 
 class ProjectPermissions(BaseModel):
     send_messages: bool = True
@@ -33,6 +34,13 @@ class ProjectResponse(ProjectBase):
     owner_username: Optional[str] = None
     members: List[ProjectMember] = []
 
+class ProjectBootstrap(ProjectResponse):
+    conversations: ConversationPage = ConversationPage()
+
+class BootstrapResponse(BaseModel):
+    projects: List[ProjectBootstrap] = []
+    personal: ConversationPage = ConversationPage()
+
 class MemberAddRequest(BaseModel):
     email: EmailStr
     role: str = "member"
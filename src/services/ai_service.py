@@ -113,4 +113,34 @@ class AIService:
                     logger.error(f"Error generating description: {e}")
                     return "Nova conversa"
 
+    async def generate_summary(self, previous_summary: Optional[str], transcript: str) -> Optional[str]:
+        content = f"Transcrição:\n{transcript}"
+        if previous_summary:
+            content = f"Resumo anterior:\n{previous_summary}\n\n{content}"
+
+        messages = [
+            {"role": "system", "content": "Você é um assistente encarregado de resumir conversas. Atualize o resumo anterior incorporando a transcrição, preservando personagens, enredo, decisões tomadas e pedidos em aberto do usuário. Responda apenas com o resumo."},
+            {"role": "user", "content": content}
+        ]
+
+        max_retries = 3
+        retry_delay = 1
+
+        for attempt in range(max_retries):
+            try:
+                completion = await self.client.chat.completions.create(
+                    model=AIModel.GEMMA_4.value,
+                    messages=messages,
+                    max_tokens=settings.SUMMARY_MAX_TOKENS
+                )
+                return completion.choices[0].message.content.strip()
+            except Exception as e:
+                if self._is_retryable(e) and attempt < max_retries - 1:
+                    logger.warning(f"Retryable error in generate_summary (attempt {attempt + 1}): {e}")
+                    await asyncio.sleep(retry_delay * (attempt + 1))
+                    continue
+                else:
+                    logger.error(f"Error generating summary: {e}")
+                    return None
+
 ai_service = AIService()
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional
+from bson import ObjectId
+from src.core.config import settings
+from src.repositories.analytics_repository import analytics_repository
+
+logger = logging.getLogger(__name__)
+
+class ClickBuffer:
+    """
+    Fila em memória entre o /analytics/track-click e o banco. O endpoint só
+    enfileira (`offer`) e responde; uma tarefa em segundo plano grava os cliques
+    em lotes de até `batch_size`, ou o que houver a cada `flush_interval`
+    segundos. A fila é limitada a `max_size`: cheia, `offer` recusa o clique e
+    o endpoint responde 503. `stop` grava o que restou na fila.
+    """
+    def __init__(
+        self,
+        writer: Callable[[List[dict]], Awaitable[None]],
+        max_size: int,
+        batch_size: int,
+        flush_interval: float,
+        max_retries: int = 3
+    ):
+        self.writer = writer
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.accepted = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_flush_ms = 0.0
+        self.last_lag_ms = 0.0
+
+    def offer(self, click: dict) -> bool:
+        # O _id é gerado aqui para que reenviar um lote parcialmente gravado não duplique cliques
+        click.setdefault("_id", ObjectId())
+        try:
+            self._queue.put_nowait((time.monotonic(), click))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self.accepted += 1
+        return True
+
+    def _drain(self, batch: list) -> None:
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                return
+
+    async def _collect(self) -> list:
+        # Espera no máximo flush_interval pelo primeiro clique, para notar o stop()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        batch = []
+        while len(batch) < self.batch_size:
+            self._drain(batch)
+            remaining = deadline - loop.time()
+            if len(batch) >= self.batch_size or remaining <= 0 or self._closing:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _flush(self, batch: list) -> None:
+        clicks = [click for _, click in batch]
+        started = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.writer(clicks)
+                break
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logger.error(f"Dropping {len(clicks)} clicks after {attempt + 1} failed writes: {e}")
+                    self.failed += len(clicks)
+                    return
+                logger.warning(f"Retryable error writing clicks (attempt {attempt + 1}): {e}")
+                await asyncio.sleep(0.1 * 2 ** attempt)
+
+        finished = time.monotonic()
+        self.written += len(clicks)
+        self.batches += 1
+        self.last_flush_ms = (finished - started) * 1000
+        self.last_lag_ms = (finished - batch[0][0]) * 1000
+
+    async def _run(self) -> None:
+        while not self._closing:
+            batch = await self._collect()
+            if batch:
+                await self._flush(batch)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self._closing = True
+        if self._task is not None:
+            await self._task
+            self._task = None
+        while not self._queue.empty():
+            batch = []
+            self._drain(batch)
+            await self._flush(batch)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "max_size": self.max_size,
+            "accepted": self.accepted,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "last_lag_ms": round(self.last_lag_ms, 2)
+        }
+
+async def write_clicks(clicks: List[dict]) -> None:
+    # Reenviar o lote não duplica cliques e só aplica as etapas de contagem que ainda estão pendentes.
+    # Com a contagem pausada (scripts.rebuild_analytics), os cliques ficam para scripts.count_pending_clicks.
+    await analytics_repository.save_clicks(clicks)
+    if not await analytics_repository.counting_paused():
+        await analytics_repository.count_clicks([click["_id"] for click in clicks])
+
+click_buffer = ClickBuffer(
+    write_clicks,
+    max_size=settings.ANALYTICS_BUFFER_SIZE,
+    batch_size=settings.ANALYTICS_BATCH_SIZE,
+    flush_interval=settings.ANALYTICS_FLUSH_INTERVAL_SECONDS
+)
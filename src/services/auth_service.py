@@ -1,70 +1,119 @@
-from typing import Optional, Dict, Any
-from src.repositories.user_repository import user_repository
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, List
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from src.core.config import settings
+from src.repositories.user_repository import duplicate_field, user_repository
+from src.repositories.session_repository import session_repository
 from src.core.security import (
-    get_password_hash, 
-    verify_password, 
+    get_password_hash_async, 
+    verify_password_async, 
+    password_needs_rehash,
     create_access_token, 
     create_refresh_token,
-    decode_token
+    decode_token,
+    decode_token_cached
 )
 
 class AuthService:
     @staticmethod
-    def register_user(email: str, password: str, username: str) -> Dict[str, Any]:
-        if user_repository.get_by_email(email):
+    async def register_user(email: str, password: str, username: str) -> Dict[str, Any]:
+        # Uma única inserção: os índices únicos de email/username decidem os duplicados
+        hashed_password = await get_password_hash_async(password)
+        try:
+            user_id = await user_repository.create({
+                "email": email,
+                "senha": hashed_password,
+                "username": username
+            })
+        except DuplicateKeyError as e:
+            if duplicate_field(e) == "username":
+                return {"success": False, "message": "Username already exists."}
             return {"success": False, "message": "Email already exists."}
         
-        if user_repository.get_by_username(username):
-            return {"success": False, "message": "Username already exists."}
-        
-        hashed_password = get_password_hash(password)
-        user_id = user_repository.create({
-            "email": email,
-            "senha": hashed_password,
-            "username": username,
-            "refreshToken": []
-        })
-        
         return {"success": True, "message": "User created successfully.", "user_id": user_id}
 
     @staticmethod
-    def login(email: str, password: str) -> Dict[str, Optional[str]]:
-        user = user_repository.get_by_email(email)
-        if not user or not verify_password(password, user["senha"]):
+    async def login(email: str, password: str, device: Optional[dict] = None) -> Dict[str, Optional[str]]:
+        user = await user_repository.get_by_email(email)
+        if not user or not await verify_password_async(password, user["senha"]):
             return {"token": None, "refresh_token": None}
         
         user_id = str(user["_id"])
         username = user["username"]
         email = user["email"]
+
+        # Hashes gerados com parâmetros antigos são atualizados enquanto temos a senha em mãos
+        if password_needs_rehash(user["senha"]):
+            await user_repository.update_password_hash(user_id, await get_password_hash_async(password))
         
         access_token = create_access_token(user_id, username, email)
         refresh_token = create_refresh_token(user_id)
         
-        user_repository.update_refresh_tokens(user_id, refresh_token, push=True)
+        expires_at = datetime.now(timezone.utc) + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+        await session_repository.create(user_id, refresh_token, expires_at, device)
         
         return {"token": access_token, "refresh_token": refresh_token}
 
     @staticmethod
-    def logout(user_id: str, refresh_token: str) -> bool:
-        return user_repository.update_refresh_tokens(user_id, refresh_token, push=False)
+    async def logout(user_id: str, refresh_token: str) -> bool:
+        if await session_repository.revoke(refresh_token, user_id):
+            return True
+        # Token emitido antes da coleção sessions e ainda não migrado
+        return ObjectId.is_valid(user_id) and await user_repository.take_legacy_refresh_token(user_id, refresh_token)
 
     @staticmethod
-    def refresh_access_token(refresh_token: str) -> Optional[str]:
+    async def migrate_legacy_session(user_id: str, refresh_token: str, payload: dict) -> None:
+        """
+        Move para a coleção sessions um refresh token que ainda está no array
+        legado do usuário, para que quem já estava logado antes da migração
+        continue logado.
+        """
+        if not ObjectId.is_valid(user_id) or "exp" not in payload:
+            return
+        if not await user_repository.take_legacy_refresh_token(user_id, refresh_token):
+            return
+        try:
+            expires_at = datetime.fromtimestamp(payload["exp"], timezone.utc)
+            await session_repository.create(user_id, refresh_token, expires_at, {"migrated": True})
+        except DuplicateKeyError:
+            # scripts.migrate_sessions já criou a sessão deste token
+            pass
+
+    @staticmethod
+    async def refresh_access_token(refresh_token: str) -> Optional[str]:
         payload = decode_token(refresh_token)
         if not payload:
             return None
         
         user_id = payload.get("user_id")
-        user = user_repository.get_by_id(user_id)
-        
-        if not user or refresh_token not in user.get("refreshToken", []):
+        session = await session_repository.use(refresh_token)
+        if not session:
+            # Sem sessão: pode ser um token legado, migrado aqui ou por outra requisição ao mesmo tempo
+            await AuthService.migrate_legacy_session(user_id, refresh_token, payload)
+            session = await session_repository.use(refresh_token)
+        if not session or session["user_id"] != user_id:
+            return None
+
+        user = await user_repository.get_by_id(user_id)
+        if not user:
             return None
         
         return create_access_token(user_id, user["username"], user["email"])
 
+    @staticmethod
+    async def list_sessions(user_id: str) -> List[Dict[str, Any]]:
+        return await session_repository.list_by_user(user_id)
+
+    @staticmethod
+    async def revoke_session(user_id: str, session_id: str) -> bool:
+        if not ObjectId.is_valid(session_id):
+            return False
+        return await session_repository.revoke_by_id(session_id, user_id)
+
     @staticmethod
     def validate_jwt(token: str) -> Optional[str]:
-        payload = decode_token(token)
+        payload = decode_token_cached(token)
         return payload.get("user_id") if payload else None
 
 auth_service = AuthService()
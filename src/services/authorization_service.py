@@ -0,0 +1,48 @@
+from typing import Dict, Optional
+from src.core.cache import TTLCache
+from src.core.config import settings
+from src.models.permissions import OWNER_PERMISSIONS, ProjectPermission
+from src.repositories.project_repository import project_repository
+
+acl_cache = TTLCache(settings.ACL_CACHE_SIZE, settings.ACL_CACHE_TTL_SECONDS)
+
+class AuthorizationService:
+    @staticmethod
+    def compile_acl(project: dict) -> Dict[str, int]:
+        acl = {m["user_id"]: int(ProjectPermission.for_member(m)) for m in project.get("members", [])}
+        acl[project["user_id"]] = int(OWNER_PERMISSIONS)
+        return acl
+
+    @staticmethod
+    async def get_acl(project_id: str, project: Optional[dict] = None) -> Optional[Dict[str, int]]:
+        # Com a ACL em cache, basta ler a acl_version do projeto para validá-la
+        version = project.get("acl_version", 0) if project else await project_repository.get_acl_version(project_id)
+        if version is None:
+            return None
+
+        acl = acl_cache.get((project_id, version))
+        if acl is None:
+            project = project or await project_repository.get_by_id(project_id)
+            if not project:
+                return None
+            acl = AuthorizationService.compile_acl(project)
+            acl_cache.set((project_id, project.get("acl_version", 0)), acl)
+        return acl
+
+    @staticmethod
+    async def permissions(project_id: str, user_id: str, project: Optional[dict] = None) -> Optional[ProjectPermission]:
+        """
+        Permissões do usuário no projeto: None se o projeto não existe e uma
+        máscara vazia se o usuário não é dono nem membro.
+        """
+        acl = await AuthorizationService.get_acl(project_id, project)
+        if acl is None:
+            return None
+        return ProjectPermission(acl.get(user_id, 0))
+
+    @staticmethod
+    async def authorize(project_id: str, user_id: str, permission: ProjectPermission, project: Optional[dict] = None) -> bool:
+        granted = await AuthorizationService.permissions(project_id, user_id, project)
+        return bool(granted) and permission in granted
+
+authorization_service = AuthorizationService()
@@ -0,0 +1,102 @@
+import re
+from functools import lru_cache
+from typing import List, Optional
+from src.core.config import settings
+from src.models.ai import AIModel
+
+# Aproximação dos tokens BPE por palavras e pontuação, sem depender do tokenizer de cada provedor
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+MESSAGE_OVERHEAD_TOKENS = 4
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    return (len(TOKEN_PATTERN.findall(text)) * 4 + 2) // 3
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    if count_tokens(text) <= max_tokens:
+        return text
+    # Mantém o final do texto, onde o raciocínio chega às conclusões
+    matches = list(TOKEN_PATTERN.finditer(text))
+    keep = max(1, max_tokens * 3 // 4)
+    return text[matches[-keep].start():]
+
+class ContextService:
+    def budget(self, model: AIModel) -> int:
+        window = model.info["context_window"] - settings.CONTEXT_RESPONSE_RESERVE_TOKENS
+        return max(0, min(settings.CONTEXT_MAX_TOKENS, window))
+
+    def prepare_message(self, message: dict) -> dict:
+        prepared = {"role": message["role"], "content": message.get("content") or ""}
+        reasoning = message.get("reasoning")
+        if reasoning and settings.CONTEXT_REASONING_TOKENS > 0:
+            prepared["reasoning"] = truncate_tokens(reasoning, settings.CONTEXT_REASONING_TOKENS)
+        return prepared
+
+    def message_tokens(self, message: dict) -> int:
+        return (
+            MESSAGE_OVERHEAD_TOKENS 
+            + count_tokens(message["content"]) 
+            + count_tokens(message.get("reasoning", ""))
+        )
+
+    def format_transcript(self, messages: List[dict]) -> str:
+        speakers = {"user": "Usuário", "assistant": "Assistente"}
+        return "\n\n".join(
+            f"{speakers.get(m['role'], m['role'])}: {m.get('content') or ''}" for m in messages
+        )
+
+    def transcript_chunk(self, messages: List[dict], max_tokens: int) -> List[dict]:
+        # Maior prefixo cuja transcrição cabe em max_tokens; sempre ao menos uma mensagem
+        used = 0
+        for i, message in enumerate(messages):
+            used += count_tokens(self.format_transcript([message]))
+            if used > max_tokens:
+                return messages[:max(i, 1)]
+        return messages
+
+    def build(
+        self, 
+        history: List[dict], 
+        model: AIModel, 
+        system_prompt: str = "", 
+        summary: Optional[str] = None
+    ) -> List[dict]:
+        if not history:
+            return []
+
+        prepared = [self.prepare_message(m) for m in history]
+        remaining = self.budget(model) - MESSAGE_OVERHEAD_TOKENS - count_tokens(system_prompt)
+
+        head = []
+        if summary:
+            summary_message = {"role": "system", "content": f"Resumo da conversa até aqui:\n{summary}"}
+            remaining -= self.message_tokens(summary_message)
+            head.append(summary_message)
+
+        # A última mensagem (o prompt atual) sempre vai, mesmo acima do orçamento
+        latest = prepared[-1]
+        remaining -= self.message_tokens(latest)
+
+        pinned = []
+        if settings.CONTEXT_STRATEGY == "keep_first_last":
+            for message in prepared[:min(settings.CONTEXT_KEEP_FIRST, len(prepared) - 1)]:
+                tokens = self.message_tokens(message)
+                if tokens > remaining:
+                    break
+                pinned.append(message)
+                remaining -= tokens
+
+        recent = []
+        for message in reversed(prepared[len(pinned):-1]):
+            tokens = self.message_tokens(message)
+            if tokens > remaining:
+                break
+            recent.append(message)
+            remaining -= tokens
+        recent.reverse()
+
+        return head + pinned + recent + [latest]
+
+context_service = ContextService()
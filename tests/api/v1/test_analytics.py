@@ -0,0 +1,176 @@
+from fastapi.testclient import TestClient
+import json
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, MagicMock, patch
+from main import app
+from src.api.deps import get_current_user_id
+from src.api.v1.endpoints.analytics import EXPORT_BATCH_SIZE
+from src.repositories.analytics_repository import bucket_start
+
+client = TestClient(app)
+
+def override_get_current_user_id():
+    return "60d5ecb54f1a2c001f8e4e1a"
+
+app.dependency_overrides[get_current_user_id] = override_get_current_user_id
+
+def click_batches(*batches):
+    async def iterate(*args, **kwargs):
+        for batch in batches:
+            yield batch
+    return MagicMock(side_effect=iterate)
+
+CLICKS = [
+    {"elementId": "cta", "variant": "A", "email": "a@test.com", "timestamp": datetime(2024, 1, 1, 10)},
+    {"elementId": "cta", "variant": "B", "email": None, "timestamp": datetime(2024, 1, 1, 11)}
+]
+
+class TestAnalyticsEndpoints:
+    @patch("src.api.v1.endpoints.analytics.click_buffer")
+    def test_track_click_enqueues(self, mock_buffer):
+        mock_buffer.offer.return_value = True
+
+        response = client.post("/api/v1/analytics/track-click", json={"elementId": "cta", "variant": "A"})
+
+        assert response.status_code == 201
+        assert response.json() == {"status": "tracked"}
+        click = mock_buffer.offer.call_args.args[0]
+        assert click["elementId"] == "cta"
+        assert click["timestamp"] is not None
+
+    @patch("src.api.v1.endpoints.analytics.datetime")
+    @patch("src.api.v1.endpoints.analytics.click_buffer")
+    def test_track_click_stamps_utc_on_non_utc_host(self, mock_buffer, mock_datetime):
+        # Servidor em UTC-3: 22:30 do dia 5 na hora local já é dia 6 em UTC
+        now = datetime(2024, 3, 6, 1, 30, tzinfo=timezone.utc)
+        local = timezone(timedelta(hours=-3))
+        mock_datetime.now.side_effect = lambda tz=None: now.astimezone(tz) if tz else now.astimezone(local).replace(tzinfo=None)
+        mock_buffer.offer.return_value = True
+
+        client.post("/api/v1/analytics/track-click", json={"elementId": "cta", "variant": "A"})
+
+        timestamp = mock_buffer.offer.call_args.args[0]["timestamp"]
+        assert timestamp == now
+        assert bucket_start(timestamp, "day") == datetime(2024, 3, 6)
+        assert bucket_start(timestamp, "hour") == datetime(2024, 3, 6, 1)
+
+    @patch("src.api.v1.endpoints.analytics.click_buffer")
+    def test_track_click_buffer_full(self, mock_buffer):
+        mock_buffer.offer.return_value = False
+
+        response = client.post("/api/v1/analytics/track-click", json={"elementId": "cta", "variant": "A"})
+
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+    @patch("src.api.v1.endpoints.analytics.analytics_repository", new_callable=AsyncMock)
+    def test_timeseries(self, mock_repo):
+        mock_repo.get_timeseries.return_value = [
+            {"variant": "A", "elementId": "cta", "points": [{"bucket": datetime(2024, 1, 1, 10), "count": 3}]}
+        ]
+
+        response = client.get("/api/v1/analytics/timeseries", params={
+            "from": "2024-01-01T00:00:00", "to": "2024-01-08T00:00:00", "granularity": "hour", "variant": "A"
+        })
+
+        assert response.status_code == 200
+        assert response.json()["series"][0]["points"] == [{"bucket": "2024-01-01T10:00:00", "count": 3}]
+        mock_repo.get_timeseries.assert_called_once_with(
+            "hour", datetime(2024, 1, 1), datetime(2024, 1, 8), "A", None
+        )
+
+    @patch("src.api.v1.endpoints.analytics.analytics_repository", new_callable=AsyncMock)
+    def test_timeseries_converts_timezones(self, mock_repo):
+        mock_repo.get_timeseries.return_value = []
+
+        response = client.get("/api/v1/analytics/timeseries", params={
+            "from": "2024-01-01T00:00:00-03:00", "to": "2024-01-02T00:00:00Z", "granularity": "day"
+        })
+
+        assert response.status_code == 200
+        mock_repo.get_timeseries.assert_called_once_with("day", datetime(2024, 1, 1, 3), datetime(2024, 1, 2), None, None)
+
+    def test_timeseries_rejects_too_many_buckets(self):
+        response = client.get("/api/v1/analytics/timeseries", params={
+            "from": "2024-01-01T00:00:00", "to": "2024-02-01T00:00:00", "granularity": "minute"
+        })
+
+        assert response.status_code == 400
+
+    def test_timeseries_rejects_inverted_range(self):
+        response = client.get("/api/v1/analytics/timeseries", params={
+            "from": "2024-01-02T00:00:00", "to": "2024-01-01T00:00:00"
+        })
+
+        assert response.status_code == 400
+
+    def test_timeseries_rejects_unknown_granularity(self):
+        response = client.get("/api/v1/analytics/timeseries", params={"from": "2024-01-01T00:00:00", "granularity": "week"})
+
+        assert response.status_code == 422
+
+    @patch("src.api.v1.endpoints.analytics.analytics_repository", new_callable=AsyncMock)
+    def test_list_emails(self, mock_repo):
+        mock_repo.list_emails.return_value = ([{"email": "a@test.com"}], "a@test.com")
+
+        response = client.get("/api/v1/analytics/emails", params={"variant": "A", "elementId": "cta", "limit": 1})
+
+        assert response.status_code == 200
+        assert response.json() == {"emails": [{"email": "a@test.com"}], "next_cursor": "a@test.com"}
+        mock_repo.list_emails.assert_called_once_with("A", "cta", 1, None)
+
+    def test_list_emails_requires_element(self):
+        response = client.get("/api/v1/analytics/emails", params={"variant": "A"})
+
+        assert response.status_code == 422
+
+    @patch("src.api.v1.endpoints.analytics.analytics_repository")
+    def test_raw_json(self, mock_repo):
+        mock_repo.iter_clicks = click_batches(CLICKS[:1], CLICKS[1:])
+
+        response = client.get("/api/v1/analytics/raw")
+
+        assert response.status_code == 200
+        assert response.json() == {"data": [
+            {"elementId": "cta", "variant": "A", "email": "a@test.com", "timestamp": "2024-01-01T10:00:00"},
+            {"elementId": "cta", "variant": "B", "email": None, "timestamp": "2024-01-01T11:00:00"}
+        ]}
+
+    @patch("src.api.v1.endpoints.analytics.analytics_repository")
+    def test_raw_json_empty(self, mock_repo):
+        mock_repo.iter_clicks = click_batches()
+
+        response = client.get("/api/v1/analytics/raw")
+
+        assert response.json() == {"data": []}
+
+    @patch("src.api.v1.endpoints.analytics.analytics_repository")
+    def test_raw_ndjson_with_filters(self, mock_repo):
+        mock_repo.iter_clicks = click_batches(CLICKS)
+
+        response = client.get("/api/v1/analytics/raw", params={
+            "format": "ndjson", "from": "2024-01-01T00:00:00Z", "to": "2024-01-02T00:00:00Z", "variant": "A", "elementId": "cta"
+        })
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = response.text.splitlines()
+        assert len(lines) == 2
+        assert json.loads(lines[0])["email"] == "a@test.com"
+        mock_repo.iter_clicks.assert_called_once_with(
+            datetime(2024, 1, 1), datetime(2024, 1, 2), "A", "cta", batch_size=EXPORT_BATCH_SIZE
+        )
+
+    @patch("src.api.v1.endpoints.analytics.analytics_repository")
+    def test_raw_csv(self, mock_repo):
+        mock_repo.iter_clicks = click_batches(CLICKS[:1], CLICKS[1:])
+
+        response = client.get("/api/v1/analytics/raw", params={"format": "csv"})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        assert response.text.splitlines() == [
+            "timestamp,variant,elementId,email",
+            "2024-01-01T10:00:00,A,cta,a@test.com",
+            "2024-01-01T11:00:00,B,cta,"
+        ]
@@ -1,11 +1,11 @@
 from fastapi.testclient import TestClient
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 from main import app
 
 client = TestClient(app)
 
 class TestAuthEndpoints:
-    @patch("src.api.v1.endpoints.auth.auth_service")
+    @patch("src.api.v1.endpoints.auth.auth_service", new_callable=AsyncMock)
     def test_login_success(self, mock_auth_service):
         mock_auth_service.login.return_value = {
             "token": "fake_access_token",
@@ -22,7 +22,7 @@ class TestAuthEndpoints:
         assert "refresh_token" in response.cookies
         assert response.cookies["refresh_token"] == "fake_refresh_token"
 
-    @patch("src.api.v1.endpoints.auth.auth_service")
+    @patch("src.api.v1.endpoints.auth.auth_service", new_callable=AsyncMock)
     def test_login_failure(self, mock_auth_service):
         mock_auth_service.login.return_value = {
             "token": None,
@@ -37,7 +37,7 @@ class TestAuthEndpoints:
         assert response.status_code == 401
         assert response.json()["detail"] == "E-mail ou senha inválidos."
 
-    @patch("src.api.v1.endpoints.auth.auth_service")
+    @patch("src.api.v1.endpoints.auth.auth_service", new_callable=AsyncMock)
     def test_register_success(self, mock_auth_service):
         mock_auth_service.register_user.return_value = {
             "success": True,
@@ -53,7 +53,7 @@ class TestAuthEndpoints:
         assert response.status_code == 201
         assert response.json() == {"detail": "User created successfully."}
 
-    @patch("src.api.v1.endpoints.auth.auth_service")
+    @patch("src.api.v1.endpoints.auth.auth_service", new_callable=AsyncMock)
     def test_register_failure(self, mock_auth_service):
         mock_auth_service.register_user.return_value = {
             "success": False,
@@ -67,3 +67,34 @@ class TestAuthEndpoints:
         
         assert response.status_code == 400
         assert response.json()["detail"] == "Email already exists."
+
+    @patch("src.api.v1.endpoints.auth.auth_service", new_callable=AsyncMock)
+    def test_login_records_device(self, mock_auth_service):
+        mock_auth_service.login.return_value = {"token": "t", "refresh_token": "r"}
+
+        client.post(
+            "/api/v1/auth/login",
+            json={"email": "test@test.com", "password": "password123"},
+            headers={"User-Agent": "pytest-agent"}
+        )
+
+        device = mock_auth_service.login.call_args[0][2]
+        assert device["user_agent"] == "pytest-agent"
+
+    @patch("src.api.v1.endpoints.auth.auth_service", new_callable=AsyncMock)
+    def test_revoke_unknown_session(self, mock_auth_service):
+        from src.api.deps import get_current_user_id
+        previous_override = app.dependency_overrides.get(get_current_user_id)
+        app.dependency_overrides[get_current_user_id] = lambda: "user123"
+        mock_auth_service.revoke_session.return_value = False
+
+        try:
+            response = client.delete("/api/v1/auth/sessions/60d5ecb54f1a2c001f8e4e1a")
+        finally:
+            if previous_override:
+                app.dependency_overrides[get_current_user_id] = previous_override
+            else:
+                del app.dependency_overrides[get_current_user_id]
+
+        assert response.status_code == 404
+        mock_auth_service.revoke_session.assert_called_once_with("user123", "60d5ecb54f1a2c001f8e4e1a")
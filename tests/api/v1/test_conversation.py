@@ -1,7 +1,17 @@
+import asyncio
+import json
+import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 from main import app
 from src.api.deps import get_current_user_id
+from src.api.v1.endpoints.conversation import (
+    _background_tasks,
+    _compacting,
+    compact_conversation,
+    generate_response_and_store,
+    schedule_compaction
+)
 from src.models.ai import AIModel, AIPersona
 
 client = TestClient(app)
@@ -12,15 +22,17 @@ def override_get_current_user_id():
 app.dependency_overrides[get_current_user_id] = override_get_current_user_id
 
 class TestConversationEndpoints:
-    @patch("src.repositories.project_repository.project_repository")
-    @patch("src.api.v1.endpoints.conversation.chat_repository")
+    @patch("src.services.authorization_service.project_repository", new_callable=AsyncMock)
+    @patch("src.api.v1.endpoints.conversation.chat_repository", new_callable=AsyncMock)
     def test_create_conversation(self, mock_repo, mock_proj_repo):
         user_id = "60d5ecb54f1a2c001f8e4e1a"
         project_id = "60d5ecb54f1a2c001f8e4e1b"
+        mock_proj_repo.get_acl_version.return_value = 1
         mock_proj_repo.get_by_id.return_value = {
             "id": project_id,
             "user_id": user_id,
-            "members": []
+            "members": [],
+            "acl_version": 1
         }
         mock_repo.create.return_value = {
             "id": "123",
@@ -42,10 +54,10 @@ class TestConversationEndpoints:
             project_id=project_id
         )
 
-    @patch("src.api.v1.endpoints.conversation.chat_repository")
+    @patch("src.api.v1.endpoints.conversation.chat_repository", new_callable=AsyncMock)
     def test_get_conversation_found(self, mock_repo):
         user_id = "60d5ecb54f1a2c001f8e4e1a"
-        mock_repo.get_by_id.return_value = {
+        mock_repo.get_metadata.return_value = {
             "id": "123",
             "title": "Chat 123",
             "user_id": user_id
@@ -54,17 +66,19 @@ class TestConversationEndpoints:
         response = client.get("/api/v1/conversation/123")
         
         assert response.status_code == 200
-        mock_repo.get_by_id.assert_called_once_with("123")
+        mock_repo.get_metadata.assert_called_once_with("123")
 
-    @patch("src.repositories.project_repository.project_repository")
-    @patch("src.api.v1.endpoints.conversation.chat_repository")
+    @patch("src.services.authorization_service.project_repository", new_callable=AsyncMock)
+    @patch("src.api.v1.endpoints.conversation.chat_repository", new_callable=AsyncMock)
     def test_list_conversations_with_project(self, mock_repo, mock_proj_repo):
         user_id = "60d5ecb54f1a2c001f8e4e1a"
         project_id = "60d5ecb54f1a2c001f8e4e1b"
+        mock_proj_repo.get_acl_version.return_value = 1
         mock_proj_repo.get_by_id.return_value = {
             "id": project_id,
             "user_id": user_id,
-            "members": []
+            "members": [],
+            "acl_version": 1
         }
         mock_repo.list_by_user.return_value = []
         
@@ -73,10 +87,35 @@ class TestConversationEndpoints:
         assert response.status_code == 200
         mock_repo.list_by_user.assert_called_once_with(user_id, project_id)
 
-    @patch("src.api.v1.endpoints.conversation.chat_repository")
+    @patch("src.api.v1.endpoints.conversation.chat_repository", new_callable=AsyncMock)
+    def test_list_conversations_page(self, mock_repo):
+        user_id = "60d5ecb54f1a2c001f8e4e1a"
+        mock_repo.list_page.return_value = ([{"id": "c1", "title": "Chat"}], "next-token")
+        mock_repo.count_by_user.return_value = 41
+
+        response = client.get("/api/v1/conversation/?limit=1&cursor=abc&include_count=true")
+
+        assert response.status_code == 200
+        assert response.json() == {
+            "conversations": [{"id": "c1", "title": "Chat"}],
+            "next_cursor": "next-token",
+            "total": 41
+        }
+        mock_repo.list_page.assert_called_once_with(user_id, None, limit=1, cursor="abc")
+
+    @patch("src.api.v1.endpoints.conversation.chat_repository", new_callable=AsyncMock)
+    def test_list_conversations_bad_cursor(self, mock_repo):
+        mock_repo.list_page.side_effect = ValueError("Cursor inválido")
+
+        response = client.get("/api/v1/conversation/?cursor=bogus")
+
+        assert response.status_code == 400
+        mock_repo.count_by_user.assert_not_called()
+
+    @patch("src.api.v1.endpoints.conversation.chat_repository", new_callable=AsyncMock)
     def test_delete_conversation_success(self, mock_repo):
         user_id = "60d5ecb54f1a2c001f8e4e1a"
-        mock_repo.get_by_id.return_value = {"id": "123", "user_id": user_id}
+        mock_repo.get_metadata.return_value = {"id": "123", "user_id": user_id}
         mock_repo.delete.return_value = True
         
         response = client.delete("/api/v1/conversation/123")
@@ -84,11 +123,56 @@ class TestConversationEndpoints:
         assert response.status_code == 204
         mock_repo.delete.assert_called_once_with("123")
 
+    @patch("src.api.v1.endpoints.conversation.chat_repository", new_callable=AsyncMock)
+    def test_get_history_full(self, mock_repo):
+        user_id = "60d5ecb54f1a2c001f8e4e1a"
+        mock_repo.get_metadata.return_value = {"id": "123", "user_id": user_id}
+        mock_repo.get_history.return_value = [{"role": "user", "content": "hi"}]
+
+        response = client.get("/api/v1/conversation/history/123")
+
+        assert response.status_code == 200
+        assert response.json() == [{"role": "user", "content": "hi"}]
+        mock_repo.get_history.assert_called_once_with("123")
+
+    @patch("src.api.v1.endpoints.conversation.chat_repository", new_callable=AsyncMock)
+    def test_get_history_page(self, mock_repo):
+        user_id = "60d5ecb54f1a2c001f8e4e1a"
+        mock_repo.get_metadata.return_value = {"id": "123", "user_id": user_id}
+        mock_repo.get_history.return_value = [
+            {"role": "user", "content": "a", "seq": 7},
+            {"role": "assistant", "content": "b", "seq": 8},
+            {"role": "user", "content": "c", "seq": 9}
+        ]
+
+        response = client.get("/api/v1/conversation/history/123?before=10&limit=2")
+
+        assert response.status_code == 200
+        assert response.json()["has_more"] is True
+        assert [m["seq"] for m in response.json()["messages"]] == [8, 9]
+        mock_repo.get_history.assert_called_once_with("123", after=None, before=10, limit=3)
+
+    @patch("src.api.v1.endpoints.conversation.chat_repository", new_callable=AsyncMock)
+    def test_get_history_delta(self, mock_repo):
+        user_id = "60d5ecb54f1a2c001f8e4e1a"
+        mock_repo.get_metadata.return_value = {"id": "123", "user_id": user_id}
+        mock_repo.get_history.return_value = [{"role": "assistant", "content": "b", "seq": 8}]
+
+        response = client.get("/api/v1/conversation/history/123?after=7")
+
+        assert response.status_code == 200
+        assert response.json() == {
+            "messages": [{"role": "assistant", "content": "b", "seq": 8}],
+            "has_more": False
+        }
+        mock_repo.get_history.assert_called_once_with("123", after=7, before=None, limit=None)
+
     @patch("src.api.v1.endpoints.conversation.generate_response_and_store")
-    @patch("src.api.v1.endpoints.conversation.chat_repository")
+    @patch("src.api.v1.endpoints.conversation.chat_repository", new_callable=AsyncMock)
     def test_send_message_success(self, mock_repo, mock_gen):
         user_id = "60d5ecb54f1a2c001f8e4e1a"
-        mock_repo.get_by_id.return_value = {"id": "123", "user_id": user_id}
+        state = {"chat": {"id": "123", "user_id": user_id}, "summary": None, "summary_seq": 0, "messages": []}
+        mock_repo.get_context.return_value = state
         
         async def mock_generator(*args, **kwargs):
             yield '{"content": "hello"}\n'
@@ -105,11 +189,134 @@ class TestConversationEndpoints:
         )
         
         assert response.status_code == 200
-        mock_repo.get_by_id.assert_called_once_with("123")
+        mock_repo.get_context.assert_called_once_with("123")
+        mock_repo.get_metadata.assert_not_called()
         mock_gen.assert_called_once_with(
             "123", 
             "hi", 
             user_id,
             model=AIModel.GEMINI_3_FLASH,
-            persona=AIPersona.ROTEIRISTA
+            persona=AIPersona.ROTEIRISTA,
+            state=state
         )
+
+class TestConversationCompaction:
+    @pytest.mark.asyncio
+    @patch("src.api.v1.endpoints.conversation.settings")
+    @patch("src.api.v1.endpoints.conversation.ai_service")
+    @patch("src.api.v1.endpoints.conversation.chat_repository", new_callable=AsyncMock)
+    async def test_compact_conversation_folds_old_messages(self, mock_repo, mock_ai, mock_settings):
+        mock_settings.SUMMARY_KEEP_RECENT = 2
+        mock_ai.generate_summary = AsyncMock(return_value="Resumo novo")
+        messages = [{"role": "user", "content": str(i)} for i in range(5)]
+
+        await compact_conversation("123", "Resumo antigo", 10, messages)
+
+        mock_ai.generate_summary.assert_called_once_with(
+            "Resumo antigo", "Usuário: 0\n\nUsuário: 1\n\nUsuário: 2"
+        )
+        mock_repo.update_summary.assert_called_once_with("123", "Resumo novo", 13)
+
+    @pytest.mark.asyncio
+    @patch("src.api.v1.endpoints.conversation.context_service.budget", return_value=20)
+    @patch("src.api.v1.endpoints.conversation.settings")
+    @patch("src.api.v1.endpoints.conversation.ai_service")
+    @patch("src.api.v1.endpoints.conversation.chat_repository", new_callable=AsyncMock)
+    async def test_compact_conversation_folds_in_budget_sized_chunks(self, mock_repo, mock_ai, mock_settings, mock_budget):
+        mock_settings.SUMMARY_KEEP_RECENT = 1
+        mock_ai.generate_summary = AsyncMock(side_effect=["Resumo 1", "Resumo 2"])
+        # Cada mensagem tem ~9 tokens: duas cabem no orçamento de 20, a terceira vai na próxima parte
+        messages = [{"role": "user", "content": f"mensagem número {i} um dois"} for i in range(4)]
+
+        await compact_conversation("123", "Resumo antigo", 10, messages)
+
+        first, second = mock_ai.generate_summary.call_args_list
+        assert first.args == ("Resumo antigo", "Usuário: mensagem número 0 um dois\n\nUsuário: mensagem número 1 um dois")
+        assert second.args == ("Resumo 1", "Usuário: mensagem número 2 um dois")
+        assert [c.args for c in mock_repo.update_summary.call_args_list] == [
+            ("123", "Resumo 1", 12),
+            ("123", "Resumo 2", 13)
+        ]
+
+    @pytest.mark.asyncio
+    @patch("src.api.v1.endpoints.conversation.context_service.budget", return_value=20)
+    @patch("src.api.v1.endpoints.conversation.settings")
+    @patch("src.api.v1.endpoints.conversation.ai_service")
+    @patch("src.api.v1.endpoints.conversation.chat_repository", new_callable=AsyncMock)
+    async def test_compact_conversation_stops_when_summary_moved(self, mock_repo, mock_ai, mock_settings, mock_budget):
+        mock_settings.SUMMARY_KEEP_RECENT = 0
+        mock_ai.generate_summary = AsyncMock(return_value="Resumo")
+        mock_repo.update_summary.return_value = False
+        messages = [{"role": "user", "content": f"mensagem número {i} um dois"} for i in range(4)]
+
+        await compact_conversation("123", None, 0, messages)
+
+        mock_ai.generate_summary.assert_called_once()
+
+    @pytest.mark.asyncio
+    @patch("src.api.v1.endpoints.conversation.settings")
+    @patch("src.api.v1.endpoints.conversation.ai_service")
+    @patch("src.api.v1.endpoints.conversation.chat_repository", new_callable=AsyncMock)
+    async def test_schedule_compaction_runs_once_per_chat(self, mock_repo, mock_ai, mock_settings):
+        mock_settings.SUMMARY_KEEP_RECENT = 2
+        mock_ai.generate_summary = AsyncMock(return_value="Resumo")
+        messages = [{"role": "user", "content": str(i)} for i in range(5)]
+
+        schedule_compaction("123", None, 0, messages)
+        schedule_compaction("123", None, 0, messages + [{"role": "assistant", "content": "5"}])
+        await asyncio.gather(*_background_tasks)
+
+        mock_ai.generate_summary.assert_called_once()
+        assert "123" not in _compacting
+
+    @pytest.mark.asyncio
+    @patch("src.api.v1.endpoints.conversation.settings")
+    @patch("src.api.v1.endpoints.conversation.ai_service")
+    @patch("src.api.v1.endpoints.conversation.chat_repository", new_callable=AsyncMock)
+    async def test_compact_conversation_keeps_summary_on_failure(self, mock_repo, mock_ai, mock_settings):
+        mock_settings.SUMMARY_KEEP_RECENT = 2
+        mock_ai.generate_summary = AsyncMock(return_value=None)
+
+        await compact_conversation("123", None, 0, [{"role": "user", "content": str(i)} for i in range(5)])
+
+        mock_repo.update_summary.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch("src.api.v1.endpoints.conversation.ai_service")
+    @patch("src.api.v1.endpoints.conversation.chat_repository", new_callable=AsyncMock)
+    async def test_generate_response_reports_unsaved_message(self, mock_repo, mock_ai):
+        mock_repo.add_message.return_value = False
+
+        chunks = [c async for c in generate_response_and_store(
+            "123", "prompt", "user", AIModel.GEMINI_3_FLASH, AIPersona.ROTEIRISTA,
+            state={"summary": None, "summary_seq": 0, "messages": []}
+        )]
+
+        assert len(chunks) == 1
+        assert "a mensagem não foi salva" in json.loads(chunks[0])["content"]
+        mock_ai.generate_response_stream.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch("src.api.v1.endpoints.conversation.ai_service")
+    @patch("src.api.v1.endpoints.conversation.chat_repository", new_callable=AsyncMock)
+    async def test_generate_response_reads_only_unsummarized_messages(self, mock_repo, mock_ai):
+        mock_repo.get_context.return_value = {
+            "summary": "Resumo", "summary_seq": 30, "messages": [{"role": "assistant", "content": "recente"}]
+        }
+
+        async def mock_stream(*args, **kwargs):
+            yield {"role": "assistant", "content": "oi", "reasoning": ""}
+
+        mock_ai.generate_response_stream.side_effect = mock_stream
+
+        chunks = [c async for c in generate_response_and_store(
+            "123", "prompt", "user", AIModel.GEMINI_3_FLASH, AIPersona.ROTEIRISTA
+        )]
+
+        assert len(chunks) == 1
+        mock_repo.get_context.assert_called_once_with("123")
+        mock_repo.get_history.assert_not_called()
+        context = mock_ai.generate_response_stream.call_args[0][0]
+        assert context[0]["content"] == "Resumo da conversa até aqui:\nResumo"
+        assert [m["content"] for m in context[1:]] == ["recente", "prompt"]
+        mock_ai.generate_description.assert_not_called()
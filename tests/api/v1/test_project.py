@@ -1,7 +1,9 @@
 from fastapi.testclient import TestClient
-from unittest.mock import patch
+from unittest.mock import AsyncMock, MagicMock, patch
+from bson import ObjectId
+from tests.helpers import mock_collection
 from main import app
-from src.api.deps import get_current_user_id
+from src.api.deps import get_current_user_id, get_current_user
 
 client = TestClient(app)
 
@@ -11,7 +13,7 @@ def override_get_current_user_id():
 app.dependency_overrides[get_current_user_id] = override_get_current_user_id
 
 class TestProjectEndpoints:
-    @patch("src.api.v1.endpoints.project.project_repository")
+    @patch("src.api.v1.endpoints.project.project_repository", new_callable=AsyncMock)
     def test_create_project(self, mock_repo):
         user_id = "60d5ecb54f1a2c001f8e4e1a"
         mock_repo.create.return_value = {
@@ -34,21 +36,43 @@ class TestProjectEndpoints:
             description="Desc"
         )
 
-    @patch("src.api.v1.endpoints.project.project_repository")
-    def test_get_project_found(self, mock_repo):
+    @patch("src.repositories.loaders.user_repository", new_callable=AsyncMock)
+    @patch("src.api.v1.endpoints.project.project_repository", new_callable=AsyncMock)
+    def test_get_project_found(self, mock_repo, mock_loader_user_repo):
         user_id = "60d5ecb54f1a2c001f8e4e1a"
+        member_id = "60d5ecb54f1a2c001f8e4e1b"
+        previous_override = app.dependency_overrides.get(get_current_user)
+        app.dependency_overrides[get_current_user] = lambda: {
+            "id": user_id, "email": "owner@test.com", "username": "owner"
+        }
+        mock_loader_user_repo.get_many.return_value = {
+            member_id: {"_id": member_id, "email": "member@test.com", "username": "member"}
+        }
         mock_repo.get_by_id.return_value = {
             "id": "123",
             "name": "Project 123",
-            "user_id": user_id
+            "user_id": user_id,
+            "members": [{
+                "user_id": member_id, "email": "member@test.com", "role": "member",
+                "permissions": {}
+            }]
         }
         
         response = client.get("/api/v1/project/123")
         
         assert response.status_code == 200
         assert response.json()["name"] == "Project 123"
+        assert response.json()["owner_username"] == "owner"
+        assert response.json()["members"][0]["username"] == "member"
+        # O dono já veio do get_current_user; só o membro é buscado
+        mock_loader_user_repo.get_many.assert_called_once_with([member_id])
 
-    @patch("src.api.v1.endpoints.project.project_repository")
+        if previous_override:
+            app.dependency_overrides[get_current_user] = previous_override
+        else:
+            del app.dependency_overrides[get_current_user]
+
+    @patch("src.api.v1.endpoints.project.project_repository", new_callable=AsyncMock)
     def test_get_project_unauthorized(self, mock_repo):
         mock_repo.get_by_id.return_value = {
             "id": "123",
@@ -61,9 +85,13 @@ class TestProjectEndpoints:
         assert response.status_code == 404
         assert response.json()["detail"] == "Projeto não encontrado."
 
-    @patch("src.api.v1.endpoints.project.project_repository")
-    def test_list_projects(self, mock_repo):
+    @patch("src.repositories.loaders.user_repository", new_callable=AsyncMock)
+    @patch("src.api.v1.endpoints.project.project_repository", new_callable=AsyncMock)
+    def test_list_projects(self, mock_repo, mock_user_repo):
         user_id = "60d5ecb54f1a2c001f8e4e1a"
+        mock_user_repo.get_many.return_value = {
+            user_id: {"_id": user_id, "email": "owner@test.com", "username": "owner"}
+        }
         mock_repo.list_by_user.return_value = [
             {"id": "1", "name": "P1", "user_id": user_id},
             {"id": "2", "name": "P2", "user_id": user_id}
@@ -73,9 +101,39 @@ class TestProjectEndpoints:
         
         assert response.status_code == 200
         assert len(response.json()) == 2
+        assert response.json()[1]["owner_username"] == "owner"
         mock_repo.list_by_user.assert_called_once_with(user_id)
+        mock_user_repo.get_many.assert_called_once_with([user_id])
+
+    @patch("src.api.v1.endpoints.project.chat_repository", new_callable=AsyncMock)
+    @patch("src.repositories.loaders.user_repository", new_callable=AsyncMock)
+    @patch("src.api.v1.endpoints.project.project_repository", new_callable=AsyncMock)
+    def test_bootstrap(self, mock_repo, mock_user_repo, mock_chat_repo):
+        user_id = "60d5ecb54f1a2c001f8e4e1a"
+        mock_user_repo.get_many.return_value = {
+            user_id: {"_id": user_id, "email": "owner@test.com", "username": "owner"}
+        }
+        mock_repo.list_by_user.return_value = [
+            {"id": "1", "name": "P1", "user_id": user_id},
+            {"id": "2", "name": "P2", "user_id": user_id}
+        ]
+        mock_chat_repo.list_recent_by_projects.return_value = {
+            "1": ([{"id": "c1", "title": "Chat 1", "project_id": "1"}], "cursor-1"),
+            None: ([{"id": "c0", "title": "Pessoal"}], None)
+        }
+
+        response = client.get("/api/v1/project/bootstrap?limit=5")
 
-    @patch("src.api.v1.endpoints.project.project_repository")
+        assert response.status_code == 200
+        body = response.json()
+        assert body["projects"][0]["owner_username"] == "owner"
+        assert body["projects"][0]["conversations"]["next_cursor"] == "cursor-1"
+        assert body["projects"][1]["conversations"] == {"conversations": [], "next_cursor": None}
+        assert body["personal"]["conversations"][0]["id"] == "c0"
+        mock_chat_repo.list_recent_by_projects.assert_called_once_with(user_id, ["1", "2"], 5)
+        mock_repo.get_by_id.assert_not_called()
+
+    @patch("src.api.v1.endpoints.project.project_repository", new_callable=AsyncMock)
     def test_delete_project_success(self, mock_repo):
         user_id = "60d5ecb54f1a2c001f8e4e1a"
         mock_repo.get_by_id.return_value = {"id": "123", "user_id": user_id}
@@ -84,3 +142,18 @@ class TestProjectEndpoints:
         response = client.delete("/api/v1/project/123")
         
         assert response.status_code == 204
+
+    @patch("src.repositories.project_repository.projects", new_callable=mock_collection)
+    def test_update_project_reads_project_once(self, mock_projects):
+        user_id = "60d5ecb54f1a2c001f8e4e1a"
+        project_id = "60d5ecb54f1a2c001f8e4e1b"
+        mock_projects.find_one.return_value = {
+            "_id": ObjectId(project_id), "name": "Old", "user_id": user_id, "members": []
+        }
+        mock_projects.update_one.return_value = MagicMock(matched_count=1)
+
+        response = client.patch(f"/api/v1/project/{project_id}", json={"name": "New"})
+
+        assert response.status_code == 200
+        assert response.json()["name"] == "New"
+        mock_projects.find_one.assert_called_once()
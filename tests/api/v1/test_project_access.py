@@ -1,5 +1,5 @@
 from fastapi.testclient import TestClient
-from unittest.mock import patch, MagicMock
+from unittest.mock import ANY, AsyncMock, patch, MagicMock
 from main import app
 from src.api.deps import get_current_user_id, get_current_user
 
@@ -19,8 +19,8 @@ app.dependency_overrides[get_current_user_id] = override_get_current_user_id
 app.dependency_overrides[get_current_user] = override_get_current_user
 
 class TestProjectAccess:
-    @patch("src.api.v1.endpoints.project.project_repository")
-    @patch("src.api.v1.endpoints.project.user_repository")
+    @patch("src.api.v1.endpoints.project.project_repository", new_callable=AsyncMock)
+    @patch("src.api.v1.endpoints.project.user_repository", new_callable=AsyncMock)
     def test_add_member_as_owner(self, mock_user_repo, mock_project_repo):
         mock_project_repo.get_by_id.return_value = {
             "id": "project123",
@@ -42,8 +42,8 @@ class TestProjectAccess:
         assert response.json()["message"] == "Membro adicionado com sucesso"
         mock_project_repo.add_member.assert_called_once()
 
-    @patch("src.api.v1.endpoints.project.project_repository")
-    @patch("src.api.v1.endpoints.project.user_repository")
+    @patch("src.api.v1.endpoints.project.project_repository", new_callable=AsyncMock)
+    @patch("src.api.v1.endpoints.project.user_repository", new_callable=AsyncMock)
     def test_add_admin_as_owner(self, mock_user_repo, mock_project_repo):
         mock_project_repo.get_by_id.return_value = {
             "id": "project123",
@@ -64,11 +64,14 @@ class TestProjectAccess:
         mock_project_repo.add_member.assert_called_once()
         assert mock_project_repo.add_member.call_args[0][1]["role"] == "admin"
 
-    @patch("src.api.v1.endpoints.project.project_repository")
-    def test_add_member_as_admin_failure(self, mock_project_repo):
+    @patch("src.api.v1.endpoints.project.project_repository", new_callable=AsyncMock)
+    @patch("src.api.v1.endpoints.project.user_repository", new_callable=AsyncMock)
+    def test_add_member_as_admin_failure(self, mock_user_repo, mock_project_repo):
         def override_admin_user_id(): return ADMIN_ID
         app.dependency_overrides[get_current_user_id] = override_admin_user_id
         
+        mock_user_repo.get_by_email.return_value = {"_id": MEMBER_ID, "email": "member@example.com"}
+        mock_project_repo.add_member.return_value = False
         mock_project_repo.get_by_id.return_value = {
             "id": "project123",
             "user_id": OWNER_ID,
@@ -85,8 +88,8 @@ class TestProjectAccess:
         
         app.dependency_overrides[get_current_user_id] = override_get_current_user_id
 
-    @patch("src.api.v1.endpoints.project.project_repository")
-    @patch("src.api.v1.endpoints.project.user_repository")
+    @patch("src.api.v1.endpoints.project.project_repository", new_callable=AsyncMock)
+    @patch("src.api.v1.endpoints.project.user_repository", new_callable=AsyncMock)
     def test_transfer_ownership(self, mock_user_repo, mock_project_repo):
         mock_project_repo.get_by_id.return_value = {
             "id": "project123",
@@ -104,6 +107,66 @@ class TestProjectAccess:
         )
 
         assert response.status_code == 200
-        mock_project_repo.update.assert_called_with("project123", {"user_id": ADMIN_ID})
-        mock_project_repo.remove_member.assert_called_with("project123", "admin@example.com")
-        mock_project_repo.add_member.assert_called_once() # Adding old owner back as admin
+        mock_project_repo.transfer_ownership.assert_called_once_with(
+            "project123", OWNER_ID, ADMIN_ID, "admin@example.com",
+            {"user_id": OWNER_ID, "email": "owner@example.com", "role": "admin", "permissions": ANY}
+        )
+        mock_project_repo.get_by_id.assert_not_called()
+
+    @patch("src.api.v1.endpoints.project.project_repository", new_callable=AsyncMock)
+    @patch("src.api.v1.endpoints.project.user_repository", new_callable=AsyncMock)
+    def test_transfer_ownership_by_non_owner(self, mock_user_repo, mock_project_repo):
+        mock_project_repo.transfer_ownership.return_value = False
+        mock_project_repo.get_by_id.return_value = {
+            "id": "project123",
+            "user_id": ADMIN_ID,
+            "members": []
+        }
+        mock_user_repo.get_by_email.return_value = {"_id": MEMBER_ID, "email": "member@example.com"}
+
+        response = client.post(
+            "/api/v1/project/project123/transfer-ownership",
+            json={"new_owner_email": "member@example.com"}
+        )
+
+        assert response.status_code == 403
+        assert response.json()["detail"] == "Apenas o dono pode transferir a propriedade"
+
+    @patch("src.api.v1.endpoints.project.project_repository", new_callable=AsyncMock)
+    def test_remove_admin_as_admin_failure(self, mock_project_repo):
+        def override_admin_user_id(): return ADMIN_ID
+        app.dependency_overrides[get_current_user_id] = override_admin_user_id
+
+        mock_project_repo.remove_member.return_value = False
+        mock_project_repo.get_by_id.return_value = {
+            "id": "project123",
+            "user_id": OWNER_ID,
+            "members": [
+                {"user_id": ADMIN_ID, "email": "admin@example.com", "role": "admin"},
+                {"user_id": MEMBER_ID, "email": "other@example.com", "role": "admin"}
+            ]
+        }
+
+        response = client.delete("/api/v1/project/project123/members/other@example.com")
+
+        assert response.status_code == 403
+        assert response.json()["detail"] == "Admins não podem remover outros admins"
+        mock_project_repo.remove_member.assert_called_once_with("project123", "other@example.com", actor_id=ADMIN_ID)
+
+        app.dependency_overrides[get_current_user_id] = override_get_current_user_id
+
+    @patch("src.api.v1.endpoints.project.project_repository", new_callable=AsyncMock)
+    def test_update_member_concurrent_change(self, mock_project_repo):
+        mock_project_repo.update_member.return_value = False
+        mock_project_repo.get_by_id.return_value = {
+            "id": "project123",
+            "user_id": OWNER_ID,
+            "members": [{"user_id": MEMBER_ID, "email": "member@example.com", "role": "member"}]
+        }
+
+        response = client.put(
+            "/api/v1/project/project123/members/member@example.com",
+            json={"role": "admin"}
+        )
+
+        assert response.status_code == 409
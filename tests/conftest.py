@@ -18,3 +18,10 @@ import pytest
 @pytest.fixture(scope="session", autouse=True)
 def setup_test_env():
     pass
+
+@pytest.fixture(autouse=True)
+def clear_acl_cache():
+    # Os testes reutilizam ids de projeto com membros diferentes na mesma acl_version
+    from src.services.authorization_service import acl_cache
+    acl_cache.clear()
+    yield
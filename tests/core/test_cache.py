@@ -0,0 +1,102 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+from bson import ObjectId
+from src.core.cache import TTLCache, CacheBackend, MemoryCacheBackend, RedisCacheBackend, create_cache_backend
+
+class TestTTLCache:
+    def test_get_set_and_counters(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set("a", 1)
+
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.stats() == {"size": 1, "maxsize": 10, "hits": 1, "misses": 1}
+
+    def test_evicts_least_recently_used(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+
+    @patch("src.core.cache.time.monotonic")
+    def test_entry_expires(self, mock_monotonic):
+        mock_monotonic.return_value = 100.0
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set("short", 1, ttl=5)
+        cache.set("long", 2, ttl=600)
+
+        mock_monotonic.return_value = 106.0
+        assert cache.get("short") is None
+        assert cache.get("long") == 2
+
+        mock_monotonic.return_value = 161.0
+        assert cache.get("long") is None
+
+    def test_non_positive_ttl_is_not_stored(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set("expired", 1, ttl=-1)
+
+        assert cache.get("expired") is None
+        assert cache.stats()["size"] == 0
+
+class TestCacheBackends:
+    @pytest.mark.asyncio
+    async def test_memory_backend_returns_copies(self):
+        backend = MemoryCacheBackend(maxsize=10, ttl=60)
+        user = {"_id": ObjectId("60d5ecb54f1a2c001f8e4e1a"), "email": "a@test.com"}
+        await backend.set("u1", user)
+
+        cached = await backend.get("u1")
+        cached.pop("_id")
+
+        assert (await backend.get("u1")) == user
+        await backend.delete("u1")
+        assert await backend.get("u1") is None
+
+    @pytest.mark.asyncio
+    async def test_redis_backend_serializes_bson(self):
+        backend = RedisCacheBackend("redis://localhost:6379/0", ttl=60, prefix="cineai:users:")
+        backend._client = AsyncMock()
+        user = {"_id": ObjectId("60d5ecb54f1a2c001f8e4e1a"), "email": "a@test.com"}
+
+        await backend.set("u1", user)
+        key, raw = backend._client.set.call_args[0]
+        assert key == "cineai:users:u1"
+        assert backend._client.set.call_args.kwargs == {"ex": 60}
+
+        backend._client.get.return_value = raw
+        assert await backend.get("u1") == user
+        assert backend.stats()["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_redis_backend_errors_count_as_miss(self):
+        backend = RedisCacheBackend("redis://localhost:6379/0", ttl=60, prefix="cineai:users:")
+        backend._client = AsyncMock()
+        backend._client.get.side_effect = ConnectionError("down")
+
+        assert await backend.get("u1") is None
+        assert backend.stats() == {"backend": "redis", "hits": 0, "misses": 1, "errors": 1}
+
+    def test_backend_must_implement_interface(self):
+        class Incomplete(CacheBackend):
+            async def get(self, key):
+                return None
+
+        with pytest.raises(TypeError):
+            Incomplete()
+
+    @patch("src.core.cache.settings")
+    def test_create_cache_backend(self, mock_settings):
+        mock_settings.CACHE_BACKEND = "memory"
+        assert isinstance(create_cache_backend("users", 10, 60), MemoryCacheBackend)
+
+        mock_settings.CACHE_BACKEND = "redis"
+        mock_settings.CACHE_URL = "redis://localhost:6379/0"
+        backend = create_cache_backend("users", 10, 60)
+        assert isinstance(backend, RedisCacheBackend)
+        assert backend.prefix == "cineai:users:"
@@ -0,0 +1,48 @@
+from src.core.hyperloglog import HyperLogLog, REGISTERS, register_for
+
+class TestHyperLogLog:
+    def test_empty_sketch_counts_zero(self):
+        assert HyperLogLog().count() == 0
+
+    def test_register_for_is_deterministic(self):
+        index, rank = register_for("user@test.com")
+
+        assert register_for("user@test.com") == (index, rank)
+        assert 0 <= index < REGISTERS
+        assert rank >= 1
+
+    def test_duplicates_do_not_change_estimate(self):
+        sketch = HyperLogLog()
+        sketch.update(f"user{i}@test.com" for i in range(100))
+        before = sketch.count()
+
+        sketch.update(f"user{i}@test.com" for i in range(100))
+
+        assert sketch.count() == before
+        assert abs(before - 100) <= 2
+
+    def test_large_cardinality_within_error(self):
+        sketch = HyperLogLog()
+        sketch.update(f"user{i}@test.com" for i in range(50000))
+
+        assert abs(sketch.count() - 50000) / 50000 < 0.05
+
+    def test_merge_is_union(self):
+        first, second, union = HyperLogLog(), HyperLogLog(), HyperLogLog()
+        first.update(f"user{i}@test.com" for i in range(0, 6000))
+        second.update(f"user{i}@test.com" for i in range(4000, 10000))
+        union.update(f"user{i}@test.com" for i in range(0, 10000))
+
+        first.merge(second)
+
+        assert first.registers == union.registers
+
+    def test_document_round_trip(self):
+        sketch = HyperLogLog()
+        sketch.update(["a@test.com", "b@test.com"])
+
+        document = sketch.to_document()
+
+        assert all(isinstance(key, str) for key in document)
+        assert HyperLogLog.from_document(document).registers == sketch.registers
+        assert HyperLogLog.from_document(None).count() == 0
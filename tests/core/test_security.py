@@ -1,5 +1,13 @@
+import asyncio
+import threading
 import pytest
-from src.core.security import create_access_token, create_refresh_token, verify_password, get_password_hash, decode_token
+from unittest.mock import patch
+from argon2 import PasswordHasher
+from src.core.security import (
+    create_access_token, create_refresh_token, verify_password, get_password_hash, decode_token,
+    verify_password_async, get_password_hash_async, PasswordHashPool, password_needs_rehash,
+    decode_token_cached, token_cache
+)
 from src.core.config import settings
 
 def test_password_hashing():
@@ -33,3 +41,48 @@ def test_refresh_token():
 
 def test_decode_invalid_token():
     assert decode_token("invalid_token") is None
+
+@pytest.mark.asyncio
+async def test_password_hashing_async():
+    hashed = await get_password_hash_async("secret_password")
+    assert await verify_password_async("secret_password", hashed) is True
+    assert await verify_password_async("wrong_password", hashed) is False
+
+@pytest.mark.asyncio
+async def test_hash_pool_tracks_queue_depth():
+    pool = PasswordHashPool(max_workers=1)
+    release = threading.Event()
+    first = asyncio.ensure_future(pool.submit(release.wait))
+    second = asyncio.ensure_future(pool.submit(lambda: "done"))
+
+    while pool.stats()["running"] == 0:
+        await asyncio.sleep(0.01)
+    assert pool.stats() == {"max_workers": 1, "queued": 1, "running": 1}
+
+    release.set()
+    assert await second == "done"
+    await first
+    assert pool.stats() == {"max_workers": 1, "queued": 0, "running": 0}
+
+def test_password_needs_rehash():
+    stale = PasswordHasher(time_cost=1, memory_cost=8192, parallelism=1).hash("secret_password")
+    assert password_needs_rehash(stale) is True
+    assert password_needs_rehash(get_password_hash("secret_password")) is False
+    assert password_needs_rehash("not-a-hash") is False
+
+def test_decode_token_cached():
+    token_cache.clear()
+    token = create_access_token("12345", "testuser", "test@example.com")
+
+    with patch("src.core.security.decode_token", wraps=decode_token) as mock_decode:
+        first = decode_token_cached(token)
+        second = decode_token_cached(token)
+
+    assert first == second
+    assert first["user_id"] == "12345"
+    mock_decode.assert_called_once_with(token)
+
+def test_decode_token_cached_ignores_invalid_tokens():
+    token_cache.clear()
+    assert decode_token_cached("invalid_token") is None
+    assert token_cache.stats()["size"] == 0
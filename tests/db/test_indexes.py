@@ -0,0 +1,82 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from pymongo import ASCENDING, IndexModel
+from src.db.indexes import REPOSITORIES, IndexManager, plan_stages
+from tests.helpers import mock_collection, mock_cursor
+
+class FakeRepository:
+    INDEXES = {"items": [IndexModel([("owner_id", ASCENDING)])]}
+    EXPLAIN_QUERIES = [
+        ("items", {"owner_id": "1"}, None),
+        ("items", {"name": "x"}, [("name", ASCENDING)]),
+    ]
+
+def make_database(collection):
+    database = MagicMock()
+    database.__getitem__.return_value = collection
+    return database
+
+class TestPlanStages:
+    def test_collects_nested_stages(self):
+        plan = {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}
+        assert plan_stages(plan) == ["FETCH", "IXSCAN"]
+
+    def test_collects_or_branches(self):
+        plan = {"stage": "SUBPLAN", "inputStage": {"stage": "OR", "inputStages": [
+            {"stage": "IXSCAN"}, {"stage": "COLLSCAN"}
+        ]}}
+        assert "COLLSCAN" in plan_stages(plan)
+
+    def test_sbe_query_plan(self):
+        plan = {"queryPlan": {"stage": "COLLSCAN"}, "slotBasedPlan": {"slots": "..."}}
+        assert plan_stages(plan) == ["COLLSCAN"]
+
+class TestIndexManager:
+    def test_every_repository_declares_indexes_and_queries(self):
+        for repository in REPOSITORIES:
+            assert isinstance(repository.INDEXES, dict)
+            assert isinstance(repository.EXPLAIN_QUERIES, list)
+
+    def test_declared_indexes_cover_hot_lookups(self):
+        declared = IndexManager().declared_indexes()
+        keys = {
+            collection: [list(model.document["key"].keys()) for model in models]
+            for collection, models in declared.items()
+        }
+        assert ["email"] in keys["users"]
+        assert ["username"] in keys["users"]
+        assert ["user_id", "project_id", "last_message_at", "_id"] in keys["chats"]
+        assert ["project_id", "last_message_at", "_id"] in keys["chats"]
+        assert ["members.user_id"] in keys["projects"]
+        assert ["chat_id", "seq"] in keys["messages"]
+
+    @pytest.mark.asyncio
+    async def test_ensure_creates_declared_indexes(self):
+        collection = mock_collection()
+        collection.create_indexes = AsyncMock(return_value=["owner_id_1"])
+        manager = IndexManager(make_database(collection), [FakeRepository])
+
+        result = await manager.ensure()
+
+        assert result == {"items": ["owner_id_1"]}
+        collection.create_indexes.assert_awaited_once_with(FakeRepository.INDEXES["items"])
+
+    @pytest.mark.asyncio
+    async def test_explain_flags_collscan(self):
+        indexed = mock_cursor([])
+        indexed.explain = AsyncMock(return_value={
+            "queryPlanner": {"winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}}
+        })
+        scanned = mock_cursor([])
+        scanned.explain = AsyncMock(return_value={
+            "queryPlanner": {"winningPlan": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}}
+        })
+        collection = mock_collection()
+        collection.find.side_effect = [indexed, scanned]
+        manager = IndexManager(make_database(collection), [FakeRepository])
+
+        report = await manager.explain()
+
+        assert [entry["collscan"] for entry in report] == [False, True]
+        assert report[1]["stages"] == ["SORT", "COLLSCAN"]
+        scanned.sort.assert_called_once_with([("name", ASCENDING)])
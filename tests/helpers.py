@@ -0,0 +1,14 @@
+from unittest.mock import AsyncMock, MagicMock
+from pymongo.asynchronous.collection import AsyncCollection
+
+def mock_collection():
+    # find_one, update_one etc. viram AsyncMock; find continua síncrono como no pymongo
+    return MagicMock(spec=AsyncCollection)
+
+def mock_cursor(docs):
+    cursor = MagicMock()
+    cursor.sort.return_value = cursor
+    cursor.limit.return_value = cursor
+    cursor.to_list = AsyncMock(return_value=list(docs))
+    cursor.__aiter__.return_value = list(docs)
+    return cursor
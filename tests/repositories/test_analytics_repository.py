@@ -1,51 +1,279 @@
+import pytest
+from datetime import datetime, timedelta, timezone
 from unittest.mock import patch, MagicMock
-from src.repositories.analytics_repository import AnalyticsRepository
+from pymongo.errors import BulkWriteError
+from tests.helpers import mock_collection, mock_cursor
+from src.core.hyperloglog import register_for, HyperLogLog
+from src.repositories.analytics_repository import AnalyticsRepository, bucket_start
 
 class TestAnalyticsRepository:
-    @patch("src.repositories.analytics_repository.analytics")
-    def test_save_click(self, mock_analytics):
+    @pytest.mark.asyncio
+    @patch("src.repositories.analytics_repository.analytics", new_callable=mock_collection)
+    async def test_save_click(self, mock_analytics):
         mock_result = MagicMock()
         mock_result.acknowledged = True
         mock_analytics.insert_one.return_value = mock_result
         
         click_data = {"event": "click", "elementId": "button1"}
-        result = AnalyticsRepository.save_click(click_data)
+        result = await AnalyticsRepository.save_click(click_data)
         
         assert result is True
         mock_analytics.insert_one.assert_called_once_with(click_data)
 
-    @patch("src.repositories.analytics_repository.analytics")
-    def test_get_all_clicks(self, mock_analytics):
-        mock_cursor = [
-            {"event": "click", "elementId": "button1"},
-            {"event": "click", "elementId": "button2"}
+    @pytest.mark.asyncio
+    @patch("src.repositories.analytics_repository.analytics", new_callable=mock_collection)
+    async def test_iter_clicks_in_batches(self, mock_analytics):
+        mock_analytics.find.return_value = mock_cursor([{"elementId": str(i)} for i in range(5)])
+
+        batches = [batch async for batch in AnalyticsRepository.iter_clicks(batch_size=2)]
+
+        assert [len(batch) for batch in batches] == [2, 2, 1]
+        mock_analytics.find.assert_called_once_with({}, {"_id": 0, "pending": 0}, batch_size=2)
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.analytics_repository.analytics", new_callable=mock_collection)
+    async def test_iter_clicks_filters(self, mock_analytics):
+        mock_analytics.find.return_value = mock_cursor([])
+
+        batches = [batch async for batch in AnalyticsRepository.iter_clicks(
+            datetime(2024, 1, 1), datetime(2024, 2, 1), variant="A", element_id="btn"
+        )]
+
+        assert batches == []
+        query = mock_analytics.find.call_args.args[0]
+        assert query == {
+            "timestamp": {"$gte": datetime(2024, 1, 1), "$lt": datetime(2024, 2, 1)},
+            "variant": "A",
+            "elementId": "btn"
+        }
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.analytics_repository.analytics_counters", new_callable=mock_collection)
+    async def test_get_stats(self, mock_counters):
+        mock_counters.find.return_value = mock_cursor([
+            {"variant": "A", "elementId": "btn", "count": 3, "unique_emails": 2},
+            {"variant": "B", "elementId": "btn", "count": 1, "unique_emails": 0}
+        ])
+
+        result = await AnalyticsRepository.get_stats()
+
+        assert result["stats"] == [
+            {"_id": {"variant": "A", "elementId": "btn"}, "count": 3, "unique_emails": 2},
+            {"_id": {"variant": "B", "elementId": "btn"}, "count": 1, "unique_emails": 0}
         ]
-        mock_analytics.find.return_value = mock_cursor
-        
-        result = AnalyticsRepository.get_all_clicks()
-        
+        mock_counters.aggregate.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.analytics_repository.analytics_emails", new_callable=mock_collection)
+    async def test_list_emails(self, mock_emails):
+        mock_emails.find.return_value = mock_cursor([{"email": "a@test.com"}, {"email": "b@test.com"}, {"email": "c@test.com"}])
+
+        emails, next_cursor = await AnalyticsRepository.list_emails("A", "btn", 2, cursor="0@test.com")
+
+        assert emails == [{"email": "a@test.com"}, {"email": "b@test.com"}]
+        assert next_cursor == "b@test.com"
+        query = mock_emails.find.call_args.args[0]
+        assert query == {"variant": "A", "elementId": "btn", "email": {"$gt": "0@test.com"}}
+        mock_emails.find.return_value.limit.assert_called_once_with(3)
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.analytics_repository.analytics_emails", new_callable=mock_collection)
+    async def test_list_emails_last_page(self, mock_emails):
+        mock_emails.find.return_value = mock_cursor([{"email": "a@test.com"}])
+
+        emails, next_cursor = await AnalyticsRepository.list_emails("A", "btn", 2)
+
+        assert emails == [{"email": "a@test.com"}]
+        assert next_cursor is None
+        assert "email" not in mock_emails.find.call_args.args[0]
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.analytics_repository.analytics_emails", new_callable=mock_collection)
+    @patch("src.repositories.analytics_repository.analytics_counters", new_callable=mock_collection)
+    async def test_increment_counters(self, mock_counters, mock_emails):
+        first, last = datetime(2024, 1, 1, 10), datetime(2024, 1, 1, 11)
+        # Só o segundo email é novo para o elemento
+        mock_emails.bulk_write.return_value = MagicMock(upserted_ids={1: "id"})
+        clicks = [
+            {"variant": "A", "elementId": "btn", "email": "old@test.com", "timestamp": first},
+            {"variant": "A", "elementId": "btn", "email": "new@test.com", "timestamp": last},
+            {"variant": "A", "elementId": "btn", "email": "old@test.com", "timestamp": first},
+            {"variant": "B", "elementId": "btn", "email": None, "timestamp": first}
+        ]
+
+        await AnalyticsRepository.increment_counters(clicks)
+
+        email_ops = mock_emails.bulk_write.call_args.args[0]
+        assert [op._filter["email"] for op in email_ops] == ["old@test.com", "new@test.com"]
+        counter_ops = {op._filter["variant"]: op._doc for op in mock_counters.bulk_write.call_args.args[0]}
+        assert counter_ops["A"] == {"$inc": {"count": 3, "unique_emails": 1}, "$max": {"last_click_at": last}}
+        assert counter_ops["B"] == {"$inc": {"count": 1, "unique_emails": 0}, "$max": {"last_click_at": first}}
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.analytics_repository.analytics_emails", new_callable=mock_collection)
+    @patch("src.repositories.analytics_repository.analytics_counters", new_callable=mock_collection)
+    async def test_increment_counters_email_race(self, mock_counters, mock_emails):
+        # O primeiro email foi inserido por outro worker no meio do lote
+        mock_emails.bulk_write.side_effect = BulkWriteError({
+            "writeErrors": [{"index": 0, "code": 11000}],
+            "upserted": [{"index": 1, "_id": "id"}]
+        })
+        clicks = [
+            {"variant": "A", "elementId": "btn", "email": "a@test.com"},
+            {"variant": "A", "elementId": "btn", "email": "b@test.com"}
+        ]
+
+        await AnalyticsRepository.increment_counters(clicks)
+
+        op = mock_counters.bulk_write.call_args.args[0][0]
+        assert op._doc == {"$inc": {"count": 2, "unique_emails": 1}}
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.analytics_repository.analytics", new_callable=mock_collection)
+    async def test_save_clicks(self, mock_analytics):
+        clicks = [{"_id": 1, "elementId": "a"}, {"_id": 2, "elementId": "b"}]
+
+        assert await AnalyticsRepository.save_clicks(clicks) == clicks
+        mock_analytics.insert_many.assert_called_once_with(clicks, ordered=False)
+        assert all(click["pending"] == ["counters", "rollups"] for click in clicks)
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.analytics_repository.analytics_rollups", new_callable=mock_collection)
+    @patch("src.repositories.analytics_repository.analytics_counters", new_callable=mock_collection)
+    @patch("src.repositories.analytics_repository.analytics", new_callable=mock_collection)
+    async def test_count_clicks_applies_only_pending_steps(self, mock_analytics, mock_counters, mock_rollups):
+        timestamp = datetime(2024, 1, 1, 12, 30)
+        mock_analytics.find.return_value = mock_cursor([
+            {"_id": 1, "variant": "A", "elementId": "btn", "timestamp": timestamp, "pending": ["rollups"]},
+            {"_id": 2, "variant": "A", "elementId": "btn", "timestamp": timestamp, "pending": ["counters", "rollups"]},
+        ])
+
+        assert await AnalyticsRepository.count_clicks([1, 2, 3]) == 2
+
+        mock_analytics.find.assert_called_once_with({"_id": {"$in": [1, 2, 3]}, "pending": {"$exists": True}})
+        assert mock_counters.bulk_write.call_args.args[0][0]._doc["$inc"]["count"] == 1
+        assert mock_rollups.bulk_write.call_args.args[0][0]._doc["$inc"]["count"] == 2
+        assert [c.args for c in mock_analytics.update_many.call_args_list] == [
+            ({"_id": {"$in": [2]}}, {"$pull": {"pending": "counters"}}),
+            ({"_id": {"$in": [1, 2]}}, {"$pull": {"pending": "rollups"}}),
+            ({"_id": {"$in": [1, 2]}, "pending": []}, {"$unset": {"pending": ""}}),
+        ]
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.analytics_repository.analytics_counters", new_callable=mock_collection)
+    @patch("src.repositories.analytics_repository.analytics", new_callable=mock_collection)
+    async def test_count_clicks_keeps_step_pending_when_it_fails(self, mock_analytics, mock_counters):
+        mock_analytics.find.return_value = mock_cursor([{"_id": 1, "variant": "A", "elementId": "btn", "pending": ["counters", "rollups"]}])
+        mock_counters.bulk_write.side_effect = RuntimeError("timeout")
+
+        with pytest.raises(RuntimeError):
+            await AnalyticsRepository.count_clicks([1])
+
+        mock_analytics.update_many.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.analytics_repository.analytics", new_callable=mock_collection)
+    async def test_save_clicks_ignores_already_written(self, mock_analytics):
+        mock_analytics.insert_many.side_effect = BulkWriteError({"writeErrors": [{"index": 0, "code": 11000}], "nInserted": 1})
+
+        inserted = await AnalyticsRepository.save_clicks([{"_id": 1}, {"_id": 2}])
+
+        assert [click["_id"] for click in inserted] == [2]
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.analytics_repository.analytics", new_callable=mock_collection)
+    async def test_save_clicks_raises_other_errors(self, mock_analytics):
+        mock_analytics.insert_many.side_effect = BulkWriteError({"writeErrors": [{"code": 121}], "nInserted": 0})
+
+        with pytest.raises(BulkWriteError):
+            await AnalyticsRepository.save_clicks([{"_id": 1}])
+
+    def test_bucket_start(self):
+        timestamp = datetime(2024, 3, 5, 14, 37, 21, 500)
+
+        assert bucket_start(timestamp, "minute") == datetime(2024, 3, 5, 14, 37)
+        assert bucket_start(timestamp, "hour") == datetime(2024, 3, 5, 14)
+        assert bucket_start(timestamp, "day") == datetime(2024, 3, 5)
+        assert bucket_start(datetime(2024, 3, 5, 14, 37, tzinfo=timezone(timedelta(hours=-3))), "hour") == datetime(2024, 3, 5, 17)
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.analytics_repository.settings")
+    @patch("src.repositories.analytics_repository.analytics_rollups", new_callable=mock_collection)
+    async def test_increment_rollups(self, mock_rollups, mock_settings):
+        mock_settings.ANALYTICS_MINUTE_ROLLUP_TTL_DAYS = 7
+        clicks = [
+            {"variant": "A", "elementId": "btn", "timestamp": datetime(2024, 1, 1, 10, 5, 10)},
+            {"variant": "A", "elementId": "btn", "timestamp": datetime(2024, 1, 1, 10, 5, 50)},
+            {"variant": "A", "elementId": "btn", "timestamp": datetime(2024, 1, 1, 10, 30)},
+            {"variant": "A", "elementId": "btn"}
+        ]
+
+        await AnalyticsRepository.increment_rollups(clicks)
+
+        operations = {
+            (op._filter["granularity"], op._filter["bucket"]): op._doc
+            for op in mock_rollups.bulk_write.call_args.args[0]
+        }
+        assert operations == {
+            ("minute", datetime(2024, 1, 1, 10, 5)): {"$inc": {"count": 2}, "$setOnInsert": {"expires_at": datetime(2024, 1, 8, 10, 5)}},
+            ("minute", datetime(2024, 1, 1, 10, 30)): {"$inc": {"count": 1}, "$setOnInsert": {"expires_at": datetime(2024, 1, 8, 10, 30)}},
+            ("hour", datetime(2024, 1, 1, 10)): {"$inc": {"count": 3}},
+            ("day", datetime(2024, 1, 1)): {"$inc": {"count": 3}}
+        }
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.analytics_repository.analytics_rollups", new_callable=mock_collection)
+    async def test_get_timeseries(self, mock_rollups):
+        first, second = HyperLogLog(), HyperLogLog()
+        first.update(["a@test.com", "b@test.com"])
+        second.update(["b@test.com", "c@test.com"])
+        mock_rollups.find.return_value = mock_cursor([
+            {"variant": "A", "elementId": "btn", "bucket": datetime(2024, 1, 1, 10), "count": 2, "hll": first.to_document()},
+            {"variant": "B", "elementId": "btn", "bucket": datetime(2024, 1, 1, 10), "count": 1},
+            {"variant": "A", "elementId": "btn", "bucket": datetime(2024, 1, 1, 11), "count": 4, "hll": second.to_document()}
+        ])
+
+        result = await AnalyticsRepository.get_timeseries("hour", datetime(2024, 1, 1, 10, 30), datetime(2024, 1, 1, 11, 15), variant="A")
+
+        query = mock_rollups.find.call_args.args[0]
+        assert query == {
+            "granularity": "hour",
+            "bucket": {"$gte": datetime(2024, 1, 1, 10), "$lt": datetime(2024, 1, 1, 12)},
+            "variant": "A"
+        }
+        assert result[0] == {
+            "variant": "A",
+            "elementId": "btn",
+            "points": [
+                {"bucket": datetime(2024, 1, 1, 10), "count": 2, "unique_emails": 2},
+                {"bucket": datetime(2024, 1, 1, 11), "count": 4, "unique_emails": 2}
+            ],
+            # Os sketches dos dois buckets juntos: a, b e c
+            "unique_emails": 3
+        }
+        assert result[1]["unique_emails"] == 0
         assert len(result) == 2
-        assert result[0]["elementId"] == "button1"
-        mock_analytics.find.assert_called_once_with({}, {"_id": 0})
-
-    @patch("src.repositories.analytics_repository.analytics")
-    def test_get_stats(self, mock_analytics):
-        mock_pipeline_results = [
-            {
-                "_id": {"variant": "A", "elementId": "btn"},
-                "count": 2,
-                "emails": ["user1@test.com", "user2@test.com", "user1@test.com", None]
-            }
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.analytics_repository.settings")
+    @patch("src.repositories.analytics_repository.analytics_rollups", new_callable=mock_collection)
+    async def test_increment_rollups_updates_sketches(self, mock_rollups, mock_settings):
+        mock_settings.ANALYTICS_MINUTE_ROLLUP_TTL_DAYS = 0
+        clicks = [
+            {"variant": "A", "elementId": "btn", "email": "a@test.com", "timestamp": datetime(2024, 1, 1, 10, 5)},
+            {"variant": "A", "elementId": "btn", "timestamp": datetime(2024, 1, 1, 10, 6)}
         ]
-        mock_analytics.aggregate.return_value = mock_pipeline_results
-        
-        result = AnalyticsRepository.get_stats()
-        
-        assert "stats" in result
-        assert len(result["stats"]) == 1
-        # Check if duplicates and None were removed from emails
-        emails = result["stats"][0]["emails"]
-        assert len(emails) == 2
-        assert "user1@test.com" in emails
-        assert "user2@test.com" in emails
-        assert None not in emails
+        index, rank = register_for("a@test.com")
+
+        await AnalyticsRepository.increment_rollups(clicks, counts=False)
+
+        operations = {
+            (op._filter["granularity"], op._filter["bucket"]): op._doc
+            for op in mock_rollups.bulk_write.call_args.args[0]
+        }
+        # Sem counts, o bucket do clique sem email não tem o que atualizar
+        assert operations == {
+            ("minute", datetime(2024, 1, 1, 10, 5)): {"$max": {f"hll.{index}": rank}},
+            ("hour", datetime(2024, 1, 1, 10)): {"$max": {f"hll.{index}": rank}},
+            ("day", datetime(2024, 1, 1)): {"$max": {f"hll.{index}": rank}}
+        }
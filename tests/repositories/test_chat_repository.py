@@ -1,17 +1,22 @@
-from unittest.mock import MagicMock, patch
+import pytest
+from datetime import datetime
+from unittest.mock import ANY, MagicMock, patch
 from bson import ObjectId
-from src.repositories.chat_repository import ChatRepository
+from tests.helpers import mock_collection, mock_cursor
+from src.repositories.chat_repository import ChatRepository, decode_cursor, encode_cursor
+from src.repositories.identity_map import identity_map_scope
 
 class TestChatRepository:
-    @patch("src.repositories.chat_repository.chats")
-    def test_create_chat(self, mock_chats):
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_create_chat(self, mock_chats):
         def mock_insert(doc):
             doc["_id"] = ObjectId("60d5ecb54f1a2c001f8e4e1a")
             return MagicMock(inserted_id=doc["_id"])
             
         mock_chats.insert_one.side_effect = mock_insert
 
-        result = ChatRepository.create(
+        result = await ChatRepository.create(
             title="Test Title", 
             description="Test Description", 
             user_id="user123", 
@@ -24,61 +29,114 @@ class TestChatRepository:
         assert result["id"] == "60d5ecb54f1a2c001f8e4e1a"
         mock_chats.insert_one.assert_called_once()
 
-    @patch("src.repositories.chat_repository.chats")
-    def test_get_by_id_found(self, mock_chats):
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_get_metadata_excludes_messages(self, mock_chats):
         mock_id = ObjectId("60d5ecb54f1a2c001f8e4e1a")
-        user_id = "user123"
-        mock_chats.find_one.return_value = {
-            "_id": mock_id,
-            "title": "Found Title",
-            "user_id": user_id,
-            "messages": []
-        }
+        mock_chats.find_one.return_value = {"_id": mock_id, "user_id": "user123", "project_id": None}
 
-        result = ChatRepository.get_by_id(str(mock_id), user_id)
+        result = await ChatRepository.get_metadata(str(mock_id))
 
-        assert result["title"] == "Found Title"
-        assert result["id"] == str(mock_id)
-        mock_chats.find_one.assert_called_once_with({"_id": mock_id, "user_id": user_id})
+        assert result == {"id": str(mock_id), "user_id": "user123", "project_id": None}
+        mock_chats.find_one.assert_called_once_with({"_id": mock_id}, {"messages": 0, "summary": 0})
 
-    @patch("src.repositories.chat_repository.chats")
-    def test_list_by_user_with_project(self, mock_chats):
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_list_by_user_with_project(self, mock_chats):
         user_id = "user123"
         project_id = "proj456"
-        mock_chats.find.return_value = [
+        mock_chats.find.return_value = mock_cursor([
             {"_id": ObjectId(), "title": "C1", "user_id": user_id, "project_id": project_id}
-        ]
+        ])
 
-        result = ChatRepository.list_by_user(user_id, project_id)
+        result = await ChatRepository.list_by_user(user_id, project_id)
 
         assert len(result) == 1
         mock_chats.find.assert_called_once_with(
             {"project_id": project_id},
-            {"title": 1, "description": 1, "project_id": 1}
+            {"title": 1, "description": 1, "project_id": 1, "last_message_at": 1}
         )
 
-    @patch("src.repositories.chat_repository.chats")
-    def test_list_by_user_no_project(self, mock_chats):
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_list_by_user_no_project(self, mock_chats):
         user_id = "user123"
-        mock_chats.find.return_value = [
+        mock_chats.find.return_value = mock_cursor([
             {"_id": ObjectId(), "title": "C1", "user_id": user_id, "project_id": None}
-        ]
+        ])
 
-        result = ChatRepository.list_by_user(user_id)
+        result = await ChatRepository.list_by_user(user_id)
 
         assert len(result) == 1
         mock_chats.find.assert_called_once_with(
             {"user_id": user_id, "project_id": None},
-            {"title": 1, "description": 1, "project_id": 1}
+            {"title": 1, "description": 1, "project_id": 1, "last_message_at": 1}
         )
 
-    @patch("src.repositories.chat_repository.chats")
-    def test_update_title(self, mock_chats):
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_list_page_returns_next_cursor(self, mock_chats):
+        newest = {"_id": ObjectId(), "title": "C3", "last_message_at": datetime(2026, 1, 3)}
+        middle_id = ObjectId()
+        middle = {"_id": middle_id, "title": "C2", "last_message_at": datetime(2026, 1, 2)}
+        oldest = {"_id": ObjectId(), "title": "C1", "last_message_at": datetime(2026, 1, 1)}
+        mock_chats.find.return_value = mock_cursor([newest, middle, oldest])
+
+        items, next_cursor = await ChatRepository.list_page("user123", "proj456", limit=2)
+
+        assert [c["title"] for c in items] == ["C3", "C2"]
+        assert decode_cursor(next_cursor) == (datetime(2026, 1, 2), middle_id)
+        mock_chats.find.return_value.sort.assert_called_once_with([("last_message_at", -1), ("_id", -1)])
+        mock_chats.find.return_value.limit.assert_called_once_with(3)
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_list_page_after_cursor(self, mock_chats):
+        last_id = ObjectId()
+        cursor = encode_cursor({"_id": last_id, "last_message_at": datetime(2026, 1, 2)})
+        mock_chats.find.return_value = mock_cursor([])
+
+        items, next_cursor = await ChatRepository.list_page("user123", limit=2, cursor=cursor)
+
+        assert items == [] and next_cursor is None
+        query = mock_chats.find.call_args[0][0]
+        assert query["$and"][0] == {"user_id": "user123", "project_id": None}
+        assert {"last_message_at": datetime(2026, 1, 2), "_id": {"$lt": last_id}} in query["$and"][1]["$or"]
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_list_recent_by_projects(self, mock_chats):
+        first_id, second_id, personal_id = ObjectId(), ObjectId(), ObjectId()
+        mock_chats.aggregate.return_value = mock_cursor([
+            {"_id": "proj1", "chats": [
+                {"_id": first_id, "title": "A", "last_message_at": datetime(2026, 1, 2)},
+                {"_id": second_id, "title": "B", "last_message_at": datetime(2026, 1, 1)}
+            ]},
+            {"_id": None, "chats": [{"_id": personal_id, "title": "P"}]}
+        ])
+
+        pages = await ChatRepository.list_recent_by_projects("user123", ["proj1", "proj2"], limit=1)
+
+        assert pages["proj1"][0] == [{"id": str(first_id), "title": "A", "last_message_at": datetime(2026, 1, 2)}]
+        assert decode_cursor(pages["proj1"][1]) == (datetime(2026, 1, 2), first_id)
+        assert pages[None] == ([{"id": str(personal_id), "title": "P"}], None)
+        assert "proj2" not in pages
+        pipeline = mock_chats.aggregate.call_args[0][0]
+        assert pipeline[1]["$group"]["chats"]["$topN"]["n"] == 2
+
+    @pytest.mark.asyncio
+    async def test_list_page_rejects_bad_cursor(self):
+        with pytest.raises(ValueError):
+            await ChatRepository.list_page("user123", cursor="not-a-cursor")
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_update_title(self, mock_chats):
         mock_id = ObjectId("60d5ecb54f1a2c001f8e4e1a")
         user_id = "user123"
         mock_chats.update_one.return_value = MagicMock(modified_count=1)
 
-        result = ChatRepository.update_title(str(mock_id), "New Title", user_id)
+        result = await ChatRepository.update_title(str(mock_id), "New Title", user_id)
 
         assert result is True
         mock_chats.update_one.assert_called_once_with(
@@ -86,13 +144,14 @@ class TestChatRepository:
             {"$set": {"title": "New Title"}}
         )
 
-    @patch("src.repositories.chat_repository.chats")
-    def test_update_description(self, mock_chats):
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_update_description(self, mock_chats):
         mock_id = ObjectId("60d5ecb54f1a2c001f8e4e1a")
         user_id = "user123"
         mock_chats.update_one.return_value = MagicMock(modified_count=1)
 
-        result = ChatRepository.update_description(str(mock_id), "New Desc", user_id)
+        result = await ChatRepository.update_description(str(mock_id), "New Desc", user_id)
 
         assert result is True
         mock_chats.update_one.assert_called_once_with(
@@ -100,40 +159,405 @@ class TestChatRepository:
             {"$set": {"description": "New Desc"}}
         )
 
-    @patch("src.repositories.chat_repository.chats")
-    def test_delete_success(self, mock_chats):
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_delete_success(self, mock_chats):
         mock_id = ObjectId("60d5ecb54f1a2c001f8e4e1a")
         user_id = "user123"
         mock_chats.delete_one.return_value = MagicMock(deleted_count=1)
 
-        result = ChatRepository.delete(str(mock_id), user_id)
+        result = await ChatRepository.delete(str(mock_id), user_id)
 
         assert result is True
         mock_chats.delete_one.assert_called_once_with({"_id": mock_id, "user_id": user_id})
 
-    @patch("src.repositories.chat_repository.chats")
-    def test_get_history(self, mock_chats):
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_get_history(self, mock_chats):
         mock_id = ObjectId("60d5ecb54f1a2c001f8e4e1a")
         user_id = "user123"
         messages = [{"role": "user", "content": "hello"}]
         mock_chats.find_one.return_value = {"messages": messages}
 
-        result = ChatRepository.get_history(str(mock_id), user_id)
+        result = await ChatRepository.get_history(str(mock_id), user_id)
 
         assert result == messages
         mock_chats.find_one.assert_called_once_with({"_id": mock_id, "user_id": user_id}, {"messages": 1})
 
-    @patch("src.repositories.chat_repository.chats")
-    def test_add_message(self, mock_chats):
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_add_message(self, mock_chats):
         mock_id = ObjectId("60d5ecb54f1a2c001f8e4e1a")
         user_id = "user123"
         message = {"role": "assistant", "content": "hi"}
         mock_chats.update_one.return_value = MagicMock(modified_count=1)
 
-        result = ChatRepository.add_message(str(mock_id), message, user_id)
+        result = await ChatRepository.add_message(str(mock_id), message, user_id)
 
         assert result is True
         mock_chats.update_one.assert_called_once_with(
             {"_id": mock_id, "user_id": user_id}, 
-            {"$push": {"messages": message}}
+            {"$push": {"messages": message}, "$set": {"last_message_at": ANY}}
+        )
+
+class TestChatRepositoryMessageCollection:
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.settings")
+    @patch("src.repositories.chat_repository.messages", new_callable=mock_collection)
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_add_message(self, mock_chats, mock_messages, mock_settings):
+        mock_settings.CHAT_MESSAGE_STORAGE = "collection"
+        mock_id = ObjectId("60d5ecb54f1a2c001f8e4e1a")
+        message = {"role": "user", "content": "hi"}
+        mock_chats.find_one_and_update.return_value = {"_id": mock_id, "message_count": 3}
+
+        result = await ChatRepository.add_message(str(mock_id), message)
+
+        assert result is True
+        assert mock_chats.find_one_and_update.call_args[0][:2] == (
+            {"_id": mock_id, "messages": {"$exists": False}},
+            {"$inc": {"message_count": 1}, "$set": {"last_message_at": ANY}}
+        )
+        mock_messages.insert_one.assert_called_once_with(
+            {"role": "user", "content": "hi", "chat_id": str(mock_id), "seq": 2}
+        )
+        assert message == {"role": "user", "content": "hi"}
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.settings")
+    @patch("src.repositories.chat_repository.messages", new_callable=mock_collection)
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_add_message_migrates_embedded_chat(self, mock_chats, mock_messages, mock_settings):
+        mock_settings.CHAT_MESSAGE_STORAGE = "collection"
+        mock_id = ObjectId("60d5ecb54f1a2c001f8e4e1a")
+        mock_chats.find_one_and_update.side_effect = [None, {"_id": mock_id, "message_count": 2}]
+        mock_chats.find_one.return_value = {"_id": mock_id, "messages": [{"role": "user", "content": "old"}]}
+        mock_chats.update_one.return_value = MagicMock(modified_count=1)
+
+        result = await ChatRepository.add_message(str(mock_id), {"role": "assistant", "content": "new"})
+
+        assert result is True
+        mock_messages.insert_many.assert_called_once_with(
+            [{"role": "user", "content": "old", "chat_id": str(mock_id), "seq": 0}],
+            ordered=False
+        )
+        mock_messages.insert_one.assert_called_once_with(
+            {"role": "assistant", "content": "new", "chat_id": str(mock_id), "seq": 1}
+        )
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.ChatRepository.migrate_embedded_messages")
+    @patch("src.repositories.chat_repository.settings")
+    @patch("src.repositories.chat_repository.messages", new_callable=mock_collection)
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_add_message_after_concurrent_migration(self, mock_chats, mock_messages, mock_settings, mock_migrate):
+        # Outro escritor migrou o chat entre a primeira tentativa e a migração desta requisição
+        mock_settings.CHAT_MESSAGE_STORAGE = "collection"
+        mock_id = ObjectId("60d5ecb54f1a2c001f8e4e1a")
+        mock_chats.find_one_and_update.side_effect = [None, {"_id": mock_id, "message_count": 5}]
+        mock_chats.find_one.return_value = {"_id": mock_id}
+        mock_migrate.return_value = None
+
+        result = await ChatRepository.add_message(str(mock_id), {"role": "user", "content": "hi"})
+
+        assert result is True
+        mock_migrate.assert_called_once_with(str(mock_id))
+        mock_messages.insert_one.assert_called_once_with(
+            {"role": "user", "content": "hi", "chat_id": str(mock_id), "seq": 4}
+        )
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.settings")
+    @patch("src.repositories.chat_repository.messages", new_callable=mock_collection)
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_add_message_chat_not_found(self, mock_chats, mock_messages, mock_settings):
+        mock_settings.CHAT_MESSAGE_STORAGE = "collection"
+        mock_chats.find_one_and_update.return_value = None
+        mock_chats.find_one.return_value = None
+
+        result = await ChatRepository.add_message("60d5ecb54f1a2c001f8e4e1a", {"role": "user", "content": "hi"})
+
+        assert result is False
+        mock_messages.insert_one.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.settings")
+    @patch("src.repositories.chat_repository.messages", new_callable=mock_collection)
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_get_history(self, mock_chats, mock_messages, mock_settings):
+        mock_settings.CHAT_MESSAGE_STORAGE = "collection"
+        mock_id = ObjectId("60d5ecb54f1a2c001f8e4e1a")
+        history = [{"role": "user", "content": "hello"}]
+        mock_chats.find_one.return_value = {"_id": mock_id}
+        mock_messages.find.return_value = mock_cursor(history)
+
+        result = await ChatRepository.get_history(str(mock_id))
+
+        assert result == history
+        mock_messages.find.assert_called_once_with(
+            {"chat_id": str(mock_id)},
+            {"_id": 0, "chat_id": 0, "seq": 0}
+        )
+        mock_messages.find.return_value.sort.assert_called_once_with("seq", 1)
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.settings")
+    @patch("src.repositories.chat_repository.messages", new_callable=mock_collection)
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_get_history_not_migrated(self, mock_chats, mock_messages, mock_settings):
+        mock_settings.CHAT_MESSAGE_STORAGE = "collection"
+        history = [{"role": "user", "content": "hello"}]
+        mock_chats.find_one.return_value = {"messages": history}
+
+        result = await ChatRepository.get_history("60d5ecb54f1a2c001f8e4e1a")
+
+        assert result == history
+        mock_messages.find.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.messages", new_callable=mock_collection)
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_migrate_embedded_messages_skips_concurrent_append(self, mock_chats, mock_messages):
+        mock_id = ObjectId("60d5ecb54f1a2c001f8e4e1a")
+        mock_chats.find_one.return_value = {"_id": mock_id, "messages": [{"role": "user", "content": "a"}]}
+        mock_chats.update_one.return_value = MagicMock(modified_count=0)
+
+        result = await ChatRepository.migrate_embedded_messages(str(mock_id))
+
+        assert result is None
+        mock_chats.update_one.assert_called_once_with(
+            {"_id": mock_id, "messages": {"$size": 1}},
+            {"$set": {"message_count": 1}, "$unset": {"messages": ""}}
+        )
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.settings")
+    @patch("src.repositories.chat_repository.messages", new_callable=mock_collection)
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_delete_removes_messages(self, mock_chats, mock_messages, mock_settings):
+        mock_settings.CHAT_MESSAGE_STORAGE = "collection"
+        mock_chats.delete_one.return_value = MagicMock(deleted_count=1)
+
+        result = await ChatRepository.delete("60d5ecb54f1a2c001f8e4e1a")
+
+        assert result is True
+        mock_messages.delete_many.assert_called_once_with({"chat_id": "60d5ecb54f1a2c001f8e4e1a"})
+
+REMOVE = object()
+
+def evaluate(expr, doc):
+    # Avalia o subconjunto de expressões de agregação usado por messages_slice
+    if isinstance(expr, str) and expr == "$$REMOVE":
+        return REMOVE
+    if isinstance(expr, str) and expr.startswith("$"):
+        return doc.get(expr[1:])
+    if not isinstance(expr, dict):
+        return expr
+    (op, args), = expr.items()
+    if op == "$literal":
+        return args
+    if op == "$cond":
+        return evaluate(args[1] if evaluate(args[0], doc) else args[2], doc)
+    values = [evaluate(arg, doc) for arg in (args if isinstance(args, list) else [args])]
+    if op == "$ifNull":
+        return values[0] if values[0] is not None else values[1]
+    if op == "$slice":
+        return values[0][values[1]:values[1] + values[2]]
+    operators = {
+        "$size": lambda v: len(v[0]),
+        "$isArray": lambda v: isinstance(v[0], list),
+        "$min": min,
+        "$max": max,
+        "$add": sum,
+        "$subtract": lambda v: v[0] - v[1],
+        "$gt": lambda v: v[0] > v[1],
+    }
+    return operators[op](values)
+
+def project(doc, projection, query):
+    # 1 inclui o campo como está; o resto é expressão. O _id vem sempre, como no MongoDB
+    result = {key: doc.get(key, REMOVE) if expr == 1 else evaluate(expr, doc) for key, expr in projection.items()}
+    result["_id"] = query["_id"]
+    return {key: value for key, value in result.items() if value is not REMOVE}
+
+def find_one_with_projection(doc):
+    async def find_one(query, projection):
+        return project(doc, projection, query)
+    return find_one
+
+class TestChatRepositoryHistoryPagination:
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_embedded_latest_page(self, mock_chats):
+        mock_chats.find_one.side_effect = find_one_with_projection({
+            "messages": [{"content": str(i)} for i in range(5)]
+        })
+
+        result = await ChatRepository.get_history("60d5ecb54f1a2c001f8e4e1a", limit=2)
+
+        assert result == [{"content": "3", "seq": 3}, {"content": "4", "seq": 4}]
+        # O recorte é feito na projeção, não depois de carregar o array inteiro
+        projection = mock_chats.find_one.call_args.args[1]
+        assert projection["messages"]["$cond"][1]["$cond"][1]["$slice"][0] == "$messages"
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_embedded_before_and_after(self, mock_chats):
+        mock_chats.find_one.side_effect = find_one_with_projection({
+            "messages": [{"content": str(i)} for i in range(5)]
+        })
+
+        before = await ChatRepository.get_history("60d5ecb54f1a2c001f8e4e1a", before=3, limit=2)
+        after = await ChatRepository.get_history("60d5ecb54f1a2c001f8e4e1a", after=2)
+        window = await ChatRepository.get_history("60d5ecb54f1a2c001f8e4e1a", after=0, limit=2)
+        beyond = await ChatRepository.get_history("60d5ecb54f1a2c001f8e4e1a", after=4)
+        early = await ChatRepository.get_history("60d5ecb54f1a2c001f8e4e1a", before=1, limit=3)
+
+        assert [m["seq"] for m in before] == [1, 2]
+        assert [m["seq"] for m in after] == [3, 4]
+        assert [m["seq"] for m in window] == [1, 2]
+        assert beyond == []
+        assert [m["seq"] for m in early] == [0]
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.settings")
+    @patch("src.repositories.chat_repository.messages", new_callable=mock_collection)
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_migrated_chat_has_no_embedded_page(self, mock_chats, mock_messages, mock_settings):
+        mock_settings.CHAT_MESSAGE_STORAGE = "collection"
+        mock_chats.find_one.side_effect = find_one_with_projection({"message_count": 3})
+        mock_messages.find.return_value = mock_cursor([{"content": "c", "seq": 2}])
+
+        result = await ChatRepository.get_history("60d5ecb54f1a2c001f8e4e1a", limit=1)
+
+        assert result == [{"content": "c", "seq": 2}]
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.settings")
+    @patch("src.repositories.chat_repository.messages", new_callable=mock_collection)
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_collection_before_page(self, mock_chats, mock_messages, mock_settings):
+        mock_settings.CHAT_MESSAGE_STORAGE = "collection"
+        mock_chats.find_one.return_value = {"_id": ObjectId("60d5ecb54f1a2c001f8e4e1a")}
+        cursor = mock_cursor([{"content": "b", "seq": 8}, {"content": "a", "seq": 7}])
+        mock_messages.find.return_value = cursor
+
+        result = await ChatRepository.get_history("60d5ecb54f1a2c001f8e4e1a", before=9, limit=2)
+
+        assert [m["seq"] for m in result] == [7, 8]
+        mock_messages.find.assert_called_once_with(
+            {"chat_id": "60d5ecb54f1a2c001f8e4e1a", "seq": {"$lt": 9}},
+            {"_id": 0, "chat_id": 0}
+        )
+        cursor.sort.assert_called_once_with("seq", -1)
+        cursor.limit.assert_called_once_with(2)
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.settings")
+    @patch("src.repositories.chat_repository.messages", new_callable=mock_collection)
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_collection_delta(self, mock_chats, mock_messages, mock_settings):
+        mock_settings.CHAT_MESSAGE_STORAGE = "collection"
+        mock_chats.find_one.return_value = {"_id": ObjectId("60d5ecb54f1a2c001f8e4e1a")}
+        mock_messages.find.return_value = mock_cursor([{"content": "new", "seq": 4}])
+
+        result = await ChatRepository.get_history("60d5ecb54f1a2c001f8e4e1a", after=3)
+
+        assert result == [{"content": "new", "seq": 4}]
+        mock_messages.find.assert_called_once_with(
+            {"chat_id": "60d5ecb54f1a2c001f8e4e1a", "seq": {"$gt": 3}},
+            {"_id": 0, "chat_id": 0}
+        )
+        mock_messages.find.return_value.sort.assert_called_once_with("seq", 1)
+
+class TestChatRepositorySummary:
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_get_context_defaults(self, mock_chats):
+        mock_chats.find_one.side_effect = find_one_with_projection({"messages": [{"content": "a"}]})
+
+        result = await ChatRepository.get_context("60d5ecb54f1a2c001f8e4e1a")
+
+        assert result == {
+            "chat": {"id": "60d5ecb54f1a2c001f8e4e1a"},
+            "summary": None,
+            "summary_seq": 0,
+            "messages": [{"content": "a"}]
+        }
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_get_context_serves_metadata_from_same_read(self, mock_chats):
+        mock_chats.find_one.side_effect = find_one_with_projection({
+            "title": "T",
+            "user_id": "user123",
+            "project_id": None,
+            "summary": "Resumo",
+            "summary_seq": 1,
+            "messages": [{"content": "0"}, {"content": "1"}]
+        })
+
+        with identity_map_scope():
+            context = await ChatRepository.get_context("60d5ecb54f1a2c001f8e4e1a")
+            metadata = await ChatRepository.get_metadata("60d5ecb54f1a2c001f8e4e1a")
+            again = await ChatRepository.get_context("60d5ecb54f1a2c001f8e4e1a")
+
+        assert context["chat"] == metadata == {
+            "id": "60d5ecb54f1a2c001f8e4e1a", "title": "T", "user_id": "user123", "project_id": None, "summary_seq": 1
+        }
+        assert again == context
+        assert context["messages"] == [{"content": "1"}]
+        mock_chats.find_one.assert_called_once()
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_get_context_embedded_skips_summarized(self, mock_chats):
+        mock_chats.find_one.side_effect = find_one_with_projection({
+            "summary": "Resumo",
+            "summary_seq": 3,
+            "messages": [{"content": str(i)} for i in range(5)]
+        })
+
+        result = await ChatRepository.get_context("60d5ecb54f1a2c001f8e4e1a")
+
+        assert result["summary"] == "Resumo"
+        assert result["summary_seq"] == 3
+        assert result["messages"] == [{"content": "3"}, {"content": "4"}]
+        mock_chats.find_one.assert_called_once()
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.settings")
+    @patch("src.repositories.chat_repository.messages", new_callable=mock_collection)
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_get_context_collection(self, mock_chats, mock_messages, mock_settings):
+        mock_settings.CHAT_MESSAGE_STORAGE = "collection"
+        mock_chats.find_one.side_effect = find_one_with_projection({"summary": "Resumo", "summary_seq": 30, "message_count": 32})
+        mock_messages.find.return_value = mock_cursor([{"content": "a", "seq": 30}, {"content": "b", "seq": 31}])
+
+        result = await ChatRepository.get_context("60d5ecb54f1a2c001f8e4e1a")
+
+        assert [m["seq"] for m in result["messages"]] == [30, 31]
+        mock_messages.find.assert_called_once_with(
+            {"chat_id": "60d5ecb54f1a2c001f8e4e1a", "seq": {"$gte": 30}}, {"_id": 0, "chat_id": 0}
+        )
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_get_context_missing_chat(self, mock_chats):
+        mock_chats.find_one.return_value = None
+
+        assert await ChatRepository.get_context("60d5ecb54f1a2c001f8e4e1a") is None
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.chat_repository.chats", new_callable=mock_collection)
+    async def test_update_summary_is_conditional(self, mock_chats):
+        mock_id = ObjectId("60d5ecb54f1a2c001f8e4e1a")
+        mock_chats.update_one.return_value = MagicMock(modified_count=1)
+
+        result = await ChatRepository.update_summary(str(mock_id), "Resumo", 30)
+
+        assert result is True
+        mock_chats.update_one.assert_called_once_with(
+            {"_id": mock_id, "summary_seq": {"$not": {"$gte": 30}}},
+            {"$set": {"summary": "Resumo", "summary_seq": 30}}
         )
@@ -0,0 +1,82 @@
+import pytest
+from unittest.mock import MagicMock, patch
+from bson import ObjectId
+from src.repositories import identity_map
+from src.repositories.identity_map import identity_map_scope
+from src.repositories.project_repository import ProjectRepository
+from tests.helpers import mock_collection
+
+PROJECT_ID = "60d5ecb54f1a2c001f8e4e1a"
+
+class TestIdentityMap:
+    def test_noop_outside_scope(self):
+        identity_map.remember("projects", PROJECT_ID, {"name": "P"})
+        assert identity_map.lookup("projects", PROJECT_ID) is None
+
+    def test_lookup_returns_independent_copies(self):
+        with identity_map_scope():
+            identity_map.remember("projects", PROJECT_ID, {"members": []})
+            first = identity_map.lookup("projects", PROJECT_ID)
+            first["members"].append({"user_id": "x"})
+            assert identity_map.lookup("projects", PROJECT_ID) == {"members": []}
+
+    def test_evict_drops_every_view(self):
+        with identity_map_scope():
+            identity_map.remember("chats", PROJECT_ID, {"title": "a"})
+            identity_map.remember("chats", PROJECT_ID, {"title": "a"}, "metadata")
+            identity_map.evict("chats", PROJECT_ID)
+            assert identity_map.lookup("chats", PROJECT_ID) is None
+            assert identity_map.lookup("chats", PROJECT_ID, "metadata") is None
+
+    def test_apply_set_updates_loaded_views(self):
+        with identity_map_scope():
+            identity_map.remember("chats", PROJECT_ID, {"title": "a"}, "metadata")
+            identity_map.apply_set("chats", PROJECT_ID, {"title": "b"})
+            assert identity_map.lookup("chats", PROJECT_ID, "metadata") == {"title": "b"}
+
+    def test_scope_is_cleared_on_exit(self):
+        with identity_map_scope() as entries:
+            identity_map.remember("projects", PROJECT_ID, {"name": "P"})
+        assert entries == {}
+        assert identity_map.lookup("projects", PROJECT_ID) is None
+
+class TestRepositoriesUseIdentityMap:
+    @pytest.mark.asyncio
+    @patch("src.repositories.project_repository.projects", new_callable=mock_collection)
+    async def test_repeated_get_by_id_reads_once(self, mock_projects):
+        mock_projects.find_one.return_value = {"_id": ObjectId(PROJECT_ID), "name": "P", "user_id": "u"}
+
+        with identity_map_scope():
+            first = await ProjectRepository.get_by_id(PROJECT_ID)
+            second = await ProjectRepository.get_by_id(PROJECT_ID)
+
+        assert first == second
+        mock_projects.find_one.assert_called_once()
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.project_repository.projects", new_callable=mock_collection)
+    async def test_update_is_visible_without_rereading(self, mock_projects):
+        mock_projects.find_one.return_value = {"_id": ObjectId(PROJECT_ID), "name": "P", "user_id": "u"}
+        mock_projects.update_one.return_value = MagicMock(matched_count=1)
+
+        with identity_map_scope():
+            await ProjectRepository.get_by_id(PROJECT_ID)
+            await ProjectRepository.update(PROJECT_ID, {"name": "Renamed"})
+            project = await ProjectRepository.get_by_id(PROJECT_ID)
+
+        assert project["name"] == "Renamed"
+        mock_projects.find_one.assert_called_once()
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.project_repository.project_members", new_callable=mock_collection)
+    @patch("src.repositories.project_repository.projects", new_callable=mock_collection)
+    async def test_member_change_evicts(self, mock_projects, mock_members):
+        mock_projects.find_one.side_effect = lambda *_: {"_id": ObjectId(PROJECT_ID), "name": "P", "user_id": "u"}
+        mock_projects.update_one.return_value = MagicMock(modified_count=1)
+
+        with identity_map_scope():
+            await ProjectRepository.get_by_id(PROJECT_ID)
+            await ProjectRepository.add_member(PROJECT_ID, {"user_id": "m"})
+            await ProjectRepository.get_by_id(PROJECT_ID)
+
+        assert mock_projects.find_one.call_count == 2
@@ -0,0 +1,66 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+from src.repositories.loaders import UserLoader
+
+class TestUserLoader:
+    @pytest.mark.asyncio
+    @patch("src.repositories.loaders.user_repository", new_callable=AsyncMock)
+    async def test_batches_concurrent_loads(self, mock_user_repo):
+        mock_user_repo.get_many.return_value = {
+            "a": {"username": "ana"},
+            "b": {"username": "bia"}
+        }
+        loader = UserLoader()
+
+        results = await asyncio.gather(loader.load("a"), loader.load("b"), loader.load("a"), loader.load("c"))
+
+        assert results == [{"username": "ana"}, {"username": "bia"}, {"username": "ana"}, None]
+        mock_user_repo.get_many.assert_called_once_with(["a", "b", "c"])
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.loaders.user_repository", new_callable=AsyncMock)
+    async def test_memoizes_and_primes(self, mock_user_repo):
+        mock_user_repo.get_many.return_value = {"a": {"username": "ana"}}
+        loader = UserLoader()
+        loader.prime("me", {"username": "eu"})
+
+        await loader.load_many(["a", "me"])
+        await loader.load("a")
+
+        mock_user_repo.get_many.assert_called_once_with(["a"])
+        assert await loader.load("me") == {"username": "eu"}
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.loaders.user_repository", new_callable=AsyncMock)
+    async def test_failed_batch_can_be_retried(self, mock_user_repo):
+        mock_user_repo.get_many.side_effect = [RuntimeError("down"), {"a": {"username": "ana"}}]
+        loader = UserLoader()
+
+        with pytest.raises(RuntimeError):
+            await loader.load("a")
+
+        assert await loader.load("a") == {"username": "ana"}
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.loaders.user_repository", new_callable=AsyncMock)
+    async def test_keeps_dispatch_task_until_done(self, mock_user_repo):
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def slow_get_many(batch):
+            started.set()
+            await release.wait()
+            return {"a": {"username": "ana"}}
+
+        mock_user_repo.get_many.side_effect = slow_get_many
+        loader = UserLoader()
+
+        pending = asyncio.ensure_future(loader.load("a"))
+        await started.wait()
+        assert len(loader._tasks) == 1
+
+        release.set()
+        assert await pending == {"username": "ana"}
+        await asyncio.sleep(0)
+        assert loader._tasks == set()
@@ -1,17 +1,21 @@
+import pytest
 from unittest.mock import MagicMock, patch
 from bson import ObjectId
+from tests.helpers import mock_collection, mock_cursor
 from src.repositories.project_repository import ProjectRepository
 
 class TestProjectRepository:
-    @patch("src.repositories.project_repository.projects")
-    def test_create_project(self, mock_projects):
+    @pytest.mark.asyncio
+    @patch("src.repositories.project_repository.project_members", new_callable=mock_collection)
+    @patch("src.repositories.project_repository.projects", new_callable=mock_collection)
+    async def test_create_project(self, mock_projects, mock_members):
         def mock_insert(doc):
             doc["_id"] = ObjectId("60d5ecb54f1a2c001f8e4e1a")
             return MagicMock(inserted_id=doc["_id"])
             
         mock_projects.insert_one.side_effect = mock_insert
 
-        result = ProjectRepository.create(
+        result = await ProjectRepository.create(
             name="Test Project", 
             user_id="user123", 
             description="Test Description"
@@ -22,9 +26,14 @@ class TestProjectRepository:
         assert result["description"] == "Test Description"
         assert result["id"] == "60d5ecb54f1a2c001f8e4e1a"
         mock_projects.insert_one.assert_called_once()
+        mock_members.insert_one.assert_called_once_with(
+            {"user_id": "user123", "project_id": "60d5ecb54f1a2c001f8e4e1a", "role": "owner"}
+        )
 
-    @patch("src.repositories.project_repository.projects")
-    def test_get_by_id_found(self, mock_projects):
+    @pytest.mark.asyncio
+    @patch("src.repositories.project_repository.project_members", new_callable=mock_collection)
+    @patch("src.repositories.project_repository.projects", new_callable=mock_collection)
+    async def test_get_by_id_found(self, mock_projects, mock_members):
         mock_id = ObjectId("60d5ecb54f1a2c001f8e4e1a")
         mock_projects.find_one.return_value = {
             "_id": mock_id,
@@ -32,21 +41,23 @@ class TestProjectRepository:
             "user_id": "user123"
         }
 
-        result = ProjectRepository.get_by_id(str(mock_id))
+        result = await ProjectRepository.get_by_id(str(mock_id))
 
         assert result["name"] == "Found Project"
         assert result["id"] == str(mock_id)
         mock_projects.find_one.assert_called_once_with({"_id": mock_id})
 
-    @patch("src.repositories.project_repository.projects")
-    def test_list_by_user(self, mock_projects):
+    @pytest.mark.asyncio
+    @patch("src.repositories.project_repository.project_members", new_callable=mock_collection)
+    @patch("src.repositories.project_repository.projects", new_callable=mock_collection)
+    async def test_list_by_user(self, mock_projects, mock_members):
         user_id = "user123"
-        mock_projects.find.return_value = [
+        mock_projects.find.return_value = mock_cursor([
             {"_id": ObjectId(), "name": "P1", "user_id": user_id},
             {"_id": ObjectId(), "name": "P2", "user_id": user_id}
-        ]
+        ])
 
-        result = ProjectRepository.list_by_user(user_id)
+        result = await ProjectRepository.list_by_user(user_id)
 
         assert len(result) == 2
         assert result[0]["name"] == "P1"
@@ -58,23 +69,55 @@ class TestProjectRepository:
             ]
         })
 
-    @patch("src.repositories.project_repository.projects")
-    def test_delete_success(self, mock_projects):
+    @pytest.mark.asyncio
+    @patch("src.repositories.project_repository.settings")
+    @patch("src.repositories.project_repository.project_members", new_callable=mock_collection)
+    @patch("src.repositories.project_repository.projects", new_callable=mock_collection)
+    async def test_list_by_user_from_membership_collection(self, mock_projects, mock_members, mock_settings):
+        mock_settings.PROJECT_MEMBERSHIP_LOOKUP = "collection"
+        project_id = ObjectId()
+        mock_members.find.return_value = mock_cursor([{"project_id": str(project_id)}])
+        mock_projects.find.return_value = mock_cursor([{"_id": project_id, "name": "P1", "user_id": "owner"}])
+
+        result = await ProjectRepository.list_by_user("user123")
+
+        assert result[0]["id"] == str(project_id)
+        assert result[0]["members"] == []
+        mock_members.find.assert_called_once_with({"user_id": "user123"}, {"_id": 0, "project_id": 1})
+        mock_projects.find.assert_called_once_with({"_id": {"$in": [project_id]}})
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.project_repository.settings")
+    @patch("src.repositories.project_repository.project_members", new_callable=mock_collection)
+    @patch("src.repositories.project_repository.projects", new_callable=mock_collection)
+    async def test_list_by_user_without_memberships(self, mock_projects, mock_members, mock_settings):
+        mock_settings.PROJECT_MEMBERSHIP_LOOKUP = "collection"
+        mock_members.find.return_value = mock_cursor([])
+
+        assert await ProjectRepository.list_by_user("user123") == []
+        mock_projects.find.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.project_repository.project_members", new_callable=mock_collection)
+    @patch("src.repositories.project_repository.projects", new_callable=mock_collection)
+    async def test_delete_success(self, mock_projects, mock_members):
         mock_id = ObjectId("60d5ecb54f1a2c001f8e4e1a")
         mock_projects.delete_one.return_value = MagicMock(deleted_count=1)
 
-        result = ProjectRepository.delete(str(mock_id))
+        result = await ProjectRepository.delete(str(mock_id))
 
         assert result is True
         mock_projects.delete_one.assert_called_once_with({"_id": mock_id})
 
-    @patch("src.repositories.project_repository.projects")
-    def test_update_success(self, mock_projects):
+    @pytest.mark.asyncio
+    @patch("src.repositories.project_repository.project_members", new_callable=mock_collection)
+    @patch("src.repositories.project_repository.projects", new_callable=mock_collection)
+    async def test_update_success(self, mock_projects, mock_members):
         mock_id = ObjectId("60d5ecb54f1a2c001f8e4e1a")
         mock_projects.update_one.return_value = MagicMock(matched_count=1)
 
         update_data = {"name": "Updated Name"}
-        result = ProjectRepository.update(str(mock_id), update_data)
+        result = await ProjectRepository.update(str(mock_id), update_data)
 
         assert result is True
         mock_projects.update_one.assert_called_once_with(
@@ -82,67 +125,126 @@ class TestProjectRepository:
             {"$set": update_data}
         )
 
-    @patch("src.repositories.project_repository.projects")
-    def test_add_member(self, mock_projects):
+    @pytest.mark.asyncio
+    @patch("src.repositories.project_repository.project_members", new_callable=mock_collection)
+    @patch("src.repositories.project_repository.projects", new_callable=mock_collection)
+    async def test_add_member(self, mock_projects, mock_members):
         mock_id = ObjectId("60d5ecb54f1a2c001f8e4e1a")
         mock_projects.update_one.return_value = MagicMock(modified_count=1)
         
-        member_data = {"email": "member@test.com", "role": "editor"}
-        result = ProjectRepository.add_member(str(mock_id), member_data)
+        member_data = {"user_id": "member123", "email": "member@test.com", "role": "editor"}
+        result = await ProjectRepository.add_member(str(mock_id), member_data)
         
         assert result is True
         mock_projects.update_one.assert_called_once_with(
             {"_id": mock_id},
-            {"$push": {"members": member_data}}
+            {"$push": {"members": member_data}, "$inc": {"acl_version": 1}}
+        )
+        mock_members.update_one.assert_called_once_with(
+            {"project_id": str(mock_id), "user_id": "member123"},
+            {"$set": {"email": "member@test.com", "role": "editor"}},
+            upsert=True
         )
 
-    @patch("src.repositories.project_repository.projects")
-    def test_update_member(self, mock_projects):
+    @pytest.mark.asyncio
+    @patch("src.repositories.project_repository.project_members", new_callable=mock_collection)
+    @patch("src.repositories.project_repository.projects", new_callable=mock_collection)
+    async def test_update_member(self, mock_projects, mock_members):
         mock_id = ObjectId("60d5ecb54f1a2c001f8e4e1a")
         mock_projects.update_one.return_value = MagicMock(modified_count=1)
         
         update_data = {"role": "admin", "permissions": {"can_delete": True}}
-        result = ProjectRepository.update_member(str(mock_id), "member@test.com", update_data)
+        result = await ProjectRepository.update_member(str(mock_id), "member@test.com", update_data)
         
         assert result is True
         # Check if the $set object is correctly built
         expected_set = {
-            "members.$.role": "admin",
-            "members.$.permissions.can_delete": True
+            "members.$[target].role": "admin",
+            "members.$[target].permissions.can_delete": True
         }
         mock_projects.update_one.assert_called_once_with(
             {"_id": mock_id, "members.email": "member@test.com"},
-            {"$set": expected_set}
+            {"$inc": {"acl_version": 1}, "$set": expected_set},
+            array_filters=[{"target.email": "member@test.com"}]
         )
 
-    @patch("src.repositories.project_repository.projects")
-    def test_remove_member(self, mock_projects):
+    @pytest.mark.asyncio
+    @patch("src.repositories.project_repository.project_members", new_callable=mock_collection)
+    @patch("src.repositories.project_repository.projects", new_callable=mock_collection)
+    async def test_update_member_with_actor_guards_filter(self, mock_projects, mock_members):
+        mock_id = ObjectId("60d5ecb54f1a2c001f8e4e1a")
+        mock_projects.update_one.return_value = MagicMock(modified_count=0)
+
+        result = await ProjectRepository.update_member(str(mock_id), "member@test.com", {"role": "admin"}, actor_id="admin1")
+
+        assert result is False
+        query = mock_projects.update_one.call_args[0][0]
+        # Promover a admin é exclusivo do dono
+        assert query == {"_id": mock_id, "members.email": "member@test.com", "user_id": "admin1"}
+        mock_members.update_one.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.project_repository.project_members", new_callable=mock_collection)
+    @patch("src.repositories.project_repository.projects", new_callable=mock_collection)
+    async def test_add_member_with_actor_guards_filter(self, mock_projects, mock_members):
+        mock_id = ObjectId("60d5ecb54f1a2c001f8e4e1a")
+        mock_projects.update_one.return_value = MagicMock(modified_count=1)
+
+        await ProjectRepository.add_member(str(mock_id), {"user_id": "new", "role": "member"}, actor_id="admin1")
+
+        query = mock_projects.update_one.call_args[0][0]
+        assert query["$and"] == [
+            {"$or": [
+                {"user_id": "admin1"},
+                {"members": {"$elemMatch": {"user_id": "admin1", "role": "admin"}}}
+            ]},
+            {"user_id": {"$ne": "new"}},
+            {"members.user_id": {"$ne": "new"}}
+        ]
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.project_repository.project_members", new_callable=mock_collection)
+    @patch("src.repositories.project_repository.projects", new_callable=mock_collection)
+    async def test_remove_member(self, mock_projects, mock_members):
         mock_id = ObjectId("60d5ecb54f1a2c001f8e4e1a")
         mock_projects.update_one.return_value = MagicMock(modified_count=1)
         
-        result = ProjectRepository.remove_member(str(mock_id), "member@test.com")
+        result = await ProjectRepository.remove_member(str(mock_id), "member@test.com")
         
         assert result is True
         mock_projects.update_one.assert_called_once_with(
-            {"_id": mock_id},
-            {"$pull": {"members": {"email": "member@test.com"}}}
+            {"_id": mock_id, "members.email": "member@test.com"},
+            {"$pull": {"members": {"email": "member@test.com"}}, "$inc": {"acl_version": 1}}
         )
 
-    @patch("src.repositories.project_repository.projects")
-    def test_transfer_ownership(self, mock_projects):
+    @pytest.mark.asyncio
+    @patch("src.repositories.project_repository.project_members", new_callable=mock_collection)
+    @patch("src.repositories.project_repository.projects", new_callable=mock_collection)
+    async def test_transfer_ownership(self, mock_projects, mock_members):
         mock_id = ObjectId("60d5ecb54f1a2c001f8e4e1a")
         
-        result = ProjectRepository.transfer_ownership(str(mock_id), "old_owner", "new_owner", "new@test.com")
+        mock_projects.update_one.return_value = MagicMock(modified_count=1)
+        old_owner = {"user_id": "old_owner", "email": "old@test.com", "role": "admin"}
+        
+        result = await ProjectRepository.transfer_ownership(str(mock_id), "old_owner", "new_owner", "new@test.com", old_owner)
         
         assert result is True
-        assert mock_projects.update_one.call_count == 2
-        # First call removes new owner from members list
-        mock_projects.update_one.assert_any_call(
-            {"_id": mock_id},
-            {"$pull": {"members": {"user_id": "new_owner"}}}
+        # Uma única atualização com pipeline, condicionada ao dono atual
+        mock_projects.update_one.assert_called_once()
+        query, pipeline = mock_projects.update_one.call_args[0]
+        assert query == {"_id": mock_id, "user_id": "old_owner"}
+        assert pipeline[0]["$set"]["user_id"] == "new_owner"
+        assert pipeline[0]["$set"]["members"]["$concatArrays"][1] == {"$literal": [old_owner]}
+        mock_members.delete_many.assert_called_once_with(
+            {"project_id": str(mock_id), "role": "owner", "user_id": {"$ne": "new_owner"}}
         )
-        # Second call sets new owner as project owner
-        mock_projects.update_one.assert_any_call(
-            {"_id": mock_id},
-            {"$set": {"user_id": "new_owner"}}
+        mock_members.update_one.assert_any_call(
+            {"project_id": str(mock_id), "user_id": "new_owner"},
+            {"$set": {"role": "owner"}},
+            upsert=True
+        )
+        mock_members.update_one.assert_any_call(
+            {"project_id": str(mock_id), "user_id": "old_owner"},
+            {"$set": {"email": "old@test.com", "role": "admin"}},
+            upsert=True
         )
@@ -0,0 +1,58 @@
+import pytest
+from datetime import datetime, timezone
+from unittest.mock import ANY, MagicMock, patch
+from bson import ObjectId
+from tests.helpers import mock_collection, mock_cursor
+from src.repositories.session_repository import SessionRepository, hash_token
+
+class TestSessionRepository:
+    def test_hash_token_is_stable_sha256(self):
+        assert hash_token("token123") == hash_token("token123")
+        assert len(hash_token("token123")) == 64
+        assert hash_token("token123") != "token123"
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.session_repository.sessions", new_callable=mock_collection)
+    async def test_create_stores_only_the_hash(self, mock_sessions):
+        mock_sessions.insert_one.return_value = MagicMock(inserted_id=ObjectId("60d5ecb54f1a2c001f8e4e1a"))
+        expires_at = datetime(2026, 1, 8, tzinfo=timezone.utc)
+
+        session_id = await SessionRepository.create("user123", "token123", expires_at, {"user_agent": "pytest"})
+
+        assert session_id == "60d5ecb54f1a2c001f8e4e1a"
+        doc = mock_sessions.insert_one.call_args[0][0]
+        assert doc["token_hash"] == hash_token("token123")
+        assert "token123" not in doc.values()
+        assert doc["expires_at"] == expires_at
+        assert doc["device"] == {"user_agent": "pytest"}
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.session_repository.sessions", new_callable=mock_collection)
+    async def test_use_looks_up_by_hash_and_skips_expired(self, mock_sessions):
+        mock_sessions.find_one_and_update.return_value = {"user_id": "user123"}
+
+        result = await SessionRepository.use("token123")
+
+        assert result == {"user_id": "user123"}
+        query, update = mock_sessions.find_one_and_update.call_args[0]
+        assert query == {"token_hash": hash_token("token123"), "expires_at": {"$gt": ANY}}
+        assert "last_used_at" in update["$set"]
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.session_repository.sessions", new_callable=mock_collection)
+    async def test_revoke(self, mock_sessions):
+        mock_sessions.delete_one.return_value = MagicMock(deleted_count=1)
+
+        assert await SessionRepository.revoke("token123", "user123") is True
+        mock_sessions.delete_one.assert_called_once_with({"token_hash": hash_token("token123"), "user_id": "user123"})
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.session_repository.sessions", new_callable=mock_collection)
+    async def test_list_by_user_hides_hashes(self, mock_sessions):
+        session_id = ObjectId()
+        mock_sessions.find.return_value = mock_cursor([{"_id": session_id, "user_id": "user123"}])
+
+        result = await SessionRepository.list_by_user("user123")
+
+        assert result == [{"id": str(session_id), "user_id": "user123"}]
+        mock_sessions.find.assert_called_once_with({"user_id": "user123"}, {"token_hash": 0})
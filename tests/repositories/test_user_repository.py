@@ -1,68 +1,159 @@
+import pytest
 from unittest.mock import MagicMock, patch
 from bson import ObjectId
-from src.repositories.user_repository import UserRepository
+from tests.helpers import mock_collection, mock_cursor
+from src.core.cache import MemoryCacheBackend
+from pymongo.errors import DuplicateKeyError
+from src.repositories.user_repository import UserRepository, duplicate_field
 
 class TestUserRepository:
-    @patch("src.repositories.user_repository.users")
-    def test_get_by_email(self, mock_users):
+    @pytest.mark.asyncio
+    @patch("src.repositories.user_repository.users", new_callable=mock_collection)
+    async def test_get_by_email(self, mock_users):
         mock_users.find_one.return_value = {"email": "test@test.com", "username": "testuser"}
         
-        result = UserRepository.get_by_email("test@test.com")
+        result = await UserRepository.get_by_email(" Test@Test.com")
         
         assert result["email"] == "test@test.com"
-        mock_users.find_one.assert_called_once_with({"email": "test@test.com"})
+        mock_users.find_one.assert_called_once_with({"email_lower": "test@test.com"})
 
-    @patch("src.repositories.user_repository.users")
-    def test_get_by_id(self, mock_users):
+    @pytest.mark.asyncio
+    @patch("src.repositories.user_repository.users", new_callable=mock_collection)
+    async def test_get_by_email_falls_back_to_exact_email(self, mock_users):
+        # Usuário em conflito no backfill: sem email_lower, mas com o email original
+        mock_users.find_one.side_effect = [None, {"email": "Test@Test.com", "username": "testuser"}]
+
+        result = await UserRepository.get_by_email("Test@Test.com")
+
+        assert result["email"] == "Test@Test.com"
+        assert [c.args[0] for c in mock_users.find_one.call_args_list] == [
+            {"email_lower": "test@test.com"},
+            {"email": "Test@Test.com"}
+        ]
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.user_repository.users", new_callable=mock_collection)
+    async def test_get_by_id(self, mock_users):
         mock_id = ObjectId("60d5ecb54f1a2c001f8e4e1a")
         mock_users.find_one.return_value = {"_id": mock_id, "email": "test@test.com"}
         
-        result = UserRepository.get_by_id(str(mock_id))
+        result = await UserRepository.get_by_id(str(mock_id))
         
         assert result["email"] == "test@test.com"
-        mock_users.find_one.assert_called_once_with({"_id": mock_id})
+        mock_users.find_one.assert_called_once_with({"_id": mock_id}, {"refreshToken": 0})
 
-    @patch("src.repositories.user_repository.users")
-    def test_get_by_username(self, mock_users):
-        mock_users.find_one.return_value = {"username": "testuser", "email": "test@test.com"}
-        
-        result = UserRepository.get_by_username("testuser")
-        
-        assert result["username"] == "testuser"
-        mock_users.find_one.assert_called_once_with({"username": "testuser"})
+    @pytest.mark.asyncio
+    @patch("src.repositories.user_repository.users", new_callable=mock_collection)
+    async def test_take_legacy_refresh_token(self, mock_users):
+        mock_id = ObjectId("60d5ecb54f1a2c001f8e4e1a")
+        mock_users.update_one.return_value = MagicMock(modified_count=1)
+
+        assert await UserRepository.take_legacy_refresh_token(str(mock_id), "token123") is True
+        mock_users.update_one.assert_called_once_with(
+            {"_id": mock_id, "refreshToken": "token123"},
+            {"$pull": {"refreshToken": "token123"}}
+        )
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.user_repository.users", new_callable=mock_collection)
+    async def test_backfill_normalized_keys(self, mock_users):
+        first, second = ObjectId(), ObjectId()
+        mock_users.find.return_value = mock_cursor([
+            {"_id": first, "email": "Ana@X.com", "username": "Ana"},
+            {"_id": second, "email": "ana@x.com", "username": "ana2"}
+        ])
+        # O email do segundo já pertence ao primeiro
+        mock_users.update_one.side_effect = [None, None, DuplicateKeyError("dup"), None]
+
+        visited, conflicts = await UserRepository.backfill_normalized_keys()
 
-    @patch("src.repositories.user_repository.users")
-    def test_create_user(self, mock_users):
+        assert visited == 2
+        assert conflicts == [(str(second), "email_lower", "ana@x.com")]
+        mock_users.update_one.assert_any_call({"_id": first, "email_lower": {"$exists": False}}, {"$set": {"email_lower": "ana@x.com"}})
+        mock_users.update_one.assert_any_call({"_id": second, "username_lower": {"$exists": False}}, {"$set": {"username_lower": "ana2"}})
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.user_repository.users", new_callable=mock_collection)
+    async def test_create_user(self, mock_users):
         mock_users.insert_one.return_value = MagicMock(inserted_id=ObjectId("60d5ecb54f1a2c001f8e4e1a"))
         
-        user_data = {"email": "test@test.com", "senha": "hash"}
-        result = UserRepository.create(user_data)
+        user_data = {"email": "Test@Test.com", "senha": "hash", "username": "TestUser"}
+        result = await UserRepository.create(user_data)
         
         assert result == "60d5ecb54f1a2c001f8e4e1a"
-        mock_users.insert_one.assert_called_once_with(user_data)
+        mock_users.insert_one.assert_called_once_with({
+            **user_data,
+            "email_lower": "test@test.com",
+            "username_lower": "testuser"
+        })
+
+    def test_duplicate_field(self):
+        email_error = DuplicateKeyError("E11000", 11000, {"keyPattern": {"email_lower": 1}})
+        username_error = DuplicateKeyError("E11000 index: username_lower_unique dup key", 11000, {})
 
-    @patch("src.repositories.user_repository.users")
-    def test_update_refresh_tokens_push(self, mock_users):
+        assert duplicate_field(email_error) == "email"
+        assert duplicate_field(username_error) == "username"
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.user_repository.users", new_callable=mock_collection)
+    async def test_update_password_hash(self, mock_users):
         mock_id = ObjectId("60d5ecb54f1a2c001f8e4e1a")
         mock_users.update_one.return_value = MagicMock(modified_count=1)
-        
-        result = UserRepository.update_refresh_tokens(str(mock_id), "token123", push=True)
-        
+
+        result = await UserRepository.update_password_hash(str(mock_id), "new_hash")
+
         assert result is True
         mock_users.update_one.assert_called_once_with(
             {"_id": mock_id},
-            {"$push": {"refreshToken": "token123"}}
+            {"$set": {"senha": "new_hash"}}
         )
 
-    @patch("src.repositories.user_repository.users")
-    def test_update_refresh_tokens_pull(self, mock_users):
+    @pytest.mark.asyncio
+    @patch("src.repositories.user_repository.user_cache", new_callable=lambda: MemoryCacheBackend(10, 60))
+    @patch("src.repositories.user_repository.users", new_callable=mock_collection)
+    async def test_get_profile_uses_cache(self, mock_users, mock_cache):
         mock_id = ObjectId("60d5ecb54f1a2c001f8e4e1a")
+        mock_users.find_one.return_value = {"_id": mock_id, "email": "test@test.com"}
+
+        first = await UserRepository.get_profile(str(mock_id))
+        second = await UserRepository.get_profile(str(mock_id))
+
+        assert first == second == {"_id": mock_id, "email": "test@test.com"}
+        mock_users.find_one.assert_called_once_with({"_id": mock_id}, {"senha": 0, "refreshToken": 0})
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.user_repository.user_cache", new_callable=lambda: MemoryCacheBackend(10, 60))
+    @patch("src.repositories.user_repository.users", new_callable=mock_collection)
+    async def test_writes_invalidate_profile(self, mock_users, mock_cache):
+        mock_id = ObjectId("60d5ecb54f1a2c001f8e4e1a")
+        mock_users.find_one.return_value = {"_id": mock_id, "email": "test@test.com"}
         mock_users.update_one.return_value = MagicMock(modified_count=1)
-        
-        result = UserRepository.update_refresh_tokens(str(mock_id), "token123", push=False)
-        
-        assert result is True
-        mock_users.update_one.assert_called_once_with(
-            {"_id": mock_id},
-            {"$pull": {"refreshToken": "token123"}}
-        )
+
+        await UserRepository.get_profile(str(mock_id))
+        await UserRepository.update_password_hash(str(mock_id), "new_hash")
+        await UserRepository.get_profile(str(mock_id))
+
+        assert mock_users.find_one.call_count == 2
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.user_repository.users", new_callable=mock_collection)
+    async def test_get_many(self, mock_users):
+        id1 = ObjectId("60d5ecb54f1a2c001f8e4e1a")
+        id2 = ObjectId("60d5ecb54f1a2c001f8e4e1b")
+        mock_users.find.return_value = mock_cursor([
+            {"_id": id1, "username": "ana"},
+            {"_id": id2, "username": "bia"}
+        ])
+
+        result = await UserRepository.get_many([str(id1), str(id2), str(id1), "invalid"])
+
+        assert result == {str(id1): {"_id": id1, "username": "ana"}, str(id2): {"_id": id2, "username": "bia"}}
+        query, projection = mock_users.find.call_args[0]
+        assert sorted(query["_id"]["$in"]) == [id1, id2]
+        assert projection == {"email": 1, "username": 1}
+
+    @pytest.mark.asyncio
+    @patch("src.repositories.user_repository.users", new_callable=mock_collection)
+    async def test_get_many_empty(self, mock_users):
+        assert await UserRepository.get_many([]) == {}
+        mock_users.find.assert_not_called()
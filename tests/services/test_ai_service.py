@@ -215,3 +215,35 @@ class TestAIService:
         mock_chunk.choices[0].delta.content = None
         mock_chunk.choices[0].delta.reasoning = None
         assert service._process_chunk(mock_chunk) is None
+
+    @pytest.mark.asyncio
+    @patch("src.services.ai_service.AsyncOpenAI")
+    async def test_generate_summary_includes_previous_summary(self, mock_async_openai):
+        mock_client = AsyncMock()
+        mock_async_openai.return_value = mock_client
+
+        mock_completion = MagicMock()
+        mock_completion.choices = [MagicMock()]
+        mock_completion.choices[0].message.content = " Novo resumo "
+        mock_client.chat.completions.create.return_value = mock_completion
+
+        service = AIService()
+        summary = await service.generate_summary("Resumo antigo", "Usuário: Oi")
+
+        assert summary == "Novo resumo"
+        user_content = mock_client.chat.completions.create.call_args.kwargs["messages"][1]["content"]
+        assert user_content.startswith("Resumo anterior:\nResumo antigo")
+        assert user_content.endswith("Usuário: Oi")
+
+    @pytest.mark.asyncio
+    @patch("src.services.ai_service.AsyncOpenAI")
+    async def test_generate_summary_terminal_error(self, mock_async_openai):
+        mock_client = AsyncMock()
+        mock_async_openai.return_value = mock_client
+
+        mock_error = Exception("Fatal error")
+        mock_error.status_code = 400
+        mock_client.chat.completions.create.side_effect = mock_error
+
+        service = AIService()
+        assert await service.generate_summary(None, "Usuário: Oi") is None
@@ -0,0 +1,114 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+from src.services.analytics_buffer import ClickBuffer, write_clicks
+
+def make_buffer(writer=None, **kwargs):
+    options = {"max_size": 10, "batch_size": 3, "flush_interval": 0.05, "max_retries": 1}
+    options.update(kwargs)
+    return ClickBuffer(writer or AsyncMock(return_value=0), **options)
+
+class TestClickBuffer:
+    def test_offer_rejects_when_full(self):
+        buffer = make_buffer(max_size=2)
+
+        assert buffer.offer({"elementId": "a"}) is True
+        assert buffer.offer({"elementId": "b"}) is True
+        assert buffer.offer({"elementId": "c"}) is False
+        assert buffer.stats()["queued"] == 2
+        assert buffer.stats()["accepted"] == 2
+        assert buffer.stats()["dropped"] == 1
+
+    def test_offer_assigns_id(self):
+        buffer = make_buffer()
+        click = {"elementId": "a"}
+
+        buffer.offer(click)
+
+        assert "_id" in click
+
+    @pytest.mark.asyncio
+    async def test_flushes_in_batches(self):
+        writer = AsyncMock(return_value=0)
+        buffer = make_buffer(writer)
+        for i in range(7):
+            buffer.offer({"elementId": str(i)})
+
+        buffer.start()
+        await asyncio.sleep(0.1)
+        await buffer.stop()
+
+        sizes = [len(call.args[0]) for call in writer.call_args_list]
+        assert sizes == [3, 3, 1]
+        assert buffer.stats()["written"] == 7
+        assert buffer.stats()["batches"] == 3
+
+    @pytest.mark.asyncio
+    async def test_flushes_partial_batch_after_interval(self):
+        writer = AsyncMock(return_value=0)
+        buffer = make_buffer(writer)
+        buffer.start()
+
+        buffer.offer({"elementId": "a"})
+        await asyncio.sleep(0.15)
+
+        writer.assert_called_once()
+        await buffer.stop()
+
+    @pytest.mark.asyncio
+    async def test_stop_flushes_pending_clicks(self):
+        writer = AsyncMock(return_value=0)
+        buffer = make_buffer(writer)
+        for i in range(4):
+            buffer.offer({"elementId": str(i)})
+
+        await buffer.stop()
+
+        assert sum(len(call.args[0]) for call in writer.call_args_list) == 4
+        assert buffer.stats()["queued"] == 0
+
+    @pytest.mark.asyncio
+    async def test_retries_then_counts_failure(self):
+        writer = AsyncMock(side_effect=[Exception("down"), 1, Exception("down"), Exception("down")])
+        buffer = make_buffer(writer, batch_size=1)
+        buffer.offer({"elementId": "a"})
+        buffer.offer({"elementId": "b"})
+
+        await buffer.stop()
+
+        assert writer.call_count == 4
+        assert buffer.stats()["written"] == 1
+        assert buffer.stats()["failed"] == 1
+
+class TestWriteClicks:
+    @pytest.mark.asyncio
+    @patch("src.services.analytics_buffer.analytics_repository", new_callable=AsyncMock)
+    async def test_counts_pending_steps_of_the_batch(self, mock_repo):
+        clicks = [{"_id": 1}, {"_id": 2}]
+        mock_repo.counting_paused.return_value = False
+
+        await write_clicks(clicks)
+
+        mock_repo.save_clicks.assert_called_once_with(clicks)
+        mock_repo.count_clicks.assert_called_once_with([1, 2])
+
+    @pytest.mark.asyncio
+    @patch("src.services.analytics_buffer.analytics_repository", new_callable=AsyncMock)
+    async def test_retried_batch_finishes_counting(self, mock_repo):
+        # A inserção passou na tentativa anterior e a contagem falhou: o reenvio conta o que ficou pendente
+        mock_repo.save_clicks.return_value = []
+        mock_repo.counting_paused.return_value = False
+
+        await write_clicks([{"_id": 1}])
+
+        mock_repo.count_clicks.assert_called_once_with([1])
+
+    @pytest.mark.asyncio
+    @patch("src.services.analytics_buffer.analytics_repository", new_callable=AsyncMock)
+    async def test_paused_counting_only_saves(self, mock_repo):
+        mock_repo.counting_paused.return_value = True
+
+        await write_clicks([{"_id": 1}])
+
+        mock_repo.save_clicks.assert_called_once()
+        mock_repo.count_clicks.assert_not_called()
@@ -1,47 +1,61 @@
-from unittest.mock import patch
+import pytest
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, patch
+from pymongo.errors import DuplicateKeyError
 from src.services.auth_service import AuthService
 
 class TestAuthService:
-    @patch("src.services.auth_service.user_repository")
-    @patch("src.services.auth_service.get_password_hash")
-    def test_register_user_success(self, mock_get_password_hash, mock_user_repo):
-        mock_user_repo.get_by_email.return_value = None
-        mock_user_repo.get_by_username.return_value = None
+    @pytest.mark.asyncio
+    @patch("src.services.auth_service.user_repository", new_callable=AsyncMock)
+    @patch("src.services.auth_service.get_password_hash_async", new_callable=AsyncMock)
+    async def test_register_user_success(self, mock_get_password_hash, mock_user_repo):
         mock_get_password_hash.return_value = "hashed_password"
         mock_user_repo.create.return_value = "user_id_123"
 
-        result = AuthService.register_user("test@test.com", "password123", "testuser")
+        result = await AuthService.register_user("test@test.com", "password123", "testuser")
 
         assert result["success"] is True
         assert result["user_id"] == "user_id_123"
-        mock_user_repo.create.assert_called_once()
+        mock_user_repo.create.assert_called_once_with({
+            "email": "test@test.com",
+            "senha": "hashed_password",
+            "username": "testuser"
+        })
+        mock_user_repo.get_by_email.assert_not_called()
 
-    @patch("src.services.auth_service.user_repository")
-    def test_register_user_email_exists(self, mock_user_repo):
-        mock_user_repo.get_by_email.return_value = {"email": "test@test.com"}
+    @pytest.mark.asyncio
+    @patch("src.services.auth_service.user_repository", new_callable=AsyncMock)
+    @patch("src.services.auth_service.get_password_hash_async", new_callable=AsyncMock)
+    async def test_register_user_email_exists(self, mock_get_password_hash, mock_user_repo):
+        mock_user_repo.create.side_effect = DuplicateKeyError(
+            "E11000 duplicate key error", 11000, {"keyPattern": {"email_lower": 1}}
+        )
 
-        result = AuthService.register_user("test@test.com", "password123", "testuser")
+        result = await AuthService.register_user("test@test.com", "password123", "testuser")
 
         assert result["success"] is False
         assert result["message"] == "Email already exists."
-        mock_user_repo.create.assert_not_called()
 
-    @patch("src.services.auth_service.user_repository")
-    def test_register_user_username_exists(self, mock_user_repo):
-        mock_user_repo.get_by_email.return_value = None
-        mock_user_repo.get_by_username.return_value = {"username": "testuser"}
+    @pytest.mark.asyncio
+    @patch("src.services.auth_service.user_repository", new_callable=AsyncMock)
+    @patch("src.services.auth_service.get_password_hash_async", new_callable=AsyncMock)
+    async def test_register_user_username_exists(self, mock_get_password_hash, mock_user_repo):
+        mock_user_repo.create.side_effect = DuplicateKeyError(
+            "E11000 duplicate key error", 11000, {"keyPattern": {"username_lower": 1}}
+        )
 
-        result = AuthService.register_user("test@test.com", "password123", "testuser")
+        result = await AuthService.register_user("test@test.com", "password123", "testuser")
 
         assert result["success"] is False
         assert result["message"] == "Username already exists."
-        mock_user_repo.create.assert_not_called()
 
-    @patch("src.services.auth_service.user_repository")
-    @patch("src.services.auth_service.verify_password")
+    @pytest.mark.asyncio
+    @patch("src.services.auth_service.session_repository", new_callable=AsyncMock)
+    @patch("src.services.auth_service.user_repository", new_callable=AsyncMock)
+    @patch("src.services.auth_service.verify_password_async", new_callable=AsyncMock)
     @patch("src.services.auth_service.create_access_token")
     @patch("src.services.auth_service.create_refresh_token")
-    def test_login_success(self, mock_create_refresh, mock_create_access, mock_verify_password, mock_user_repo):
+    async def test_login_success(self, mock_create_refresh, mock_create_access, mock_verify_password, mock_user_repo, mock_session_repo):
         mock_user_repo.get_by_email.return_value = {
             "_id": "60d5ecb54f1a2c001f8e4e1a",
             "email": "test@test.com",
@@ -52,77 +66,188 @@ class TestAuthService:
         mock_create_access.return_value = "access_token_123"
         mock_create_refresh.return_value = "refresh_token_123"
 
-        result = AuthService.login("test@test.com", "password123")
+        result = await AuthService.login("test@test.com", "password123")
 
         assert result["token"] == "access_token_123"
         assert result["refresh_token"] == "refresh_token_123"
-        mock_user_repo.update_refresh_tokens.assert_called_once()
-
-    @patch("src.services.auth_service.user_repository")
-    @patch("src.services.auth_service.verify_password")
-    def test_login_invalid_password(self, mock_verify_password, mock_user_repo):
+        mock_session_repo.create.assert_called_once()
+        assert mock_session_repo.create.call_args[0][:2] == ("60d5ecb54f1a2c001f8e4e1a", "refresh_token_123")
+
+    @pytest.mark.asyncio
+    @patch("src.services.auth_service.session_repository", new_callable=AsyncMock)
+    @patch("src.services.auth_service.user_repository", new_callable=AsyncMock)
+    @patch("src.services.auth_service.verify_password_async", new_callable=AsyncMock)
+    async def test_login_invalid_password(self, mock_verify_password, mock_user_repo, mock_session_repo):
         mock_user_repo.get_by_email.return_value = {
             "email": "test@test.com",
             "senha": "hashed_password"
         }
         mock_verify_password.return_value = False
 
-        result = AuthService.login("test@test.com", "wrong_password")
+        result = await AuthService.login("test@test.com", "wrong_password")
 
         assert result["token"] is None
         assert result["refresh_token"] is None
-        mock_user_repo.update_refresh_tokens.assert_not_called()
+        mock_session_repo.create.assert_not_called()
 
-    @patch("src.services.auth_service.user_repository")
-    def test_logout(self, mock_user_repo):
-        mock_user_repo.update_refresh_tokens.return_value = True
+    @pytest.mark.asyncio
+    @patch("src.services.auth_service.session_repository", new_callable=AsyncMock)
+    @patch("src.services.auth_service.user_repository", new_callable=AsyncMock)
+    async def test_logout(self, mock_user_repo, mock_session_repo):
+        mock_session_repo.revoke.return_value = True
         
-        result = AuthService.logout("user123", "token123")
+        result = await AuthService.logout("user123", "token123")
         
         assert result is True
-        mock_user_repo.update_refresh_tokens.assert_called_once_with("user123", "token123", push=False)
-
-    @patch("src.services.auth_service.user_repository")
+        mock_session_repo.revoke.assert_called_once_with("token123", "user123")
+        mock_user_repo.take_legacy_refresh_token.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch("src.services.auth_service.session_repository", new_callable=AsyncMock)
+    @patch("src.services.auth_service.user_repository", new_callable=AsyncMock)
+    async def test_logout_legacy_token(self, mock_user_repo, mock_session_repo):
+        mock_session_repo.revoke.return_value = False
+        mock_user_repo.take_legacy_refresh_token.return_value = True
+
+        assert await AuthService.logout("60d5ecb54f1a2c001f8e4e1a", "token123") is True
+        mock_user_repo.take_legacy_refresh_token.assert_called_once_with("60d5ecb54f1a2c001f8e4e1a", "token123")
+
+    @pytest.mark.asyncio
+    @patch("src.services.auth_service.session_repository", new_callable=AsyncMock)
+    @patch("src.services.auth_service.user_repository", new_callable=AsyncMock)
     @patch("src.services.auth_service.decode_token")
     @patch("src.services.auth_service.create_access_token")
-    def test_refresh_access_token_success(self, mock_create_access, mock_decode, mock_user_repo):
+    async def test_refresh_access_token_success(self, mock_create_access, mock_decode, mock_user_repo, mock_session_repo):
         mock_decode.return_value = {"user_id": "user123"}
+        mock_session_repo.use.return_value = {"user_id": "user123"}
         mock_user_repo.get_by_id.return_value = {
             "username": "testuser",
-            "email": "test@test.com",
-            "refreshToken": ["token123"]
+            "email": "test@test.com"
         }
         mock_create_access.return_value = "new_access_token"
         
-        result = AuthService.refresh_access_token("token123")
+        result = await AuthService.refresh_access_token("token123")
         
         assert result == "new_access_token"
         mock_create_access.assert_called_once_with("user123", "testuser", "test@test.com")
 
+    @pytest.mark.asyncio
     @patch("src.services.auth_service.decode_token")
-    def test_refresh_access_token_invalid_payload(self, mock_decode):
+    async def test_refresh_access_token_invalid_payload(self, mock_decode):
         mock_decode.return_value = None
         
-        result = AuthService.refresh_access_token("invalid_token")
+        result = await AuthService.refresh_access_token("invalid_token")
         
         assert result is None
 
-    @patch("src.services.auth_service.user_repository")
+    @pytest.mark.asyncio
+    @patch("src.services.auth_service.session_repository", new_callable=AsyncMock)
+    @patch("src.services.auth_service.user_repository", new_callable=AsyncMock)
     @patch("src.services.auth_service.decode_token")
-    def test_refresh_access_token_token_not_in_db(self, mock_decode, mock_user_repo):
-        mock_decode.return_value = {"user_id": "user123"}
-        mock_user_repo.get_by_id.return_value = {
-            "refreshToken": ["other_token"]
-        }
+    async def test_refresh_access_token_token_not_in_db(self, mock_decode, mock_user_repo, mock_session_repo):
+        mock_decode.return_value = {"user_id": "60d5ecb54f1a2c001f8e4e1a", "exp": 4102444800}
+        mock_session_repo.use.return_value = None
+        mock_user_repo.take_legacy_refresh_token.return_value = False
         
-        result = AuthService.refresh_access_token("token123")
+        result = await AuthService.refresh_access_token("token123")
         
         assert result is None
+        mock_user_repo.take_legacy_refresh_token.assert_called_once_with("60d5ecb54f1a2c001f8e4e1a", "token123")
+        mock_session_repo.create.assert_not_called()
+        mock_user_repo.get_by_id.assert_not_called()
 
+    @pytest.mark.asyncio
+    @patch("src.services.auth_service.session_repository", new_callable=AsyncMock)
+    @patch("src.services.auth_service.user_repository", new_callable=AsyncMock)
     @patch("src.services.auth_service.decode_token")
+    @patch("src.services.auth_service.create_access_token")
+    async def test_refresh_access_token_migrates_legacy_token(self, mock_create_access, mock_decode, mock_user_repo, mock_session_repo):
+        user_id = "60d5ecb54f1a2c001f8e4e1a"
+        mock_decode.return_value = {"user_id": user_id, "exp": 4102444800}
+        # Primeiro uso: ainda no array legado; depois da migração a sessão existe
+        mock_session_repo.use.side_effect = [None, {"user_id": user_id}]
+        mock_user_repo.take_legacy_refresh_token.return_value = True
+        mock_user_repo.get_by_id.return_value = {"username": "testuser", "email": "test@test.com"}
+        mock_create_access.return_value = "new_access_token"
+
+        assert await AuthService.refresh_access_token("token123") == "new_access_token"
+
+        user, token, expires_at, device = mock_session_repo.create.call_args.args
+        assert (user, token, device) == (user_id, "token123", {"migrated": True})
+        assert expires_at == datetime.fromtimestamp(4102444800, timezone.utc)
+
+    @pytest.mark.asyncio
+    @patch("src.services.auth_service.session_repository", new_callable=AsyncMock)
+    @patch("src.services.auth_service.user_repository", new_callable=AsyncMock)
+    @patch("src.services.auth_service.decode_token")
+    @patch("src.services.auth_service.create_access_token")
+    async def test_refresh_access_token_legacy_already_migrated(self, mock_create_access, mock_decode, mock_user_repo, mock_session_repo):
+        user_id = "60d5ecb54f1a2c001f8e4e1a"
+        mock_decode.return_value = {"user_id": user_id, "exp": 4102444800}
+        mock_session_repo.use.side_effect = [None, {"user_id": user_id}]
+        mock_user_repo.take_legacy_refresh_token.return_value = True
+        mock_session_repo.create.side_effect = DuplicateKeyError("dup")
+        mock_user_repo.get_by_id.return_value = {"username": "testuser", "email": "test@test.com"}
+        mock_create_access.return_value = "new_access_token"
+
+        assert await AuthService.refresh_access_token("token123") == "new_access_token"
+
+    @pytest.mark.asyncio
+    @patch("src.services.auth_service.session_repository", new_callable=AsyncMock)
+    @patch("src.services.auth_service.user_repository", new_callable=AsyncMock)
+    @patch("src.services.auth_service.decode_token")
+    async def test_refresh_access_token_session_of_other_user(self, mock_decode, mock_user_repo, mock_session_repo):
+        mock_decode.return_value = {"user_id": "user123"}
+        mock_session_repo.use.return_value = {"user_id": "someone_else"}
+        
+        assert await AuthService.refresh_access_token("token123") is None
+
+    @patch("src.services.auth_service.decode_token_cached")
     def test_validate_jwt(self, mock_decode):
         mock_decode.return_value = {"user_id": "user123"}
         assert AuthService.validate_jwt("token123") == "user123"
         
         mock_decode.return_value = None
         assert AuthService.validate_jwt("invalid") is None
+
+    @pytest.mark.asyncio
+    @patch("src.services.auth_service.session_repository", new_callable=AsyncMock)
+    @patch("src.services.auth_service.user_repository", new_callable=AsyncMock)
+    @patch("src.services.auth_service.verify_password_async", new_callable=AsyncMock)
+    @patch("src.services.auth_service.password_needs_rehash")
+    @patch("src.services.auth_service.get_password_hash_async", new_callable=AsyncMock)
+    async def test_login_rehashes_stale_hash(self, mock_hash, mock_needs_rehash, mock_verify_password, mock_user_repo, mock_session_repo):
+        mock_user_repo.get_by_email.return_value = {
+            "_id": "60d5ecb54f1a2c001f8e4e1a",
+            "email": "test@test.com",
+            "senha": "old_hash",
+            "username": "testuser"
+        }
+        mock_verify_password.return_value = True
+        mock_needs_rehash.return_value = True
+        mock_hash.return_value = "new_hash"
+
+        result = await AuthService.login("test@test.com", "password123")
+
+        assert result["token"] is not None
+        mock_hash.assert_called_once_with("password123")
+        mock_user_repo.update_password_hash.assert_called_once_with("60d5ecb54f1a2c001f8e4e1a", "new_hash")
+
+    @pytest.mark.asyncio
+    @patch("src.services.auth_service.session_repository", new_callable=AsyncMock)
+    @patch("src.services.auth_service.user_repository", new_callable=AsyncMock)
+    @patch("src.services.auth_service.verify_password_async", new_callable=AsyncMock)
+    @patch("src.services.auth_service.password_needs_rehash")
+    async def test_login_keeps_current_hash(self, mock_needs_rehash, mock_verify_password, mock_user_repo, mock_session_repo):
+        mock_user_repo.get_by_email.return_value = {
+            "_id": "60d5ecb54f1a2c001f8e4e1a",
+            "email": "test@test.com",
+            "senha": "current_hash",
+            "username": "testuser"
+        }
+        mock_verify_password.return_value = True
+        mock_needs_rehash.return_value = False
+
+        await AuthService.login("test@test.com", "password123")
+
+        mock_user_repo.update_password_hash.assert_not_called()
@@ -0,0 +1,76 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+from src.models.permissions import ADMIN_PERMISSIONS, OWNER_PERMISSIONS, ProjectPermission
+from src.services.authorization_service import AuthorizationService
+
+PROJECT_ID = "60d5ecb54f1a2c001f8e4e1a"
+
+def make_project(version=1):
+    return {
+        "id": PROJECT_ID,
+        "user_id": "owner",
+        "acl_version": version,
+        "members": [
+            {"user_id": "admin", "role": "admin", "permissions": {}},
+            {"user_id": "member", "role": "member", "permissions": {"read": True, "send_messages": False}}
+        ]
+    }
+
+class TestProjectPermission:
+    def test_member_gets_view_plus_granted_flags(self):
+        granted = ProjectPermission.for_member({"role": "member", "permissions": {"read": True, "image": False}})
+        assert granted == ProjectPermission.VIEW | ProjectPermission.READ
+
+    def test_admin_cannot_manage_admins(self):
+        granted = ProjectPermission.for_member({"role": "admin"})
+        assert ProjectPermission.MANAGE_MEMBERS in granted
+        assert ProjectPermission.MANAGE_ADMINS not in granted
+
+class TestAuthorizationService:
+    def test_compile_acl(self):
+        acl = AuthorizationService.compile_acl(make_project())
+        assert acl["owner"] == OWNER_PERMISSIONS
+        assert acl["admin"] == ADMIN_PERMISSIONS
+        assert acl["member"] == ProjectPermission.VIEW | ProjectPermission.READ
+
+    @pytest.mark.asyncio
+    @patch("src.services.authorization_service.project_repository", new_callable=AsyncMock)
+    async def test_cached_acl_only_reads_version(self, mock_repo):
+        mock_repo.get_acl_version.return_value = 1
+        mock_repo.get_by_id.return_value = make_project()
+
+        assert await AuthorizationService.authorize(PROJECT_ID, "member", ProjectPermission.READ)
+        assert not await AuthorizationService.authorize(PROJECT_ID, "member", ProjectPermission.SEND_MESSAGES)
+
+        mock_repo.get_by_id.assert_called_once_with(PROJECT_ID)
+        assert mock_repo.get_acl_version.call_count == 2
+
+    @pytest.mark.asyncio
+    @patch("src.services.authorization_service.project_repository", new_callable=AsyncMock)
+    async def test_new_version_recompiles(self, mock_repo):
+        mock_repo.get_acl_version.return_value = 1
+        mock_repo.get_by_id.return_value = make_project()
+        assert await AuthorizationService.permissions(PROJECT_ID, "outsider") == ProjectPermission(0)
+
+        project = make_project(version=2)
+        project["members"].append({"user_id": "outsider", "role": "admin"})
+        mock_repo.get_acl_version.return_value = 2
+        mock_repo.get_by_id.return_value = project
+
+        assert await AuthorizationService.permissions(PROJECT_ID, "outsider") == ADMIN_PERMISSIONS
+        assert mock_repo.get_by_id.call_count == 2
+
+    @pytest.mark.asyncio
+    @patch("src.services.authorization_service.project_repository", new_callable=AsyncMock)
+    async def test_loaded_project_skips_reads(self, mock_repo):
+        assert await AuthorizationService.authorize(PROJECT_ID, "owner", ProjectPermission.DELETE_PROJECT, make_project())
+        mock_repo.get_acl_version.assert_not_called()
+        mock_repo.get_by_id.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch("src.services.authorization_service.project_repository", new_callable=AsyncMock)
+    async def test_missing_project(self, mock_repo):
+        mock_repo.get_acl_version.return_value = None
+
+        assert await AuthorizationService.permissions(PROJECT_ID, "owner") is None
+        assert not await AuthorizationService.authorize(PROJECT_ID, "owner", ProjectPermission.VIEW)
@@ -0,0 +1,105 @@
+from unittest.mock import patch
+from src.services.context_service import ContextService, count_tokens, truncate_tokens
+from src.models.ai import AIModel
+
+def make_history(count: int, words: int = 30) -> list:
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"m{i} " + "palavra " * words}
+        for i in range(count)
+    ]
+
+class TestContextService:
+    def test_count_tokens(self):
+        assert count_tokens("") == 0
+        assert count_tokens("Olá, mundo!") == 6
+        assert count_tokens("a " * 300) == 400
+
+    def test_truncate_tokens_keeps_tail(self):
+        text = "início " + "meio " * 100 + "conclusão"
+        truncated = truncate_tokens(text, 8)
+
+        assert truncated.endswith("conclusão")
+        assert not truncated.startswith("início")
+        assert count_tokens(truncated) <= 8
+        assert truncate_tokens("curto", 8) == "curto"
+
+    @patch("src.services.context_service.settings")
+    def test_budget_uses_model_window(self, mock_settings):
+        mock_settings.CONTEXT_MAX_TOKENS = 1_000_000
+        mock_settings.CONTEXT_RESPONSE_RESERVE_TOKENS = 8192
+        service = ContextService()
+
+        assert service.budget(AIModel.GEMMA_4) == 131072 - 8192
+
+        mock_settings.CONTEXT_MAX_TOKENS = 32000
+        assert service.budget(AIModel.GEMMA_4) == 32000
+
+    @patch("src.services.context_service.settings")
+    def test_strips_reasoning(self, mock_settings):
+        mock_settings.CONTEXT_REASONING_TOKENS = 0
+        service = ContextService()
+
+        prepared = service.prepare_message(
+            {"role": "assistant", "content": "oi", "reasoning": "pensando", "seq": 3}
+        )
+
+        assert prepared == {"role": "assistant", "content": "oi"}
+
+    @patch("src.services.context_service.settings")
+    def test_sliding_window(self, mock_settings):
+        mock_settings.CONTEXT_MAX_TOKENS = 250
+        mock_settings.CONTEXT_RESPONSE_RESERVE_TOKENS = 0
+        mock_settings.CONTEXT_REASONING_TOKENS = 0
+        mock_settings.CONTEXT_STRATEGY = "sliding_window"
+        history = make_history(10)
+
+        context = ContextService().build(history, AIModel.GEMINI_3_FLASH)
+
+        # Cada mensagem custa 46 tokens: cabem as 5 mais recentes
+        assert [m["content"].split()[0] for m in context] == ["m5", "m6", "m7", "m8", "m9"]
+
+    @patch("src.services.context_service.settings")
+    def test_keep_first_last(self, mock_settings):
+        mock_settings.CONTEXT_MAX_TOKENS = 250
+        mock_settings.CONTEXT_RESPONSE_RESERVE_TOKENS = 0
+        mock_settings.CONTEXT_REASONING_TOKENS = 0
+        mock_settings.CONTEXT_STRATEGY = "keep_first_last"
+        mock_settings.CONTEXT_KEEP_FIRST = 2
+        history = make_history(10)
+
+        context = ContextService().build(history, AIModel.GEMINI_3_FLASH)
+
+        assert [m["content"].split()[0] for m in context] == ["m0", "m1", "m7", "m8", "m9"]
+
+    @patch("src.services.context_service.settings")
+    def test_latest_message_always_included(self, mock_settings):
+        mock_settings.CONTEXT_MAX_TOKENS = 10
+        mock_settings.CONTEXT_RESPONSE_RESERVE_TOKENS = 0
+        mock_settings.CONTEXT_REASONING_TOKENS = 0
+        mock_settings.CONTEXT_STRATEGY = "sliding_window"
+        history = make_history(3)
+
+        context = ContextService().build(history, AIModel.GEMINI_3_FLASH)
+
+        assert context == [{"role": "user", "content": history[-1]["content"]}]
+
+    @patch("src.services.context_service.settings")
+    def test_summary_is_prepended(self, mock_settings):
+        mock_settings.CONTEXT_MAX_TOKENS = 32000
+        mock_settings.CONTEXT_RESPONSE_RESERVE_TOKENS = 0
+        mock_settings.CONTEXT_REASONING_TOKENS = 0
+        mock_settings.CONTEXT_STRATEGY = "sliding_window"
+        history = make_history(2)
+
+        context = ContextService().build(history, AIModel.GEMINI_3_FLASH, summary="O herói fugiu.")
+
+        assert context[0] == {"role": "system", "content": "Resumo da conversa até aqui:\nO herói fugiu."}
+        assert len(context) == 3
+
+    def test_format_transcript(self):
+        transcript = ContextService().format_transcript([
+            {"role": "user", "content": "Oi"},
+            {"role": "assistant", "content": "Olá", "reasoning": "..."}
+        ])
+
+        assert transcript == "Usuário: Oi\n\nAssistente: Olá"